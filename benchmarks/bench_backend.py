@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Bench phía Triage Backend trên collection do `bench_consumer.py populate` tạo (cùng --points/--seed/--qdrant):
+
+    python benchmarks/bench_backend.py search --points 1000000 --qdrant http://localhost:6333
+    python benchmarks/bench_backend.py triage --points 20000 --qdrant benchmarks/results/qdrant
+
+`triage` tự chạy fake LLM (app.fake_llm) ở process con, tắt triage cache để mỗi request đều gọi LLM.
+Mỗi lệnh in 1 dòng JSON kết quả ra stdout.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any
+
+from common import ROOT, emit, expect, make_client, percentiles, qdrant_mode, search_collection, set_env, use_service
+
+use_service("triage_app/backend")
+
+_WINDOW_MS = 5 * 60_000
+# Đoạn mô tả lỗi kiểu người dùng dán vào (khớp errorMessage của synth.py)
+_TEXT_QUERIES = ("callback 504", "partner timeout", "connection reset by peer")
+
+
+async def _queries(client, collection: str, n: int, seed: int) -> tuple[list[str], list[tuple[str, int]]]:
+    """
+    order_no và (merchant_id, đầu cửa sổ 5 phút) lấy từ log có thật trong collection (point id là hash nên
+    thứ tự scroll coi như ngẫu nhiên), để query nào cũng có kết quả.
+    """
+    points, _ = await client.scroll(
+        collection_name=collection, limit=n * 4, with_payload=["order_no", "merchant_id", "timestamp"], with_vectors=False
+    )
+    rnd = random.Random(seed)
+    orders = list(dict.fromkeys(p.payload["order_no"] for p in points if p.payload.get("order_no")))[:n]
+    merchants = [
+        (p.payload["merchant_id"], int(p.payload["timestamp"]) - rnd.randrange(_WINDOW_MS))
+        for p in rnd.sample(points, min(n, len(points)))
+    ]
+    return orders, merchants
+
+
+def _bind(args: argparse.Namespace) -> None:
+    set_env(qdrant_collection=search_collection(args.points, args.seed))
+    from app import vector_client
+
+    vector_client._client = make_client(args.qdrant)
+
+
+async def _timed(samples: list[float], coro) -> Any:
+    started = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+async def bench_search(args: argparse.Namespace) -> dict[str, Any]:
+    _bind(args)
+    from app.vector_client import close_client, expand_related_logs, get_client, search_logs, search_text
+
+    collection = search_collection(args.points, args.seed)
+    count = (await get_client().count(collection, exact=False)).count
+    orders, merchants = await _queries(get_client(), collection, args.queries, args.seed)
+    for o in orders[:5]:  # warmup
+        await search_logs(order_no=o)
+    by_order: list[float] = []
+    by_merchant: list[float] = []
+    expand: list[float] = []
+    by_text: list[float] = []
+    started = time.perf_counter()
+    for o in orders:
+        hits = await _timed(by_order, search_logs(order_no=o))
+        expect(bool(hits) and all(h["order_no"] == o for h in hits), f"search order_no={o}")
+    for m, from_ts in merchants:
+        hits = await _timed(by_merchant, search_logs(merchant_id=m, from_ts=from_ts, to_ts=from_ts + _WINDOW_MS))
+        expect(
+            bool(hits) and all(h["merchant_id"] == m and from_ts <= h["timestamp"] <= from_ts + _WINDOW_MS for h in hits),
+            f"search merchant_id={m} from_ts={from_ts}",
+        )
+    for o in orders[: max(1, len(orders) // 4)]:
+        logs, *_ = await _timed(expand, expand_related_logs({"order_no": o}))
+        expect(any(h["order_no"] == o for h in logs), f"expand order_no={o}")
+    for i, (m, from_ts) in enumerate(merchants[: max(1, len(merchants) // 4)]):
+        # Cửa sổ 1 giờ quanh log có thật, xếp hạng top 50
+        hits = await _timed(
+            by_text, search_text(_TEXT_QUERIES[i % len(_TEXT_QUERIES)], from_ts=from_ts - 3_600_000, to_ts=from_ts, limit=50)
+        )
+        expect(
+            len(hits) <= 50 and all(from_ts - 3_600_000 <= h["timestamp"] <= from_ts for h in hits),
+            f"search_text from_ts={from_ts}",
+        )
+    elapsed = time.perf_counter() - started
+    await close_client()
+    return {
+        "bench": "search",
+        "qdrant": qdrant_mode(args.qdrant),
+        "points": count,
+        "queries": len(by_order) + len(by_merchant) + len(expand) + len(by_text),
+        "qps": round((len(by_order) + len(by_merchant) + len(expand) + len(by_text)) / elapsed, 1),
+        "by_order_no": percentiles(by_order),
+        "by_merchant_window": percentiles(by_merchant),
+        "expand_trace": percentiles(expand),
+        "by_text": percentiles(by_text),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_fake_llm(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "app.fake_llm", "--port", str(port),
+            "--first-token-ms", str(args.first_token_ms), "--token-ms", str(args.token_ms),
+        ],
+        cwd=ROOT / "triage_app" / "backend",
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Fake LLM không khởi động được")
+
+
+async def bench_triage(args: argparse.Namespace) -> dict[str, Any]:
+    proc, base_url = _start_fake_llm(args)
+    try:
+        # Đo đường gọi LLM: tắt cache và incident memory (đơn synthetic có signature gần giống nhau)
+        set_env(openai_api_key="fake", openai_base_url=base_url, triage_cache_ttl_s=0, incident_memory_enabled=False)
+        _bind(args)
+        import httpx
+
+        from app import main
+        from app.schemas import TriageRequest
+        from app.vector_client import close_client, get_client
+
+        orders, _ = await _queries(get_client(), search_collection(args.points, args.seed), args.triage_requests, args.seed)
+        blocking: list[float] = []
+        first_token: list[float] = []
+        streamed: list[float] = []
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            await client.post("/triage", json={"order_no": orders[0]})  # warmup (kết nối LLM, embedder)
+            for o in orders:
+                resp = await _timed(blocking, client.post("/triage", json={"order_no": o}))
+                resp.raise_for_status()
+                body = resp.json()
+                expect(body["logs_found"] > 0 and body["triage"] is not None, f"triage order_no={o}: {body.get('raw_llm')}")
+        # Stream: đo trực tiếp generator SSE của /triage/stream (ASGITransport đợi hết body mới trả)
+        for o in orders:
+            started = time.perf_counter()
+            got_token = False
+            async for event in main._triage_events(TriageRequest(order_no=o)):
+                if not got_token and event.startswith(b"event: token"):
+                    first_token.append(time.perf_counter() - started)
+                    got_token = True
+            expect(got_token, f"/triage/stream order_no={o} không có token")
+            streamed.append(time.perf_counter() - started)
+        await close_client()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {
+        "bench": "triage",
+        "qdrant": qdrant_mode(args.qdrant),
+        "requests": len(orders),
+        "fake_llm": {"first_token_ms": args.first_token_ms, "token_ms": args.token_ms},
+        "triage": percentiles(blocking),
+        "stream_first_token": percentiles(first_token),
+        "stream_total": percentiles(streamed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bench Triage Backend: search, triage (fake LLM).")
+    parser.add_argument("command", choices=["search", "triage"])
+    parser.add_argument("--points", type=int, default=20_000, help="Phải khớp lệnh populate")
+    parser.add_argument("--seed", type=int, default=1, help="Phải khớp lệnh populate")
+    parser.add_argument("--queries", type=int, default=200, help="Số query mỗi loại (search)")
+    parser.add_argument("--triage-requests", type=int, default=30)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    parser.add_argument("--qdrant", default=str(ROOT / "benchmarks" / "results" / "qdrant"))
+    args = parser.parse_args()
+    emit(asyncio.run(bench_search(args) if args.command == "search" else bench_triage(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Bench phía Log Consumer (chạy riêng process vì package `app` trùng tên với Triage Backend):
+
+    python benchmarks/bench_consumer.py normalize --logs 50000
+    python benchmarks/bench_consumer.py ingest --logs 20000 --qdrant :memory: --batch-size 500
+    python benchmarks/bench_consumer.py populate --points 1000000 --qdrant http://localhost:6333
+
+Mỗi lệnh in 1 dòng JSON kết quả ra stdout.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any
+
+from common import ROOT, emit, expect, make_client, percentiles, qdrant_mode, search_collection, set_env, use_service
+from synth import synth_logs
+
+use_service("log_consumer")
+
+
+def _encoded(args: argparse.Namespace, n: int) -> list[bytes]:
+    return [
+        json.dumps(log, ensure_ascii=False).encode("utf-8")
+        for log in synth_logs(n, args.merchants, args.orders, args.error_rate, args.seed)
+    ]
+
+
+def bench_normalize(args: argparse.Namespace) -> dict[str, Any]:
+    from app.normalizer import normalize_bytes, normalize_log, normalize_many
+
+    bodies = _encoded(args, args.logs)
+    dicts = [json.loads(b) for b in bodies]
+    total_mb = sum(len(b) for b in bodies) / 1e6
+    result: dict[str, Any] = {"bench": "normalize", "logs": len(bodies), "avg_log_bytes": round(total_mb * 1e6 / len(bodies))}
+
+    def run(name: str, fn) -> None:
+        fn(bodies[:100], dicts[:100])  # warmup
+        started = time.perf_counter()
+        fn(bodies, dicts)
+        elapsed = time.perf_counter() - started
+        result[name] = {"logs_per_s": round(len(bodies) / elapsed), "mb_per_s": round(total_mb / elapsed, 2)}
+
+    run("normalize_log", lambda _, ds: [normalize_log(d) for d in ds])
+    run("normalize_bytes", lambda bs, _: [normalize_bytes(b) for b in bs])
+    run(
+        "normalize_many",
+        lambda bs, _: [normalize_many(bs[i : i + args.batch_size]) for i in range(0, len(bs), args.batch_size)],
+    )
+    # Các đường chuẩn hóa phải cho cùng kết quả (payload khác nhau: normalize_log serialize lại dict)
+    expected = [normalize_log(d).model_copy(update={"payload": b.decode("utf-8")}) for b, d in zip(bodies, dicts)]
+    expect([normalize_bytes(b) for b in bodies] == expected, "normalize_bytes khác normalize_log")
+    expect(normalize_many(bodies) == expected, "normalize_many khác normalize_log")
+    return result
+
+
+def _stage_totals() -> dict[str, float]:
+    """Tổng thời gian (s) theo stage từ histogram metrics của consumer."""
+    from app import metrics
+
+    totals: dict[str, float] = {}
+    for family in (metrics.STAGE_SECONDS, metrics.QDRANT_SECONDS):
+        for metric in family.collect():
+            for sample in metric.samples:
+                if sample.name.endswith("_sum") and sample.value:
+                    label = sample.labels.get("stage") or f"qdrant_{sample.labels.get('op')}"
+                    totals[label] = round(sample.value, 3)
+    return totals
+
+
+async def bench_ingest(args: argparse.Namespace) -> dict[str, Any]:
+    """normalize_many + store_logs (dedup → embed → upsert → rollup/detector) theo batch, như đường RabbitMQ."""
+    set_env(qdrant_collection=f"bench_ingest_{int(time.time())}")
+    from app import vector_store
+    from app.normalizer import normalize_many
+    from app.pipeline import store_logs
+
+    bodies = _encoded(args, args.logs)
+    vector_store._client = make_client(args.qdrant)
+    batches = [bodies[i : i + args.batch_size] for i in range(0, len(bodies), args.batch_size)]
+    latencies: list[float] = []
+    written = 0
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one(batch: list[bytes]) -> None:
+        nonlocal written
+        async with sem:
+            started = time.perf_counter()
+            logs = [n for n in normalize_many(batch) if not isinstance(n, Exception)]
+            written += await store_logs(logs, source="bench")
+            latencies.append(time.perf_counter() - started)
+
+    await vector_store.ensure_collection(vector_store.get_client())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(b) for b in batches))
+    elapsed = time.perf_counter() - started
+    # Log giả lập có id riêng và đều hợp lệ: mọi log phải được ghi đúng 1 point
+    stored = (await vector_store.get_client().count(vector_store.settings.qdrant_collection, exact=True)).count
+    expect(written == len(bodies), f"ghi {written}/{len(bodies)} log")
+    expect(stored == len(bodies), f"collection có {stored} point, cần {len(bodies)}")
+    if not args.keep:
+        await vector_store.get_client().delete_collection(vector_store.settings.qdrant_collection)
+    await vector_store.close_client()
+    return {
+        "bench": "ingest",
+        "qdrant": qdrant_mode(args.qdrant),
+        "logs": len(bodies),
+        "written": written,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "logs_per_s": round(len(bodies) / elapsed),
+        "batch_latency": percentiles(latencies),
+        "stage_seconds": _stage_totals(),
+    }
+
+
+async def bench_populate(args: argparse.Namespace) -> dict[str, Any]:
+    """Đảm bảo collection bench search có đủ `points` log (bỏ qua nếu đã có từ lần chạy trước)."""
+    set_env(
+        qdrant_collection=search_collection(args.points, args.seed),
+        dedup_enabled="false",
+        rollup_enabled="false",
+        anomaly_enabled="false",
+    )
+    from app import vector_store
+    from app.normalizer import normalize_many
+    from app.pipeline import store_logs
+
+    vector_store._client = make_client(args.qdrant)
+    client = vector_store.get_client()
+    await vector_store.ensure_collection(client)
+    existing = (await client.count(vector_store.settings.qdrant_collection, exact=True)).count
+    result: dict[str, Any] = {"bench": "populate", "qdrant": qdrant_mode(args.qdrant), "points": args.points, "existing": existing}
+    if existing >= args.points:
+        await vector_store.close_client()
+        return {**result, "skipped": True}
+    sem = asyncio.Semaphore(args.concurrency)
+    pending: set[asyncio.Task] = set()
+
+    async def one(batch: list[bytes]) -> None:
+        async with sem:
+            await store_logs([n for n in normalize_many(batch) if not isinstance(n, Exception)], source="bench")
+
+    started = time.perf_counter()
+    batch: list[bytes] = []
+    for log in synth_logs(args.points, args.merchants, args.orders, args.error_rate, args.seed):
+        batch.append(json.dumps(log, ensure_ascii=False).encode("utf-8"))
+        if len(batch) >= args.batch_size:
+            while len(pending) >= args.concurrency * 2:  # Giới hạn bộ nhớ khi populate 10M
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.create_task(one(batch)))
+            batch = []
+    if batch:
+        pending.add(asyncio.create_task(one(batch)))
+    if pending:
+        await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - started
+    stored = (await client.count(vector_store.settings.qdrant_collection, exact=True)).count
+    expect(stored >= args.points, f"collection có {stored} point, cần {args.points}")
+    await vector_store.close_client()
+    return {**result, "skipped": False, "elapsed_s": round(elapsed, 1), "logs_per_s": round(args.points / elapsed)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bench Log Consumer: normalize, ingest, populate.")
+    parser.add_argument("command", choices=["normalize", "ingest", "populate"])
+    parser.add_argument("--logs", type=int, default=20_000, help="Số log cho normalize/ingest")
+    parser.add_argument("--points", type=int, default=20_000, help="Số log trong collection bench search (populate)")
+    parser.add_argument("--merchants", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=10_000)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--qdrant",
+        help=":memory:, thư mục (local) hoặc URL server; mặc định :memory: cho ingest, benchmarks/results/qdrant cho populate",
+    )
+    parser.add_argument("--keep", action="store_true", help="Giữ collection sau bench ingest")
+    args = parser.parse_args()
+    if args.qdrant is None:
+        args.qdrant = str(ROOT / "benchmarks" / "results" / "qdrant") if args.command == "populate" else ":memory:"
+    if args.command == "normalize":
+        emit(bench_normalize(args))
+    elif args.command == "ingest":
+        emit(asyncio.run(bench_ingest(args)))
+    else:
+        emit(asyncio.run(bench_populate(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Tiện ích chung cho các bench (không import `app` của service nào)."""
+from __future__ import annotations
+
+import json
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def use_service(name: str) -> None:
+    """Cho phép `import app` của 1 service (log_consumer | triage_app/backend); mỗi process chỉ dùng 1 service."""
+    sys.path.insert(0, str(ROOT / name))
+
+
+def make_client(target: str):
+    """
+    AsyncQdrantClient theo target: ":memory:" (local, trong process), đường dẫn thư mục (local, lưu disk,
+    dùng chung giữa các process chạy lần lượt) hoặc URL server (http://host:6333).
+    """
+    from qdrant_client import AsyncQdrantClient
+
+    if target == ":memory:":
+        return AsyncQdrantClient(location=":memory:")
+    if target.startswith(("http://", "https://")):
+        return AsyncQdrantClient(url=target, timeout=60)
+    return AsyncQdrantClient(path=target)
+
+
+def qdrant_mode(target: str) -> str:
+    if target == ":memory:":
+        return "local-memory"
+    if target.startswith(("http://", "https://")):
+        return "server"
+    return "local-disk"
+
+
+def search_collection(points: int, seed: int) -> str:
+    """Collection của bench search: `bench_consumer.py populate` ghi, `bench_backend.py search` đọc."""
+    return f"bench_logs_{points}_{seed}"
+
+
+def set_env(**values: Any) -> None:
+    """Đặt env cho Settings của service; gọi trước khi import app.config."""
+    for key, value in values.items():
+        if value is not None:
+            os.environ[key.upper()] = str(value)
+
+
+def percentiles(samples_s: list[float]) -> dict[str, float]:
+    """p50/p95/p99/mean/max (ms) theo nearest-rank."""
+    if not samples_s:
+        return {}
+    ordered = sorted(samples_s)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))] * 1000
+
+    return {
+        "p50_ms": round(rank(0.50), 3),
+        "p95_ms": round(rank(0.95), 3),
+        "p99_ms": round(rank(0.99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "n": len(ordered),
+    }
+
+
+def expect(ok: bool, message: str) -> None:
+    """Kiểm tra kết quả của bench (không dùng assert vì bị bỏ khi chạy `python -O`); sai thì dừng với exit code 1."""
+    if not ok:
+        raise SystemExit(f"Bench sai kết quả: {message}")
+
+
+def emit(result: dict[str, Any]) -> None:
+    """Kết quả 1 bench: 1 dòng JSON trên stdout (log của service đi stderr)."""
+    sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Chạy toàn bộ bench (mỗi bench 1 process con) và ghi 1 file JSON kèm commit, để so sánh giữa các commit:
+
+    python benchmarks/run.py                                   # mặc định nhỏ, Qdrant local (benchmarks/results/qdrant)
+    python benchmarks/run.py --qdrant http://localhost:6333 --search-points 1000000,10000000
+    python benchmarks/run.py --compare benchmarks/results/<file cũ>.json
+
+Collection search (`bench_logs_<points>_<seed>`) được giữ lại giữa các lần chạy, lần sau bỏ qua populate.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+# Metric "càng thấp càng tốt" (latency, thời gian); còn lại (throughput) càng cao càng tốt
+_LOWER_IS_BETTER = ("_ms", "elapsed_s", "stage_seconds")
+# Tham số / kích thước, không phải kết quả đo
+_NOT_METRICS = (
+    ".n", ".points", ".logs", ".requests", ".queries", ".written", ".existing", ".batch_size", ".concurrency", ".avg_log_bytes",
+)
+
+
+def _bench(script: str, *argv: str) -> dict[str, Any]:
+    cmd = [sys.executable, str(BENCH_DIR / script), *argv]
+    print("$", " ".join(cmd[1:]), file=sys.stderr)
+    proc = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"{script} {argv[0]} lỗi (exit {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git(*argv: str) -> str:
+    try:
+        return subprocess.run(["git", *argv], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _flatten(obj: Any, prefix: str = "") -> dict[str, float]:
+    if isinstance(obj, dict):
+        out: dict[str, float] = {}
+        for key, value in obj.items():
+            out.update(_flatten(value, f"{prefix}.{key}" if prefix else key))
+        return out
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        return {prefix: float(obj)}
+    return {}
+
+
+def compare(base: dict[str, Any], new: dict[str, Any], threshold: float = 0.10) -> list[dict[str, Any]]:
+    """Các metric có ở cả 2 lần chạy: giá trị cũ/mới, % thay đổi và có phải regression (xấu đi quá threshold)."""
+    old_m, new_m = _flatten(base["results"]), _flatten(new["results"])
+    rows = []
+    for key in sorted(old_m.keys() & new_m.keys()):
+        old, cur = old_m[key], new_m[key]
+        if not old or key.endswith(_NOT_METRICS) or ".fake_llm." in key:
+            continue
+        change = (cur - old) / old
+        lower_better = any(part in key for part in _LOWER_IS_BETTER)
+        rows.append({
+            "metric": key,
+            "base": old,
+            "new": cur,
+            "change_pct": round(change * 100, 1),
+            "regression": change > threshold if lower_better else change < -threshold,
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chạy bench và ghi kết quả JSON.")
+    parser.add_argument("--logs", type=int, default=20_000, help="Số log cho normalize / ingest")
+    parser.add_argument("--search-points", default="20000", help="Danh sách kích thước collection cho bench search, vd 1000000,10000000")
+    parser.add_argument("--merchants", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--qdrant", default=str(RESULTS_DIR / "qdrant"), help="Qdrant cho search/triage: thư mục (local) hoặc URL server")
+    parser.add_argument("--ingest-qdrant", default=":memory:", help="Qdrant cho bench ingest")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số batch ghi song song khi populate")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--triage-requests", type=int, default=30)
+    parser.add_argument("--only", help="Chỉ chạy các bench này, vd normalize,ingest")
+    parser.add_argument("-o", "--output", help="File kết quả (mặc định benchmarks/results/<thời gian>-<commit>.json)")
+    parser.add_argument("--compare", help="File kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Xấu đi quá tỉ lệ này thì đánh dấu REGRESSION")
+    args = parser.parse_args()
+
+    only = set(args.only.split(",")) if args.only else {"normalize", "ingest", "search", "triage"}
+    shape = ["--merchants", str(args.merchants), "--orders", str(args.orders)]
+    seed = ["--seed", str(args.seed)]
+    sizes = [int(s) for s in args.search_points.split(",") if s.strip()]
+    results: dict[str, Any] = {}
+    started = time.time()
+    if "normalize" in only:
+        results["normalize"] = _bench("bench_consumer.py", "normalize", "--logs", str(args.logs), *shape, *seed)
+    if "ingest" in only:
+        results["ingest"] = _bench(
+            "bench_consumer.py", "ingest", "--logs", str(args.logs), "--qdrant", args.ingest_qdrant, *shape, *seed
+        )
+    for points in sizes if only & {"search", "triage"} else []:
+        target = ["--points", str(points), "--qdrant", args.qdrant, *seed]
+        results[f"populate_{points}"] = _bench(
+            "bench_consumer.py", "populate", "--concurrency", str(args.concurrency), *target, *shape
+        )
+        if "search" in only:
+            results[f"search_{points}"] = _bench("bench_backend.py", "search", "--queries", str(args.queries), *target)
+    if "triage" in only and sizes:
+        results["triage"] = _bench(
+            "bench_backend.py", "triage", "--triage-requests", str(args.triage_requests),
+            "--points", str(sizes[0]), "--qdrant", args.qdrant, *seed,
+        )
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "started_at": int(started),
+        "elapsed_s": round(time.time() - started, 1),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    if args.compare:
+        report["compare"] = {"base": args.compare, "rows": compare(json.loads(Path(args.compare).read_text()), report, args.threshold)}
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Kết quả: {output}", file=sys.stderr)
+    for row in report.get("compare", {}).get("rows", []):
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<55} {row['base']:>12.2f} → {row['new']:>12.2f} ({row['change_pct']:+.1f}%){flag}", file=sys.stderr)
+    print(json.dumps(results, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Sinh log thanh toán giả lập cùng dạng log gốc (docs/LOG_SCHEMA.md, scripts/sample_logs_y20ki9r6.json):
+mỗi đơn đi qua chuỗi bước create → inquiry → VietQR inquiry → event notify → notification như log thật,
+có orderNo/orderId/traceId/requestId nối các module. Số merchant, số đơn, tỉ lệ lỗi cấu hình được;
+cùng seed → cùng dữ liệu (bench search dùng lại để biết order_no / merchant_id có trong DB).
+
+    python benchmarks/synth.py --logs 100000 --merchants 50 --orders 20000 -o /tmp/logs.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator
+
+START_MS = 1770869240122  # 2026-02-12 11:07:20 (+07), như log mẫu
+_TZ = timezone(timedelta(hours=7))
+_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+_ERROR_CODES = ("ERROR", "TIMEOUT", "99", "PARTNER_ERROR")
+
+# (module, operation, requesterCode, opVer, latency trung bình ms, trạng thái đơn sau bước, dùng requestId mới)
+_FLOW = (
+    ("sb.MerchantProcessorV2", "/order/create", "MERCHANT_PAYMENTGW_SERVICE", "v1.0", 180, None, False),
+    ("sb.MerchantProcessorV2", "/internal/gw/inquiry", "MERCHANT_PAYMENTGW_SERVICE", None, 70, "OPEN", True),
+    ("sb.MerchantProcessorInquiry", "VietQrInquiryProcess", "WALLET_BACKEND", "v2.0", 120, "OPEN", True),
+    ("sb.MerchantProcessorEvent", "MERCHANT_EVENT_NOTIFY", "PARTNER_PUSH_PAYMENT", "v1.0", 110, "PAYED", False),
+    ("sb.MerchantNotification", "sb.PAYMENT_GW", "MERCHANT_PROCESSOR_EVENT", None, 900, "PAYED", False),
+)
+
+
+def order_no(seed: int, i: int) -> str:
+    """orderNo thứ i (xác định theo seed), 8 ký tự như Y20KI9R6."""
+    rnd = random.Random(seed * 1_000_003 + i)
+    return "".join(rnd.choice(_ALPHABET) for _ in range(8))
+
+
+def merchant_id(i: int) -> str:
+    return f"98{i:08d}"
+
+
+def _date(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, _TZ).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def synth_logs(
+    n: int,
+    merchants: int = 50,
+    orders: int = 10_000,
+    error_rate: float = 0.02,
+    seed: int = 1,
+    start_ms: int = START_MS,
+    span_s: int = 3600,
+) -> Iterator[dict[str, Any]]:
+    """
+    Yield n log. Đơn được chọn ngẫu nhiên trong `orders` đơn (mỗi đơn thuộc 1 merchant, phân bố lệch
+    kiểu Zipf như thực tế: vài merchant lớn chiếm phần lớn log), mỗi lượt sinh bước kế tiếp của đơn đó.
+    Timestamp tăng dần trong khoảng span_s giây.
+    """
+    rnd = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(merchants)]
+    order_merchant = rnd.choices(range(merchants), weights=weights, k=orders)
+    order_step = [0] * orders
+    order_ids = [uuid.UUID(int=rnd.getrandbits(128)).hex.upper()[:26] for _ in range(orders)]
+    order_amount = [rnd.choice((10_000, 20_000, 40_000, 50_000, 100_000, 250_000)) for _ in range(orders)]
+    step_ms = max(1, span_s * 1000 // max(1, n))
+    ts = start_ms
+    for _ in range(n):
+        o = rnd.randrange(orders)
+        module, operation, requester, op_ver, mean_ms, status, new_request = _FLOW[order_step[o] % len(_FLOW)]
+        order_step[o] += 1
+        failed = rnd.random() < error_rate
+        latency = int(rnd.expovariate(1 / mean_ms)) + 5
+        if failed:
+            latency = latency * rnd.randint(5, 30)
+        request_id = uuid.UUID(int=rnd.getrandbits(128)).hex.upper() if new_request else str(uuid.UUID(int=rnd.getrandbits(128)))
+        data: dict[str, Any] = {
+            "date": _date(ts),
+            "orderNo": order_no(seed, o),
+            "orderId": order_ids[o],
+            "traceId": order_ids[o],
+            "merchantId": merchant_id(order_merchant[o]),
+            "branchCode": f"MBF{order_merchant[o] % 20:02d}",
+            "amount": order_amount[o],
+            "channel": "MBS" if o % 3 else "APP",
+        }
+        if status:
+            data["status"] = "FAILED" if failed else status
+        if operation == "/order/create":
+            data.update(requestType="PaymentGateway", paymentType="QR_CODE", merchantType="CHAINED_MERCHANT")
+        elif module == "sb.MerchantProcessorInquiry":
+            data.update(accountNo=f"9980009{o:07d}", paidAmount=order_amount[o], partnerCode="VCCB")
+        if failed:
+            data["errorMessage"] = rnd.choice(
+                ("Partner timeout after 30000ms", "Connection reset by peer", "Callback to merchant failed: 504")
+            )
+        yield {
+            "startTime": ts,
+            "module": module,
+            "operation": operation,
+            "requesterCode": requester,
+            **({"opVer": op_ver} if op_ver else {}),
+            "spanId": request_id,
+            "requestId": request_id,
+            "respCode": rnd.choice(_ERROR_CODES) if failed else "OK",
+            "data": data,
+            "endTime": ts + latency,
+            "processingTime": latency,
+        }
+        ts += rnd.randint(0, 2 * step_ms)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sinh log thanh toán giả lập (JSONL).")
+    parser.add_argument("--logs", type=int, default=10_000)
+    parser.add_argument("--merchants", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=10_000)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="File JSONL (mặc định stdout)")
+    args = parser.parse_args()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for log in synth_logs(args.logs, args.merchants, args.orders, args.error_rate, args.seed):
+            out.write(json.dumps(log, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
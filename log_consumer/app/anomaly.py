@@ -0,0 +1,359 @@
+"""
+Phát hiện spike tỉ lệ lỗi / latency theo (merchant_id, operation, channel) ngay trong pipeline ingest.
+
+Mỗi key giữ cửa sổ 1 phút (theo timestamp log) và baseline EWMA (mean + variance) của tỉ lệ lỗi và
+latency trung bình các phút trước; cập nhật O(1) mỗi log. Khi đóng cửa sổ, nếu lệch baseline quá
+ANOMALY_Z_THRESHOLD độ lệch chuẩn (và đủ số log/lỗi tối thiểu) thì tạo incident kèm id log mẫu và
+`triage_request` gửi thẳng được cho POST /triage của Triage Backend. Phút bất thường không cập nhật baseline.
+
+CONSUMER_WORKERS > 1: mỗi worker chỉ nhận 1 phần log, nên detector (ở worker 0) không đếm trong pipeline mà đọc
+rollup theo phút (app/rollups.py, đã có bucket của mọi worker) của các phút đã đóng, cộng dồn theo
+(merchant_id, operation) và đánh giá với cùng ngưỡng; rollup không có channel nên `channel` của incident là "".
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from typing import Any
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import FieldCondition, Filter, MatchValue, Range
+
+from .config import settings
+from .rollups import ensure_rollup_collection
+from .schemas import NormalizedLog
+from .vector_store import get_client, to_point_id
+
+logger = logging.getLogger(__name__)
+
+_MINUTE_MS = 60_000
+_IDLE_MS = 24 * 60 * _MINUTE_MS  # Key không có log quá lâu thì bỏ baseline
+
+
+class _Ewma:
+    __slots__ = ("mean", "var", "n")
+
+    def __init__(self) -> None:
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+
+    def update(self, x: float, alpha: float) -> None:
+        if self.n == 0:
+            self.mean = x
+        else:
+            diff = x - self.mean
+            incr = alpha * diff
+            self.mean += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.n += 1
+
+    def z(self, x: float, min_std: float) -> float:
+        return (x - self.mean) / max(math.sqrt(self.var), min_std)
+
+
+class _KeyState:
+    __slots__ = ("window_start", "count", "errors", "latency_count", "latency_sum", "samples",
+                 "error_rate", "latency", "last_seen", "last_fired")
+
+    def __init__(self, window_start: int) -> None:
+        self.window_start = window_start
+        self.count = 0
+        self.errors = 0
+        self.latency_count = 0
+        self.latency_sum = 0
+        self.samples: list[tuple[tuple[bool, int], NormalizedLog]] = []  # (điểm, log): ưu tiên lỗi, rồi chậm
+        self.error_rate = _Ewma()
+        self.latency = _Ewma()
+        self.last_seen = 0
+        self.last_fired = 0
+
+    def reset(self, window_start: int) -> None:
+        self.window_start = window_start
+        self.count = self.errors = self.latency_count = self.latency_sum = 0
+        self.samples = []
+
+
+class AnomalyDetector:
+    def __init__(self, from_rollups: bool = False) -> None:
+        self._keys: dict[tuple[str, str, str], _KeyState] = {}
+        self._success = {c.strip().upper() for c in settings.success_resp_codes.split(",") if c.strip()}
+        self.from_rollups = from_rollups  # True: chỉ nhận cửa sổ đã cộng dồn qua observe_window
+        self.next_minute = 0  # from_rollups: phút rollup tiếp theo cần đọc
+        self.incidents: deque[dict[str, Any]] = deque(maxlen=settings.anomaly_max_incidents)
+        self.observed = 0
+        self._pending: list[dict[str, Any]] = []  # Incident chưa gửi webhook
+
+    def _is_error(self, log: NormalizedLog) -> bool:
+        return bool(log.resp_code) and log.resp_code.upper() not in self._success
+
+    def count_errors(self, resp_codes: dict[str, int]) -> int:
+        """Số lỗi từ bảng đếm theo resp_code của rollup (cùng định nghĩa với _is_error)."""
+        return sum(n for code, n in resp_codes.items() if code and code.upper() not in self._success)
+
+    def observe(self, logs: list[NormalizedLog]) -> None:
+        for log in logs:
+            if log.timestamp <= 0:
+                continue
+            key = (log.merchant_id, log.operation, log.channel)
+            minute = log.timestamp - log.timestamp % _MINUTE_MS
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = _KeyState(minute)
+            elif minute > state.window_start:
+                self._close(key, state)
+                state.reset(minute)
+            # Log trễ (phút cũ hơn cửa sổ hiện tại) vẫn cộng vào cửa sổ hiện tại
+            state.count += 1
+            state.last_seen = log.timestamp
+            is_error = self._is_error(log)
+            if is_error:
+                state.errors += 1
+            ms = log.processing_time_ms
+            if ms is not None and ms >= 0:
+                state.latency_count += 1
+                state.latency_sum += ms
+            self._keep_sample(state, log, is_error)
+        self.observed += len(logs)
+
+    def observe_window(
+        self,
+        key: tuple[str, str, str],
+        minute: int,
+        count: int,
+        errors: int,
+        latency_count: int,
+        latency_sum: int,
+    ) -> dict[str, Any] | None:
+        """Cửa sổ 1 phút đã cộng dồn sẵn (rollup của mọi worker): đánh giá ngay như khi đóng cửa sổ, trả incident nếu có."""
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState(minute)
+        state.reset(minute)
+        state.count, state.errors = count, errors
+        state.latency_count, state.latency_sum = latency_count, latency_sum
+        state.last_seen = minute
+        self.observed += count
+        incident = self._close(key, state)
+        state.reset(minute)
+        return incident
+
+    def _keep_sample(self, state: _KeyState, log: NormalizedLog, is_error: bool) -> None:
+        score = (is_error, log.processing_time_ms or 0)
+        samples = state.samples
+        if len(samples) < settings.anomaly_sample_size:
+            samples.append((score, log))
+            return
+        # Thay mẫu "nhẹ" nhất (thành công, nhanh nhất) bằng log lỗi / chậm hơn; sample_size nhỏ nên coi như O(1)
+        worst = min(range(len(samples)), key=lambda i: samples[i][0])
+        if score > samples[worst][0]:
+            samples[worst] = (score, log)
+
+    def _close(self, key: tuple[str, str, str], state: _KeyState) -> dict[str, Any] | None:
+        if state.count == 0:
+            return None
+        rate = state.errors / state.count
+        latency = state.latency_sum / state.latency_count if state.latency_count else None
+        enough = state.count >= settings.anomaly_min_count
+        warm = state.error_rate.n >= settings.anomaly_warmup_windows
+        fired: list[tuple[str, float, float, float]] = []
+        if warm and enough:
+            z = state.error_rate.z(rate, settings.anomaly_min_error_rate_std)
+            if (
+                z >= settings.anomaly_z_threshold
+                and state.errors >= settings.anomaly_min_errors
+                and rate - state.error_rate.mean >= settings.anomaly_min_error_rate_delta
+            ):
+                fired.append(("error_rate", rate, state.error_rate.mean, z))
+            if latency is not None and state.latency.n >= settings.anomaly_warmup_windows:
+                z = state.latency.z(latency, max(1.0, state.latency.mean * 0.1))
+                if z >= settings.anomaly_z_threshold and latency >= state.latency.mean * settings.anomaly_min_latency_ratio:
+                    fired.append(("latency", latency, state.latency.mean, z))
+        if fired:
+            if state.window_start - state.last_fired >= settings.anomaly_cooldown_minutes * _MINUTE_MS:
+                state.last_fired = state.window_start
+                return self._emit(key, state, fired)
+            return None  # Phút bất thường không đưa vào baseline
+        if enough:
+            alpha = settings.anomaly_ewma_alpha
+            state.error_rate.update(rate, alpha)
+            if latency is not None:
+                state.latency.update(latency, alpha)
+        return None
+
+    def _emit(
+        self, key: tuple[str, str, str], state: _KeyState, fired: list[tuple[str, float, float, float]]
+    ) -> dict[str, Any]:
+        merchant_id, operation, channel = key
+        window_end = state.window_start + _MINUTE_MS - 1
+        samples = sorted((n for _, n in state.samples), key=lambda n: n.timestamp)
+        kinds = ", ".join(
+            f"{kind} {observed:.3g} (baseline {baseline:.3g}, z={z:.1f})" for kind, observed, baseline, z in fired
+        )
+        incident = {
+            "id": str(uuid.uuid4()),
+            "detected_at": int(time.time() * 1000),
+            "merchant_id": merchant_id,
+            "operation": operation,
+            "channel": channel,
+            "window_start": state.window_start,
+            "window_end": window_end,
+            "signals": [
+                {"kind": kind, "observed": round(observed, 4), "baseline": round(baseline, 4), "z": round(z, 2)}
+                for kind, observed, baseline, z in fired
+            ],
+            "count": state.count,
+            "errors": state.errors,
+            "sample_log_ids": [str(to_point_id(n.id)) for n in samples],  # Dùng cho GET /logs/{id}/payload
+            "sample_record_ids": [n.id for n in samples],
+            "sample_order_nos": sorted({n.order_no for n in samples if n.order_no}),
+            # Body cho POST /triage của Triage Backend
+            "triage_request": {
+                "merchant_id": merchant_id or None,
+                "from_ts": state.window_start,
+                "to_ts": window_end,
+                "error_message": f"Bất thường {' / '.join(x for x in (operation, channel) if x)}: {kinds}",
+            },
+        }
+        logger.warning("Incident %s: merchant=%s operation=%s %s", incident["id"], merchant_id, operation, kinds)
+        self.incidents.append(incident)
+        if settings.anomaly_webhook_url:
+            self._pending.append(incident)
+        return incident
+
+    def sweep(self, now_ms: int) -> None:
+        """Đóng cửa sổ của key không còn log mới (theo giờ hệ thống), bỏ key idle quá lâu."""
+        for key, state in list(self._keys.items()):
+            if state.count and state.window_start + 2 * _MINUTE_MS <= now_ms:
+                self._close(key, state)
+                state.reset(state.window_start + _MINUTE_MS)
+            elif not state.count and state.last_seen + _IDLE_MS < now_ms:
+                del self._keys[key]
+
+    def take_pending(self) -> list[dict[str, Any]]:
+        pending, self._pending = self._pending, []
+        return pending
+
+    def stats(self) -> dict[str, int]:
+        return {"keys": len(self._keys), "observed": self.observed, "incidents": len(self.incidents)}
+
+
+_detector: AnomalyDetector | None = None
+
+
+def get_detector() -> AnomalyDetector | None:
+    """
+    None nếu ANOMALY_ENABLED=false hoặc không phải worker 0: chỉ 1 detector để không phát incident trùng.
+    CONSUMER_WORKERS > 1 thì detector đọc rollup (from_rollups) nên cần ROLLUP_ENABLED, tắt rollup thì cũng None.
+    """
+    global _detector
+    if _detector is None and settings.anomaly_enabled and settings.consumer_worker_id == 0:
+        from_rollups = settings.consumer_workers > 1
+        if from_rollups and not settings.rollup_enabled:
+            return None
+        _detector = AnomalyDetector(from_rollups)
+    return _detector
+
+
+async def _rollup_windows(
+    client: AsyncQdrantClient, detector: AnomalyDetector, minute: int
+) -> dict[tuple[str, str, str], list[int]]:
+    """Cộng dồn bucket rollup của 1 phút (mọi worker, mọi module) theo (merchant_id, operation, "")."""
+    windows: dict[tuple[str, str, str], list[int]] = {}
+    offset = None
+    while True:
+        points, offset = await client.scroll(
+            collection_name=settings.qdrant_rollup_collection,
+            scroll_filter=Filter(must=[FieldCondition(key="minute", range=Range(gte=minute, lte=minute))]),
+            limit=1000,
+            offset=offset,
+            with_payload=["merchant_id", "operation", "count", "resp_codes", "latency_count", "sum_ms"],
+            with_vectors=False,
+        )
+        for point in points:
+            p = point.payload or {}
+            w = windows.setdefault((p.get("merchant_id") or "", p.get("operation") or "", ""), [0, 0, 0, 0])
+            w[0] += p.get("count") or 0
+            w[1] += detector.count_errors(p.get("resp_codes") or {})
+            w[2] += p.get("latency_count") or 0
+            w[3] += p.get("sum_ms") or 0
+        if offset is None:
+            return windows
+
+
+async def _attach_samples(client: AsyncQdrantClient, detector: AnomalyDetector, incident: dict[str, Any]) -> None:
+    """Rollup không giữ log: lấy vài log của key trong cửa sổ từ collection log, ưu tiên lỗi rồi chậm."""
+    must = [
+        FieldCondition(key="timestamp", range=Range(gte=incident["window_start"], lte=incident["window_end"])),
+        FieldCondition(key="merchant_id", match=MatchValue(value=incident["merchant_id"])),
+        FieldCondition(key="operation", match=MatchValue(value=incident["operation"])),
+    ]
+    points, _ = await client.scroll(
+        collection_name=settings.qdrant_collection,
+        scroll_filter=Filter(must=must),
+        limit=max(50, settings.anomaly_sample_size * 10),
+        with_payload=["order_no", "resp_code", "processing_time_ms", "timestamp"],
+        with_vectors=False,
+    )
+    scored = [
+        ((detector.count_errors({p.payload.get("resp_code") or "": 1}) > 0, p.payload.get("processing_time_ms") or 0), p)
+        for p in points
+        if p.payload
+    ]
+    scored.sort(key=lambda s: s[0], reverse=True)
+    samples = sorted((p for _, p in scored[: settings.anomaly_sample_size]), key=lambda p: p.payload.get("timestamp") or 0)
+    incident["sample_log_ids"] = [str(p.id) for p in samples]
+    incident["sample_order_nos"] = sorted({p.payload["order_no"] for p in samples if p.payload.get("order_no")})
+
+
+async def detect_from_rollups(client: AsyncQdrantClient, detector: AnomalyDetector, now_ms: int) -> None:
+    """
+    Đánh giá các phút đã đóng: phút m được đọc khi đã qua m + 1 phút + ANOMALY_ROLLUP_LAG_S (log trễ + flush rollup
+    của mọi worker). Lần đầu bắt đầu từ phút đóng gần nhất; Qdrant lỗi thì phút đó được đọc lại lượt sau.
+    """
+    closed = now_ms - settings.anomaly_rollup_lag_s * 1000 - _MINUTE_MS
+    last = closed - closed % _MINUTE_MS
+    if not detector.next_minute:
+        detector.next_minute = last
+    if detector.next_minute > last:
+        return
+    await ensure_rollup_collection(client)
+    while detector.next_minute <= last:
+        minute = detector.next_minute
+        windows = await _rollup_windows(client, detector, minute)
+        for key, (count, errors, latency_count, latency_sum) in windows.items():
+            incident = detector.observe_window(key, minute, count, errors, latency_count, latency_sum)
+            if incident is not None:
+                try:
+                    await _attach_samples(client, detector, incident)
+                except Exception as e:
+                    logger.warning("Lấy log mẫu cho incident %s lỗi: %s", incident["id"], e)
+        detector.next_minute = minute + _MINUTE_MS
+
+
+async def anomaly_loop() -> None:
+    """Định kỳ đóng cửa sổ idle và gửi incident mới tới ANOMALY_WEBHOOK_URL (nếu có)."""
+    import httpx
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        while True:
+            await asyncio.sleep(10)
+            detector = get_detector()
+            if detector is None:
+                return
+            now_ms = int(time.time() * 1000)
+            if detector.from_rollups:
+                try:
+                    await detect_from_rollups(get_client(), detector, now_ms)
+                except Exception as e:
+                    logger.warning("Đọc rollup cho phát hiện bất thường lỗi (thử lại lượt sau): %s", e)
+            detector.sweep(now_ms)
+            for incident in detector.take_pending():
+                try:
+                    await client.post(settings.anomaly_webhook_url, json=incident)
+                except Exception as e:
+                    logger.warning("Gửi incident %s tới webhook lỗi: %s", incident["id"], e)
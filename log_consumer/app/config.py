@@ -1,6 +1,15 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
 
+class RetentionRule(BaseModel):
+    """Log có `field` thuộc (hoặc không thuộc nếu negate) `values` được giữ `days` ngày."""
+    field: str
+    values: list[str]
+    negate: bool = False
+    days: int
+
+
 class Settings(BaseSettings):
     # RabbitMQ [rabbit-mq-log-consumer]
     rabbitmq_enabled: bool = False
@@ -9,14 +18,104 @@ class Settings(BaseSettings):
     rabbitmq_username: str = "guest"
     rabbitmq_password: str = "guest"
     rabbitmq_queue_name: str = "INCIDENT_TRIAGE_LOGS"
-    rabbitmq_prefetch_count: int = 20
+    rabbitmq_prefetch_count: int = 20  # Prefetch tối thiểu; flow control tăng/giảm trong [count, max]
+    rabbitmq_prefetch_max: int = 1000
 
     ingest_batch_size: int = 10
+    ingest_flush_interval_ms: int = 200  # Deadline flush batch nếu chưa đủ ingest_batch_size
+    # Flow control RabbitMQ (AIMD): số batch ghi song song và prefetch theo latency / tỉ lệ lỗi ghi
+    ingest_max_concurrency: int = 8  # Số batch ghi Qdrant song song tối đa (bắt đầu từ 1)
+    ingest_queue_batches: int = 4  # Số batch đã chuẩn hóa chờ ghi; đầy thì ngừng nhận thêm
+    flow_target_latency_ms: int = 1000  # Ghi 1 batch trung bình chậm hơn → giảm một nửa
+    flow_max_error_rate: float = 0.05  # Tỉ lệ batch ghi lỗi trong 1 chu kỳ vượt ngưỡng → giảm một nửa
+    flow_adjust_interval_ms: int = 2000
+    # POST /ingest/stream (NDJSON)
+    ingest_stream_chunk_size: int = 500  # Số log mỗi lần upsert
+    ingest_stream_max_inflight: int = 2  # Số chunk ghi Qdrant song song trong khi vẫn đọc body
+    ingest_stream_max_line_bytes: int = 1_048_576
+    ingest_stream_max_errors: int = 100  # Số lỗi chi tiết (line/offset) trả về tối đa
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
+    qdrant_grpc_port: int = 6334  # Dùng cho backfill (upload qua gRPC)
     qdrant_collection: str = "payment_logs"
+    qdrant_timeout: int = 10
+    qdrant_max_connections: int = 32  # Kích thước connection pool của client dùng chung
+    qdrant_payload_index_on_disk: bool = False  # True: payload index nằm trên disk (tiết kiệm RAM)
     http_port: int = 8001
 
+    # Nhiều process consumer trên 1 host (main.py); 1 = 1 process uvicorn như cũ
+    consumer_workers: int = 1
+    consumer_http: str = "one"  # one: chỉ worker 0 phục vụ HTTP API | all: mọi worker (kernel chia kết nối)
+    consumer_drain_timeout_s: float = 30  # Khi dừng: thời gian tối đa để ghi + ack nốt batch RabbitMQ đã nhận
+    consumer_restart_backoff_s: float = 1  # Worker chết ngay sau khi start → đợi lâu dần (tối đa 60s) rồi start lại
+    consumer_worker_id: int = 0  # Supervisor đặt cho từng worker; retention / phát hiện bất thường chỉ chạy ở worker 0
+
+    # Nén payload gốc trong Qdrant: zstd | zlib | none
+    payload_compression: str = "zstd"
+    payload_compression_level: int = 3
+    payload_zstd_dict_path: str | None = None  # Dictionary train bằng `python -m app.payload_codec train ...`
+
+    # Bỏ log lặp (redelivery/retry/replay) trước khi ghi: LRU id đã ghi gần đây
+    # LRU riêng từng worker (CONSUMER_WORKERS > 1): log lặp được giao cho worker khác thì không bị bỏ; point id cố định
+    # nên Qdrant vẫn đúng, chỉ tốn thêm embed/upsert và bị đếm 2 lần trong rollup / phát hiện bất thường
+    dedup_enabled: bool = True
+    dedup_capacity: int = 200_000  # Số id giữ trong LRU (~140 bytes/id)
+    dedup_snapshot_path: str | None = None  # File snapshot để giữ trạng thái qua restart
+    dedup_snapshot_interval_s: int = 60
+
+    # Rollup theo phút (merchant/module/operation): đếm resp_code/status + sketch latency
+    rollup_enabled: bool = True
+    qdrant_rollup_collection: str = "payment_rollups"
+    rollup_flush_interval_s: int = 30
+    rollup_window_minutes: int = 120  # Bucket cũ hơn (đã flush) bị bỏ khỏi RAM
+    rollup_sketch_accuracy: float = 0.02  # Sai số tương đối của quantile latency
+    rollup_retention_days: int = 90  # Retention xóa bucket rollup cũ hơn N ngày (0 = giữ mãi)
+
+    # Phát hiện spike tỉ lệ lỗi / latency theo (merchant_id, operation, channel)
+    anomaly_enabled: bool = True
+    success_resp_codes: str = "OK,00,0,SUCCESS"  # resp_code coi là thành công
+    anomaly_ewma_alpha: float = 0.1
+    anomaly_z_threshold: float = 4.0
+    anomaly_warmup_windows: int = 10  # Số phút bình thường cần có trước khi bắt đầu cảnh báo
+    anomaly_min_count: int = 20  # Số log tối thiểu trong phút để đánh giá (cộng mọi worker)
+    anomaly_min_errors: int = 5  # Số lỗi tối thiểu trong phút (cộng mọi worker)
+    anomaly_min_error_rate_delta: float = 0.05  # Tỉ lệ lỗi phải cao hơn baseline ít nhất chừng này
+    anomaly_min_error_rate_std: float = 0.02  # Sàn độ lệch chuẩn (baseline gần như không lỗi)
+    anomaly_min_latency_ratio: float = 1.5  # Latency trung bình phải >= baseline × hệ số này
+    anomaly_cooldown_minutes: int = 10  # Không báo lại cùng key trong khoảng này
+    anomaly_sample_size: int = 5  # Số log mẫu kèm incident
+    anomaly_max_incidents: int = 200  # Số incident gần nhất giữ cho GET /incidents
+    anomaly_webhook_url: str | None = None  # POST incident (JSON) tới URL này khi phát hiện
+    # CONSUMER_WORKERS > 1: detector đọc rollup của phút m sau m + 1 phút + chừng này giây (> ROLLUP_FLUSH_INTERVAL_S + độ trễ log)
+    anomaly_rollup_lag_s: int = 120
+
+    # Retention: xóa log cũ theo batch (0 = không xóa)
+    retention_days: int = 0
+    retention_rules: list[RetentionRule] = []  # JSON; rule đầu tiên khớp quyết định số ngày giữ
+    retention_interval_s: int = 3600
+    retention_batch_size: int = 1000  # Số point mỗi lần delete
+    retention_batch_pause_ms: int = 200  # Nghỉ giữa các batch để không tranh tài nguyên với ingest
+    retention_max_deletes_per_run: int = 1_000_000
+    retention_optimize: bool = True  # Kích hoạt optimize segment sau khi xóa
+    retention_vacuum_threshold: float = 0.1  # deleted_threshold của optimizer
+
+    # Spool WAL trên disk khi Qdrant lỗi/chậm, replay nền (không đặt SPOOL_DIR = tắt)
+    spool_dir: str | None = None
+    spool_segment_bytes: int = 64 * 1024 * 1024
+    spool_max_bytes: int = 2 * 1024 * 1024 * 1024  # Đầy thì ingest lỗi như khi không có spool
+    spool_fsync: str = "always"  # always | interval | never
+    spool_fsync_interval_ms: int = 1000  # Dùng khi SPOOL_FSYNC=interval
+    spool_write_timeout_s: float = 5.0  # Ghi Qdrant trực tiếp lâu hơn thì chuyển batch sang spool
+    spool_replay_batch_size: int = 2000
+
+    # Embedding (CPU-only): hashing | sentence-transformers | none
+    embedding_backend: str = "hashing"
+    embedding_dim: int = 256  # Dùng cho backend hashing
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_workers: int = 2  # Số thread embed chạy song song (giới hạn CPU dành cho embedding)
+    embedding_cache_size: int = 50000  # Số embedding giữ trong LRU cache
+    embedding_cache_path: str | None = None  # File SQLite để giữ cache qua các lần restart
+
     class Config:
         env_prefix = ""
         env_file = ".env"
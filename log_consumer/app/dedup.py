@@ -0,0 +1,119 @@
+"""
+Bỏ log lặp (RabbitMQ redelivery, webhook retry, replay/backfill lại) trước khi embed + upsert.
+
+LRU các id log đã ghi gần đây (lưu hash 64-bit của NormalizedLog.id cho gọn), chỉ đánh dấu sau khi ghi
+Qdrant thành công. Tùy chọn snapshot ra file (DEDUP_SNAPSHOT_PATH) để restart không mất trạng thái.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _key(log_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(log_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class RecentIds:
+    """LRU id log đã ghi + tập id đang ghi (để 2 batch song song không cùng ghi 1 log)."""
+
+    def __init__(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self._pending: set[int] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def claim(self, log_ids: list[str]) -> tuple[list[int], list[bool]]:
+        """Trả về (key, is_new) cho từng id; id mới được giữ chỗ tới khi commit/release."""
+        keys = [_key(i) for i in log_ids]
+        is_new: list[bool] = []
+        for key in keys:
+            if key in self._seen or key in self._pending:
+                if key in self._seen:
+                    self._seen.move_to_end(key)
+                self.hits += 1
+                is_new.append(False)
+            else:
+                self._pending.add(key)
+                self.misses += 1
+                is_new.append(True)
+        return keys, is_new
+
+    def commit(self, keys: list[int]) -> None:
+        """Đánh dấu đã ghi thành công."""
+        for key in keys:
+            self._pending.discard(key)
+            self._seen[key] = None
+            self._seen.move_to_end(key)
+        while len(self._seen) > self._capacity:
+            self._seen.popitem(last=False)
+
+    def release(self, keys: list[int]) -> None:
+        """Ghi thất bại: bỏ giữ chỗ để lần gửi lại vẫn được ghi."""
+        for key in keys:
+            self._pending.discard(key)
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(array("Q", self._seen.keys()).tobytes())
+        os.replace(tmp, path)
+
+    def load(self, path: Path) -> int:
+        keys = array("Q")
+        keys.frombytes(path.read_bytes())
+        for key in keys[-self._capacity:]:
+            self._seen[key] = None
+        return len(self._seen)
+
+    def stats(self) -> dict[str, float | int]:
+        total = self.hits + self.misses
+        return {
+            "capacity": self._capacity,
+            "size": len(self._seen),
+            "pending": len(self._pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_recent: RecentIds | None = None
+
+
+def get_recent_ids() -> RecentIds | None:
+    """None nếu DEDUP_ENABLED=false."""
+    global _recent
+    if _recent is None and settings.dedup_enabled:
+        _recent = RecentIds(settings.dedup_capacity)
+        path = settings.dedup_snapshot_path
+        if path and Path(path).exists():
+            try:
+                logger.info("Dedup: nạp %d id từ snapshot %s", _recent.load(Path(path)), path)
+            except Exception as e:
+                logger.warning("Dedup: không đọc được snapshot %s: %s", path, e)
+    return _recent
+
+
+def save_snapshot() -> None:
+    if _recent is not None and settings.dedup_snapshot_path:
+        _recent.save(Path(settings.dedup_snapshot_path))
+
+
+async def snapshot_loop() -> None:
+    """Ghi snapshot định kỳ (DEDUP_SNAPSHOT_INTERVAL_S)."""
+    while True:
+        await asyncio.sleep(settings.dedup_snapshot_interval_s)
+        try:
+            save_snapshot()
+        except Exception as e:
+            logger.warning("Dedup: ghi snapshot lỗi: %s", e)
@@ -0,0 +1,240 @@
+"""
+Embedding cho text log (CPU-only), chạy batch trong thread pool để không block event loop.
+
+Backend (EMBEDDING_BACKEND):
+- hashing: hashing vectorizer bằng NumPy, deterministic, không cần model/mạng (mặc định).
+- sentence-transformers: model local (cần cài sentence-transformers).
+- none: vector dummy size 1 như trước (chỉ filter metadata).
+
+Log thanh toán lặp template rất nhiều nên embedding được cache LRU (và tùy chọn SQLite trên disk)
+theo hash của text.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _features(text: str) -> Iterator[str]:
+    """
+    Feature cho hashing: từng từ (lowercase) + nguyên cặp key=value (text dạng `key=value ...`).
+    Triage Backend tính lại y hệt cho query (app/text_query.py): sửa ở đây thì sửa cả bên đó và chạy
+    scripts/check_embedding_parity.py.
+    """
+    for part in text.split():
+        key, sep, value = part.partition("=")
+        if sep:
+            if not value:
+                continue
+            yield f"{key.lower()}={value.lower()}"
+            yield from _WORD_RE.findall(value.lower())
+        else:
+            yield from _WORD_RE.findall(part.lower())
+
+
+class Embedder(ABC):
+    """Interface embedder: embed_batch nhận list text, trả ma trận (n, dim) float32."""
+
+    name = "base"
+    dim = 1
+
+    @abstractmethod
+    def embed_batch(self, texts: list[str]) -> np.ndarray: ...
+
+
+class NoopEmbedder(Embedder):
+    """Vector dummy (giữ hành vi cũ khi chỉ filter bằng payload)."""
+
+    name = "none"
+    dim = 1
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        return np.zeros((len(texts), self.dim), dtype=np.float32)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Hashing vectorizer: mỗi feature → crc32 → bucket (h % dim) với dấu lấy từ bit cao, cộng dồn
+    bằng np.add.at rồi chuẩn hóa L2. Deterministic giữa các process/máy, không cần train.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        rows: list[int] = []
+        hashes: list[int] = []
+        for i, text in enumerate(texts):
+            before = len(hashes)
+            hashes.extend(zlib.crc32(f.encode("utf-8")) for f in _features(text))
+            rows.extend([i] * (len(hashes) - before))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if hashes:
+            h = np.asarray(hashes, dtype=np.uint32)
+            cols = (h % self.dim).astype(np.intp)
+            signs = np.where(h & 0x80000000, 1.0, -1.0).astype(np.float32)
+            np.add.at(out, (np.asarray(rows, dtype=np.intp), cols), signs)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """Model sentence-transformers chạy local trên CPU."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("EMBEDDING_BACKEND=sentence-transformers cần cài: pip install sentence-transformers") from e
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.name = f"sentence-transformers:{model_name}"
+        self.dim = int(self._model.get_sentence_embedding_dimension())
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(
+            self._model.encode(texts, batch_size=64, normalize_embeddings=True, show_progress_bar=False),
+            dtype=np.float32,
+        )
+
+
+class EmbeddingCache:
+    """LRU cache embedding theo hash text (thread-safe), tùy chọn lưu thêm vào SQLite."""
+
+    def __init__(self, max_size: int, path: str | None = None) -> None:
+        self._max_size = max_size
+        self._data: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            # timeout + WAL: nhiều worker (CONSUMER_WORKERS) dùng chung file
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def get_many(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        found: dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vec = self._data.get(key)
+                if vec is not None:
+                    self._data.move_to_end(key)
+                    found[key] = vec
+            missing = [k for k in keys if k not in found]
+            if self._db is not None and missing:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vec
+                    self._put(key, vec)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[bytes, np.ndarray]) -> None:
+        with self._lock:
+            for key, vec in items.items():
+                self._put(key, vec)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(k, v.astype(np.float32).tobytes()) for k, v in items.items()],
+                )
+                self._db.commit()
+
+    def _put(self, key: bytes, vec: np.ndarray) -> None:
+        self._data[key] = vec
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+
+_embedder: Embedder | None = None
+_cache: EmbeddingCache | None = None
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_embedder() -> Embedder:
+    """Embedder theo EMBEDDING_BACKEND (tạo 1 lần)."""
+    global _embedder
+    if _embedder is None:
+        backend = settings.embedding_backend.lower()
+        if backend == "hashing":
+            _embedder = HashingEmbedder(settings.embedding_dim)
+        elif backend == "sentence-transformers":
+            _embedder = SentenceTransformerEmbedder(settings.embedding_model)
+        elif backend == "none":
+            _embedder = NoopEmbedder()
+        else:
+            raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {settings.embedding_backend}")
+        logger.info("Embedder: %s (dim=%s)", _embedder.name, _embedder.dim)
+    return _embedder
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(settings.embedding_cache_size, settings.embedding_cache_path)
+    return _cache
+
+
+def _cache_key(embedder: Embedder, text: str) -> bytes:
+    return hashlib.sha1(f"{embedder.name}:{embedder.dim}:{text}".encode("utf-8")).digest()
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed batch text (đồng bộ, CPU): lấy từ cache, chỉ embed các text chưa có (đã bỏ trùng trong batch)."""
+    embedder = get_embedder()
+    if not texts:
+        return []
+    if isinstance(embedder, NoopEmbedder):
+        return embedder.embed_batch(texts).tolist()
+    cache = get_cache()
+    keys = [_cache_key(embedder, t) for t in texts]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+    missing: dict[bytes, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if missing:
+        matrix = embedder.embed_batch(list(missing.values()))
+        computed = dict(zip(missing.keys(), matrix))
+        cache.put_many(computed)
+        found.update(computed)
+    return [found[k].tolist() for k in keys]
+
+
+async def embed_texts_async(texts: list[str]) -> list[list[float]]:
+    """Embed trong thread pool (EMBEDDING_WORKERS luồng) để không block event loop."""
+    global _executor
+    get_embedder()  # khởi tạo model ở event loop thread, tránh race giữa các worker
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.embedding_workers, thread_name_prefix="embed")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, embed_texts, texts)
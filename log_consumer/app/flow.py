@@ -0,0 +1,128 @@
+"""
+Flow control cho RabbitMQ consumer (AIMD, giống điều khiển cửa sổ TCP):
+
+- Bước chuẩn hóa đẩy batch vào hàng đợi có giới hạn (INGEST_QUEUE_BATCHES); đầy thì bước nhận message phải đợi,
+  số message chưa ack bị chặn bởi prefetch nên broker cũng ngừng đẩy.
+- Tối đa `concurrency` batch được ghi Qdrant cùng lúc. Mỗi chu kỳ FLOW_ADJUST_INTERVAL_MS: ghi lỗi quá
+  FLOW_MAX_ERROR_RATE hoặc latency trung bình quá FLOW_TARGET_LATENCY_MS → giảm một nửa; còn batch phải chờ
+  (ghi không kịp) → tăng 1, tới INGEST_MAX_CONCURRENCY.
+- Prefetch đi theo concurrency: đủ message cho các batch đang ghi + hàng đợi, kẹp trong
+  [RABBITMQ_PREFETCH_COUNT, RABBITMQ_PREFETCH_MAX].
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+from .config import settings
+
+
+class FlowController:
+    def __init__(
+        self,
+        batch_size: int,
+        queue_batches: int,
+        max_concurrency: int,
+        min_prefetch: int,
+        max_prefetch: int,
+        target_latency_s: float,
+        max_error_rate: float,
+    ) -> None:
+        self._batch_size = max(1, batch_size)
+        self._max_concurrency = max(1, max_concurrency)
+        self._min_prefetch = max(1, min_prefetch)
+        self._max_prefetch = max(self._min_prefetch, max_prefetch)
+        self._target_latency_s = target_latency_s
+        self._max_error_rate = max_error_rate
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_batches))
+        self._cond = asyncio.Condition()
+        self.concurrency = 1
+        self.prefetch = self._prefetch_for(1)
+        self.inflight = 0
+        # Số liệu của chu kỳ hiện tại
+        self._count = 0
+        self._errors = 0
+        self._latency_sum = 0.0
+        self._saturated = False
+        # Số liệu chu kỳ trước (cho /flow)
+        self.last_latency_s = 0.0
+        self.last_error_rate = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    def _prefetch_for(self, concurrency: int) -> int:
+        wanted = self._batch_size * (concurrency + self.queue.maxsize)
+        return min(self._max_prefetch, max(self._min_prefetch, wanted))
+
+    async def put(self, item: Any) -> None:
+        """Đẩy batch đã chuẩn hóa vào hàng đợi ghi; đợi nếu hàng đợi đầy."""
+        await self.queue.put(item)
+
+    async def acquire(self) -> None:
+        """Đợi tới khi số batch đang ghi < concurrency (phải đợi tức là ghi không kịp)."""
+        async with self._cond:
+            if self.inflight >= self.concurrency:
+                self._saturated = True
+            await self._cond.wait_for(lambda: self.inflight < self.concurrency)
+            self.inflight += 1
+
+    async def release(self, latency_s: float, ok: bool) -> None:
+        async with self._cond:
+            self.inflight -= 1
+            self._count += 1
+            self._latency_sum += latency_s
+            self._errors += 0 if ok else 1
+            self._cond.notify_all()
+
+    async def adjust(self) -> bool:
+        """Cập nhật concurrency / prefetch theo chu kỳ vừa qua; trả True nếu prefetch đổi (cần set_qos lại)."""
+        async with self._cond:
+            count, errors, latency_sum, saturated = self._count, self._errors, self._latency_sum, self._saturated
+            self._count, self._errors, self._latency_sum, self._saturated = 0, 0, 0.0, False
+            if count:
+                self.last_latency_s = latency_sum / count
+                self.last_error_rate = errors / count
+            if count and (self.last_error_rate > self._max_error_rate or self.last_latency_s > self._target_latency_s):
+                if self.concurrency > 1:
+                    self.concurrency //= 2
+                    self.decreases += 1
+            elif count and saturated and self.concurrency < self._max_concurrency:
+                # Chỉ tăng khi chu kỳ có batch ghi xong: Qdrant treo thì hàng đợi đầy nhưng không được mở thêm
+                self.concurrency += 1
+                self.increases += 1
+                self._cond.notify_all()
+            prefetch = self._prefetch_for(self.concurrency)
+            changed, self.prefetch = prefetch != self.prefetch, prefetch
+            return changed
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "max_concurrency": self._max_concurrency,
+            "inflight": self.inflight,
+            "prefetch": self.prefetch,
+            "queue_depth": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "latency_ms": round(self.last_latency_s * 1000, 1),
+            "error_rate": round(self.last_error_rate, 4),
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+_flow: FlowController | None = None
+
+
+def get_flow() -> FlowController:
+    global _flow
+    if _flow is None:
+        _flow = FlowController(
+            batch_size=settings.ingest_batch_size,
+            queue_batches=settings.ingest_queue_batches,
+            max_concurrency=settings.ingest_max_concurrency,
+            min_prefetch=settings.rabbitmq_prefetch_count,
+            max_prefetch=settings.rabbitmq_prefetch_max,
+            target_latency_s=settings.flow_target_latency_ms / 1000,
+            max_error_rate=settings.flow_max_error_rate,
+        )
+    return _flow
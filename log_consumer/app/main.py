@@ -1,21 +1,29 @@
 """
 Log Consumer Service:
 - HTTP: POST /ingest nhận log (JSON), chuẩn hóa, ingest vào Vector DB (dùng test hoặc webhook).
+- HTTP: POST /ingest/stream nhận NDJSON theo stream (replay/bulk), bộ nhớ không phụ thuộc kích thước body.
 - RabbitMQ: background task consume queue INCIDENT_TRIAGE_LOGS, chuẩn hóa, ingest.
 """
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
+import time
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+from . import metrics
+from .anomaly import anomaly_loop, get_detector
 from .config import settings
-from .normalizer import normalize_log
-from .schemas import RawLog
-from .vector_store import get_client, ensure_collection, upsert_logs
+from .dedup import get_recent_ids, save_snapshot, snapshot_loop
+from .flow import get_flow
+from .normalizer import normalize_bytes, normalize_many
+from .stream_ingest import ingest_ndjson
+from .pipeline import store_logs
+from .rollups import flush_rollups, rollup_flush_loop
+from .spool import close_spool, get_spool, replay_loop
+from .vector_store import close_client, ensure_collection, get_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,36 +38,168 @@ def health():
 
 
 @app.post("/ingest")
-def ingest_one(body: dict):
-    """Nhận 1 log (JSON), chuẩn hóa và ingest vào Vector DB. Dùng cho test hoặc webhook."""
+async def ingest_one(request: Request):
+    """
+    Nhận 1 log (JSON), chuẩn hóa và ingest vào Vector DB. Dùng cho test hoặc webhook.
+    Body được parse 1 lần và giữ nguyên bytes gốc làm payload.
+    """
+    body = await request.body()
+    started = time.perf_counter()
     try:
-        raw = RawLog.model_validate(body)
+        norm = normalize_bytes(body)
     except Exception as e:
+        metrics.LOGS_TOTAL.labels("http", "invalid").inc()
         raise HTTPException(status_code=400, detail=str(e))
-    norm = normalize_log(raw, payload_json=json.dumps(body, ensure_ascii=False))
-    client = get_client()
-    ensure_collection(client)
-    upsert_logs(client, [norm])
-    return {"id": norm.id, "order_no": norm.order_no, "merchant_id": norm.merchant_id}
+    metrics.STAGE["normalize"].observe(time.perf_counter() - started)
+    written = await store_logs([norm], source="http")
+    return {"id": norm.id, "order_no": norm.order_no, "merchant_id": norm.merchant_id, "duplicate": written == 0}
 
 
 @app.post("/ingest/batch")
-def ingest_batch(body: list[dict]):
+async def ingest_batch(body: list[dict]):
     """Nhận nhiều log, chuẩn hóa và ingest."""
     normalized = []
-    for item in body:
-        try:
-            raw = RawLog.model_validate(item)
-            norm = normalize_log(raw, payload_json=json.dumps(item, ensure_ascii=False))
+    started = time.perf_counter()
+    for norm in normalize_many(body):
+        if isinstance(norm, Exception):
+            logger.warning("Skip invalid log: %s", norm)
+        else:
             normalized.append(norm)
-        except Exception as e:
-            logger.warning("Skip invalid log: %s", e)
+    metrics.STAGE["normalize"].observe(time.perf_counter() - started)
+    if len(body) > len(normalized):
+        metrics.LOGS_TOTAL.labels("batch", "invalid").inc(len(body) - len(normalized))
     if not normalized:
         raise HTTPException(status_code=400, detail="No valid logs")
-    client = get_client()
-    ensure_collection(client)
-    upsert_logs(client, normalized)
-    return {"ingested": len(normalized), "ids": [n.id for n in normalized]}
+    written = await store_logs(normalized, source="batch")
+    return {"ingested": len(normalized), "duplicates": len(normalized) - written, "ids": [n.id for n in normalized]}
+
+
+@app.post("/ingest/stream")
+async def ingest_stream(request: Request):
+    """
+    Nhận body NDJSON (mỗi dòng 1 log JSON) theo stream: validate + chuẩn hóa từng dòng, ghi Qdrant theo chunk.
+    Trả về số dòng, số log đã ghi, số dòng lỗi kèm line/offset.
+    """
+    return await ingest_ndjson(request.stream())
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Metrics Prometheus: thời gian từng stage, số log theo nguồn/kết quả, latency Qdrant, độ trễ, hit cache."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+@app.get("/dedup/stats")
+def dedup_stats():
+    """Số id đang giữ, số log lặp đã bỏ (hits) và tỉ lệ."""
+    recent = get_recent_ids()
+    return recent.stats() if recent is not None else {"enabled": False}
+
+
+@app.get("/spool/stats")
+def spool_stats():
+    """Số log trong spool chưa replay, dung lượng, số segment."""
+    spool = get_spool()
+    return spool.stats() if spool is not None else {"enabled": False}
+
+
+@app.get("/flow")
+def flow_stats():
+    """Flow control RabbitMQ: concurrency ghi, prefetch, hàng đợi batch, latency / tỉ lệ lỗi chu kỳ trước."""
+    if not settings.rabbitmq_enabled:
+        return {"enabled": False}
+    return get_flow().stats()
+
+
+@app.get("/incidents")
+def incidents(limit: int = 50):
+    """Incident gần nhất (mới nhất trước) do detector phát hiện; `triage_request` gửi thẳng cho POST /triage."""
+    detector = get_detector()
+    if detector is None:
+        return {"enabled": False, "incidents": []}
+    return {**detector.stats(), "incidents": list(reversed(detector.incidents))[:limit]}
+
+
+@app.on_event("startup")
+async def start_anomaly_detector():
+    if get_detector() is not None:
+        asyncio.create_task(anomaly_loop())
+    elif settings.anomaly_enabled and settings.consumer_worker_id == 0 and settings.consumer_workers > 1:
+        logger.warning("CONSUMER_WORKERS > 1 cần ROLLUP_ENABLED để phát hiện bất thường, detector tắt")
+
+
+@app.on_event("startup")
+async def start_dedup():
+    """Nạp snapshot dedup (nếu có) và ghi snapshot định kỳ."""
+    if get_recent_ids() is not None and settings.dedup_snapshot_path:
+        asyncio.create_task(snapshot_loop())
+
+
+@app.on_event("shutdown")
+async def drain_rabbitmq_consumer():
+    """Đăng ký trước các hook shutdown khác (chạy theo thứ tự): ghi + ack nốt batch đã nhận khi Qdrant client, spool còn mở."""
+    if settings.rabbitmq_enabled:
+        from .rabbitmq_consumer import stop_consumer
+        await stop_consumer(settings.consumer_drain_timeout_s)
+
+
+@app.on_event("shutdown")
+async def save_dedup_snapshot():
+    save_snapshot()
+
+
+@app.on_event("startup")
+async def init_vector_store():
+    """Tạo Qdrant client dùng chung cho cả app và kiểm tra collection một lần."""
+    try:
+        await ensure_collection(get_client())
+    except Exception as e:
+        logger.warning("Qdrant chưa sẵn sàng lúc startup (sẽ thử lại khi ingest): %s", e)
+
+
+@app.on_event("shutdown")
+async def close_vector_store():
+    await close_client()
+
+
+@app.on_event("startup")
+async def start_spool():
+    """Mở spool (khôi phục phần chưa replay sau restart) và chạy replayer nếu đặt SPOOL_DIR."""
+    if get_spool() is not None:
+        asyncio.create_task(replay_loop())
+
+
+@app.on_event("shutdown")
+async def close_spool_on_shutdown():
+    close_spool()
+
+
+@app.on_event("startup")
+async def start_rollups():
+    """Flush rollup theo phút định kỳ sang QDRANT_ROLLUP_COLLECTION."""
+    if settings.rollup_enabled:
+        asyncio.create_task(rollup_flush_loop())
+
+
+@app.on_event("shutdown")
+async def flush_rollups_on_shutdown():
+    try:
+        await flush_rollups(get_client())
+    except Exception as e:
+        logger.warning("Flush rollup lúc shutdown lỗi: %s", e)
+
+
+@app.on_event("startup")
+async def start_retention():
+    """
+    Xóa log / rollup quá hạn định kỳ nếu bật RETENTION_DAYS / RETENTION_RULES / ROLLUP_RETENTION_DAYS
+    (chỉ worker 0 khi CONSUMER_WORKERS > 1).
+    """
+    rollup_retention = settings.rollup_enabled and settings.rollup_retention_days > 0
+    if settings.consumer_worker_id == 0 and (settings.retention_days > 0 or settings.retention_rules or rollup_retention):
+        from .retention import retention_loop
+        asyncio.create_task(retention_loop())
+        logger.info("Retention task started (mỗi %ss)", settings.retention_interval_s)
 
 
 @app.on_event("startup")
@@ -0,0 +1,128 @@
+"""
+Metrics Prometheus cho Log Consumer (GET /metrics): thời gian từng stage của pipeline ingest, số log theo
+nguồn/kết quả, kích thước batch, latency gọi Qdrant, độ trễ log, độ sâu queue RabbitMQ, tỉ lệ hit cache.
+Đo theo batch (không theo từng log) nên overhead không đáng kể.
+"""
+from __future__ import annotations
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+__all__ = ["CONTENT_TYPE_LATEST", "render"]
+
+_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STAGE_SECONDS = Histogram(
+    "log_consumer_stage_seconds",
+    "Thời gian xử lý 1 batch theo stage (normalize, embed, build_points, store)",
+    ["stage"],
+    buckets=_SECONDS_BUCKETS,
+)
+LOGS_TOTAL = Counter(
+    "log_consumer_logs_total",
+    "Số log theo nguồn (http, batch, stream, rabbitmq, spool) và kết quả (written, spooled, duplicate, invalid, failed)",
+    ["source", "result"],
+)
+BATCH_SIZE = Histogram(
+    "log_consumer_batch_size",
+    "Số log mỗi lần ghi Qdrant",
+    ["source"],
+    buckets=(1, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000),
+)
+QDRANT_SECONDS = Histogram(
+    "log_consumer_qdrant_request_seconds",
+    "Latency gọi Qdrant",
+    ["op"],
+    buckets=_SECONDS_BUCKETS,
+)
+EVENT_LAG_SECONDS = Gauge(
+    "log_consumer_event_lag_seconds",
+    "Thời điểm ghi xong trừ timestamp của log mới nhất trong batch gần nhất",
+)
+QUEUE_DEPTH = Gauge(
+    "log_consumer_rabbitmq_queue_depth",
+    "Số message đang chờ trong queue RabbitMQ (consumer lag)",
+)
+SPOOL_REPLAY_SECONDS = Histogram(
+    "log_consumer_spool_replay_seconds",
+    "Thời gian replay 1 batch từ spool vào Qdrant",
+    buckets=_SECONDS_BUCKETS,
+)
+SPOOL_REPLAY_ERRORS = Counter("log_consumer_spool_replay_errors", "Số lần replay spool lỗi (Qdrant chưa sẵn sàng)")
+
+# Child theo label tạo sẵn: tránh lookup label mỗi lần observe
+STAGE = {s: STAGE_SECONDS.labels(s) for s in ("normalize", "embed", "build_points", "store")}
+QDRANT_UPSERT = QDRANT_SECONDS.labels("upsert")
+
+
+class _StateCollector:
+    """Đọc counter sẵn có của cache/dedup/rollup/detector lúc scrape (không tốn gì trên đường ingest)."""
+
+    def describe(self):
+        return []  # Không để registry gọi collect() lúc import (tránh import vòng)
+
+    def collect(self):
+        from .anomaly import _detector
+        from .dedup import _recent
+        from .embedder import _cache
+        from .flow import _flow
+        from .rollups import _store
+        from .spool import _spool
+
+        if _cache is not None:
+            hits = CounterMetricFamily("log_consumer_embedding_cache_hits", "Số text lấy embedding từ cache")
+            hits.add_metric([], _cache.hits)
+            misses = CounterMetricFamily("log_consumer_embedding_cache_misses", "Số text phải embed")
+            misses.add_metric([], _cache.misses)
+            yield hits
+            yield misses
+        if _recent is not None:
+            stats = _recent.stats()
+            dup = CounterMetricFamily("log_consumer_dedup_hits", "Số log lặp đã bỏ")
+            dup.add_metric([], stats["hits"])
+            new = CounterMetricFamily("log_consumer_dedup_misses", "Số log mới qua dedup")
+            new.add_metric([], stats["misses"])
+            size = GaugeMetricFamily("log_consumer_dedup_size", "Số id đang giữ trong LRU dedup")
+            size.add_metric([], stats["size"])
+            yield dup
+            yield new
+            yield size
+        if _store is not None:
+            buckets = GaugeMetricFamily("log_consumer_rollup_buckets", "Số rollup bucket đang giữ trong RAM")
+            buckets.add_metric([], len(_store))
+            yield buckets
+        if _spool is not None:
+            stats = _spool.stats()
+            for name, help_text in (
+                ("pending", "Số log trong spool chưa replay vào Qdrant"),
+                ("bytes", "Dung lượng spool chưa replay (byte)"),
+                ("segments", "Số file segment của spool"),
+            ):
+                family = GaugeMetricFamily(f"log_consumer_spool_{name}", help_text)
+                family.add_metric([], stats[name])
+                yield family
+        if _flow is not None:
+            stats = _flow.stats()
+            for name, help_text in (
+                ("concurrency", "Số batch được ghi Qdrant song song hiện tại (AIMD)"),
+                ("inflight", "Số batch RabbitMQ đang ghi"),
+                ("prefetch", "Prefetch hiện tại của channel RabbitMQ"),
+                ("queue_depth", "Số batch đã chuẩn hóa chờ ghi"),
+            ):
+                family = GaugeMetricFamily(f"log_consumer_flow_{name}", help_text)
+                family.add_metric([], stats[name])
+                yield family
+        if _detector is not None:
+            incidents = GaugeMetricFamily("log_consumer_anomaly_recent_incidents", "Số incident đang giữ (GET /incidents)")
+            incidents.add_metric([], len(_detector.incidents))
+            keys = GaugeMetricFamily("log_consumer_anomaly_keys", "Số key (merchant, operation, channel) đang theo dõi")
+            keys.add_metric([], _detector.stats()["keys"])
+            yield incidents
+            yield keys
+
+
+REGISTRY.register(_StateCollector())
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
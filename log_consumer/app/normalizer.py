@@ -3,10 +3,18 @@ from __future__ import annotations
 
 import json
 import re
-from typing import Any
+from typing import Any, Iterable, NamedTuple
 
 from .schemas import NormalizedLog, RawLog
 
+try:
+    import orjson
+except ImportError:  # orjson là optional, fallback json chuẩn
+    orjson = None
+
+_WS_RE = re.compile(r"\s+")
+_ID_UNSAFE_RE = re.compile(r"[^a-zA-Z0-9_\-.]")
+
 
 def _get(data: dict[str, Any], *keys: str, default: str = "") -> str:
     for key in keys:
@@ -27,6 +35,15 @@ def _get_num(data: dict[str, Any], *keys: str):
     return None
 
 
+def _loads(body: bytes | str) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass  # NaN/Infinity, số nguyên > 64 bit...: để json chuẩn quyết định (giữ hành vi cũ)
+    return json.loads(body)
+
+
 def _safe_json(obj: Any) -> str:
     try:
         return json.dumps(obj, ensure_ascii=False)
@@ -34,74 +51,133 @@ def _safe_json(obj: Any) -> str:
         return str(obj)
 
 
-def build_text_for_embedding(module: str, operation: str, data: dict[str, Any]) -> str:
-    """Tạo chuỗi text từ log để dùng cho embedding hoặc full-text search."""
+class _Fields(NamedTuple):
+    """Các field trích từ `data` trong 1 lần duyệt, dùng chung cho NormalizedLog và text embedding."""
+    order_no: str
+    order_id: str
+    trace_id: str
+    request_id: str
+    merchant_id: str
+    branch_code: str
+    channel: str
+    status: str
+    resp_code: str  # respCode/responseCode (dùng trong text)
+    error_code: str  # errorCode (fallback cho resp_code của NormalizedLog)
+    amount: float | None
+    response_message: str
+
+
+def _extract(data: dict[str, Any]) -> _Fields:
+    resp_code = _get(data, "respCode", "responseCode")
+    return _Fields(
+        order_no=_get(data, "orderNo", "order_no"),
+        order_id=_get(data, "orderId"),
+        trace_id=_get(data, "traceId"),
+        request_id=_get(data, "requestId"),
+        merchant_id=_get(data, "merchantId", "merchant_id"),
+        branch_code=_get(data, "branchCode", "branch_code"),
+        channel=_get(data, "channel"),
+        status=_get(data, "status"),
+        resp_code=resp_code,
+        error_code="" if resp_code else _get(data, "errorCode"),
+        amount=_get_num(data, "amount", "paidAmount"),
+        response_message=_get(data, "responseMessage", "errorMessage"),
+    )
+
+
+def _build_text(module: str, operation: str, f: _Fields) -> str:
     parts = [
         f"module={module}",
         f"operation={operation}",
-        f"orderNo={_get(data, 'orderNo', 'order_no')}",
-        f"orderId={_get(data, 'orderId')}",
-        f"traceId={_get(data, 'traceId')}",
-        f"requestId={_get(data, 'requestId')}",
-        f"merchantId={_get(data, 'merchantId', 'merchant_id')}",
-        f"branchCode={_get(data, 'branchCode', 'branch_code')}",
-        f"channel={_get(data, 'channel')}",
-        f"status={_get(data, 'status')}",
-        f"respCode={_get(data, 'respCode', 'responseCode')}",
+        f"orderNo={f.order_no}",
+        f"orderId={f.order_id}",
+        f"traceId={f.trace_id}",
+        f"requestId={f.request_id}",
+        f"merchantId={f.merchant_id}",
+        f"branchCode={f.branch_code}",
+        f"channel={f.channel}",
+        f"status={f.status}",
+        f"respCode={f.resp_code}",
     ]
-    amount = _get_num(data, "amount", "paidAmount")
-    if amount is not None:
-        parts.append(f"amount={amount}")
-    # Trích đoạn responseMessage nếu có (thường chứa thông tin lỗi)
-    msg = _get(data, "responseMessage")
-    if msg:
-        msg_clean = re.sub(r"\s+", " ", msg)[:500]
-        parts.append(f"response={msg_clean}")
+    if f.amount is not None:
+        parts.append(f"amount={f.amount}")
+    # Trích đoạn responseMessage / errorMessage nếu có (thường chứa thông tin lỗi)
+    if f.response_message:
+        parts.append(f"response={_WS_RE.sub(' ', f.response_message)[:500]}")
     return " ".join(parts)
 
 
-def normalize_log(raw: RawLog | dict[str, Any], payload_json: str | None = None) -> NormalizedLog:
-    """Chuyển log gốc thành NormalizedLog."""
-    if isinstance(raw, dict):
-        raw = RawLog.model_validate(raw)
+def build_text_for_embedding(module: str, operation: str, data: dict[str, Any]) -> str:
+    """Tạo chuỗi text từ log để dùng cho embedding hoặc full-text search."""
+    return _build_text(module, operation, _extract(data))
+
+
+def _data_dict(raw: RawLog) -> dict[str, Any]:
     data = raw.data or {}
     if not isinstance(data, dict):
         data = data.model_dump() if hasattr(data, "model_dump") else {}
+    return data
 
-    request_id = raw.requestId or _get(data, "requestId") or ""
-    order_no = _get(data, "orderNo", "order_no")
-    order_id = _get(data, "orderId") or ""
-    trace_id = _get(data, "traceId") or ""
-    merchant_id = _get(data, "merchantId", "merchant_id") or ""
-    branch_code = _get(data, "branchCode", "branch_code") or ""
-    amount = _get_num(data, "amount", "paidAmount")
-    channel = _get(data, "channel") or ""
-    status = _get(data, "status") or ""
-    resp_code = raw.respCode or _get(data, "respCode", "responseCode", "errorCode") or ""
+
+def _normalize_validated(raw: RawLog, payload: str) -> NormalizedLog:
+    """Chuẩn hóa RawLog đã validate (1 lần trích field từ data)."""
+    f = _extract(_data_dict(raw))
+    request_id = raw.requestId or f.request_id or ""
 
     record_id = f"{request_id}_{raw.startTime}" if request_id else f"log_{raw.startTime}"
     # Sanitize id cho Qdrant (thường dùng UUID hoặc string không có ký tự đặc biệt)
-    record_id = re.sub(r"[^a-zA-Z0-9_\-.]", "_", record_id)[:128]
-
-    text = build_text_for_embedding(raw.module, raw.operation, data)
-    payload = payload_json or _safe_json(raw.model_dump(mode="json"))
+    record_id = _ID_UNSAFE_RE.sub("_", record_id)[:128]
 
     return NormalizedLog(
         id=record_id,
         request_id=request_id,
-        order_no=order_no,
-        order_id=order_id,
-        trace_id=trace_id,
-        merchant_id=merchant_id,
-        branch_code=branch_code,
-        amount=amount,
-        channel=channel,
+        order_no=f.order_no,
+        order_id=f.order_id,
+        trace_id=f.trace_id,
+        merchant_id=f.merchant_id,
+        branch_code=f.branch_code,
+        amount=f.amount,
+        channel=f.channel,
         module=raw.module,
         operation=raw.operation,
-        resp_code=resp_code,
-        status=status,
+        resp_code=raw.respCode or f.resp_code or f.error_code or "",
+        status=f.status,
         timestamp=raw.startTime,
         processing_time_ms=raw.processingTime,
-        text=text,
+        text=_build_text(raw.module, raw.operation, f),
         payload=payload,
     )
+
+
+def normalize_log(raw: RawLog | dict[str, Any], payload_json: str | None = None) -> NormalizedLog:
+    """Chuyển log gốc thành NormalizedLog."""
+    if isinstance(raw, dict):
+        raw = RawLog.model_validate(raw)
+    return _normalize_validated(raw, payload_json or _safe_json(raw.model_dump(mode="json")))
+
+
+def normalize_bytes(body: bytes | str) -> NormalizedLog:
+    """
+    Fast path cho log dạng JSON thô (message RabbitMQ, dòng NDJSON, body HTTP): parse 1 lần (orjson),
+    validate 1 lần và giữ nguyên bytes gốc làm payload, không serialize lại.
+    """
+    raw = RawLog.model_validate(_loads(body))
+    payload = body.decode("utf-8") if isinstance(body, (bytes, bytearray)) else body
+    return _normalize_validated(raw, payload)
+
+
+def normalize_many(items: Iterable[bytes | str | dict[str, Any]]) -> list[NormalizedLog | Exception]:
+    """
+    Chuẩn hóa cả batch. bytes/str đi fast path (normalize_bytes), dict giữ hành vi của normalize_log
+    (payload = json.dumps(item)). Kết quả cùng thứ tự với input; phần tử lỗi trả về Exception thay vì raise.
+    """
+    out: list[NormalizedLog | Exception] = []
+    for item in items:
+        try:
+            if isinstance(item, dict):
+                out.append(normalize_log(RawLog.model_validate(item), payload_json=_safe_json(item)))
+            else:
+                out.append(normalize_bytes(item))
+        except Exception as e:
+            out.append(e)
+    return out
@@ -0,0 +1,96 @@
+"""
+Nén payload (JSON log gốc) trước khi lưu Qdrant: zstd (tùy chọn dictionary train từ log mẫu) hoặc zlib.
+Payload nén được lưu base64 trong field `payload_z`, codec trong `payload_codec`; Triage BE chỉ giải nén
+khi user mở chi tiết log (GET /logs/{id}/payload).
+
+Train dictionary từ file log mẫu (JSON array hoặc JSONL):
+
+    python -m app.payload_codec train ../scripts/sample_logs_y20ki9r6.json payload.zdict
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import sys
+import zlib
+from pathlib import Path
+
+from .config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstandard là optional, fallback zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+_compressor = None
+_codec: str | None = None
+
+
+def _init() -> None:
+    global _compressor, _codec
+    wanted = settings.payload_compression.lower()
+    if wanted == CODEC_ZSTD and zstandard is None:
+        logger.warning("PAYLOAD_COMPRESSION=zstd nhưng chưa cài zstandard; dùng zlib")
+        wanted = CODEC_ZLIB
+    if wanted == CODEC_ZSTD:
+        if settings.payload_zstd_dict_path:
+            dict_data = zstandard.ZstdCompressionDict(Path(settings.payload_zstd_dict_path).read_bytes())
+            _compressor = zstandard.ZstdCompressor(
+                level=settings.payload_compression_level,
+                dict_data=dict_data,
+                write_dict_id=False,
+            )
+            # Ghi dict_id vào codec để BE biết cần đúng dictionary nào khi giải nén
+            _codec = f"{CODEC_ZSTD}:{dict_data.dict_id()}"
+        else:
+            _compressor = zstandard.ZstdCompressor(level=settings.payload_compression_level)
+            _codec = CODEC_ZSTD
+    elif wanted in (CODEC_ZLIB, CODEC_NONE):
+        _codec = wanted
+    else:
+        raise ValueError(f"PAYLOAD_COMPRESSION không hợp lệ: {settings.payload_compression}")
+
+
+def compress_payload(payload: str) -> tuple[str, str]:
+    """Trả về (codec, data). codec=none thì data là payload gốc, ngược lại là base64 của bytes đã nén."""
+    if _codec is None:
+        _init()
+    if _codec == CODEC_NONE:
+        return _codec, payload
+    raw = payload.encode("utf-8")
+    if _codec == CODEC_ZLIB:
+        packed = zlib.compress(raw, settings.payload_compression_level)
+    else:
+        packed = _compressor.compress(raw)
+    return _codec, base64.b64encode(packed).decode("ascii")
+
+
+def train_dictionary(samples: list[bytes], size: int = 16384) -> bytes:
+    """Train zstd dictionary từ các log mẫu (nên dùng vài nghìn log đủ loại module/operation)."""
+    if zstandard is None:
+        raise RuntimeError("Cần cài zstandard để train dictionary")
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+def _main(argv: list[str]) -> None:
+    if len(argv) != 3 or argv[0] != "train":
+        print("Usage: python -m app.payload_codec train SAMPLES_FILE OUT_DICT")
+        sys.exit(1)
+    text = Path(argv[1]).read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        samples = [json.dumps(item, ensure_ascii=False).encode("utf-8") for item in json.loads(text)]
+    else:
+        samples = [line.encode("utf-8") for line in text.splitlines() if line.strip()]
+    Path(argv[2]).write_bytes(train_dictionary(samples))
+    print(f"Đã train dictionary từ {len(samples)} log → {argv[2]}")
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
@@ -0,0 +1,78 @@
+"""Bước ghi chung cho mọi đường ingest (HTTP, RabbitMQ): bỏ log lặp → embed batch → upsert 1 lần → rollup + phát hiện bất thường."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from . import metrics
+from .config import settings
+from .dedup import get_recent_ids
+from .anomaly import get_detector
+from .embedder import embed_texts_async
+from .rollups import get_rollups
+from .schemas import NormalizedLog
+from .spool import get_spool, spool_append
+from .vector_store import get_client, upsert_logs
+
+logger = logging.getLogger(__name__)
+
+
+async def _write(normalized: list[NormalizedLog]) -> None:
+    embed_started = time.perf_counter()
+    vectors = await embed_texts_async([n.text for n in normalized])
+    metrics.STAGE["embed"].observe(time.perf_counter() - embed_started)
+    await upsert_logs(get_client(), normalized, vectors)
+
+
+async def store_logs(normalized: list[NormalizedLog], source: str = "http") -> int:
+    """
+    Bỏ các log đã ghi gần đây (dedup theo id), embed text của phần còn lại (thread pool, có cache)
+    rồi ghi Qdrant bằng 1 lần upsert. Trả về số log đã nhận ghi (vào Qdrant hoặc spool). `source` chỉ dùng làm label metrics.
+    Có spool (SPOOL_DIR): Qdrant lỗi hoặc chậm quá SPOOL_WRITE_TIMEOUT_S thì ghi vào spool (replay sau),
+    spool còn log chưa replay thì ghi thẳng vào spool để không đợi Qdrant và giữ thứ tự.
+    """
+    started = time.perf_counter()
+    total = len(normalized)
+    recent = get_recent_ids()
+    if recent is not None and normalized:
+        keys, is_new = recent.claim([n.id for n in normalized])
+        normalized = [n for n, new in zip(normalized, is_new) if new]
+        keys = [k for k, new in zip(keys, is_new) if new]
+    if total > len(normalized):
+        metrics.LOGS_TOTAL.labels(source, "duplicate").inc(total - len(normalized))
+    if not normalized:
+        return 0
+    spool = get_spool()
+    result = "written"
+    try:
+        if spool is None:
+            await _write(normalized)
+        elif spool.pending:
+            await spool_append(spool, normalized)
+            result = "spooled"
+        else:
+            try:
+                await asyncio.wait_for(_write(normalized), settings.spool_write_timeout_s)
+            except Exception as e:
+                logger.warning("Ghi Qdrant lỗi, chuyển %d log vào spool: %r", len(normalized), e)
+                await spool_append(spool, normalized)
+                result = "spooled"
+    except BaseException:
+        if recent is not None:
+            recent.release(keys)
+        metrics.LOGS_TOTAL.labels(source, "failed").inc(len(normalized))
+        raise
+    if recent is not None:
+        recent.commit(keys)
+    rollups = get_rollups()
+    if rollups is not None:
+        rollups.observe(normalized)
+    detector = get_detector()
+    if detector is not None and not detector.from_rollups:
+        detector.observe(normalized)
+    metrics.STAGE["store"].observe(time.perf_counter() - started)
+    metrics.LOGS_TOTAL.labels(source, result).inc(len(normalized))
+    metrics.BATCH_SIZE.labels(source).observe(len(normalized))
+    metrics.EVENT_LAG_SECONDS.set(max(0.0, time.time() - max(n.timestamp for n in normalized) / 1000))
+    return len(normalized)
@@ -1,55 +1,248 @@
-"""Consume từng message từ RabbitMQ (1 message = 1 log JSON), chuẩn hóa, ghi Qdrant."""
+"""Consume message từ RabbitMQ (1 message = 1 log JSON), gom batch, chuẩn hóa, ghi Qdrant (flow control ở app/flow.py)."""
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
+import time
 
 import aio_pika
-from aio_pika.abc import AbstractIncomingMessage
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
 
+from . import metrics
 from .config import settings
-from .normalizer import normalize_log
-from .schemas import RawLog
-from .vector_store import get_client, ensure_collection, upsert_logs
+from .flow import FlowController, get_flow
+from .normalizer import normalize_many
+from .schemas import NormalizedLog
+from .pipeline import store_logs
+from .vector_store import get_client, ensure_collection
 
 logger = logging.getLogger(__name__)
 
 
+class AckWatermark:
+    """
+    Batch được ghi song song nên xong không theo thứ tự, còn ack/nack multiple=True phủ mọi message có delivery
+    tag nhỏ hơn: chỉ ack phần liền mạch từ batch cũ nhất, batch xong sớm được giữ lại tới khi các batch trước xong.
+    """
+
+    def __init__(self) -> None:
+        self._next = 0
+        self._head = 0
+        self._done: dict[int, tuple[AbstractIncomingMessage, bool]] = {}
+        self._lock = asyncio.Lock()
+
+    def register(self) -> int:
+        seq, self._next = self._next, self._next + 1
+        return seq
+
+    async def complete(self, seq: int, last: AbstractIncomingMessage, ok: bool) -> None:
+        async with self._lock:
+            self._done[seq] = (last, ok)
+            to_ack: AbstractIncomingMessage | None = None
+            while self._head in self._done:
+                message, ok = self._done.pop(self._head)
+                self._head += 1
+                if ok:
+                    to_ack = message  # Gộp các batch thành công liền nhau vào 1 lần ack
+                    continue
+                if to_ack is not None:
+                    await to_ack.ack(multiple=True)
+                    to_ack = None
+                await message.nack(multiple=True, requeue=False)
+            if to_ack is not None:
+                await to_ack.ack(multiple=True)
+
+
+class MessageBatcher:
+    """
+    Gom message tới khi đủ batch_size hoặc hết flush_interval, chuẩn hóa cả batch rồi đẩy vào hàng đợi ghi của
+    flow controller (đợi nếu đầy). Message lỗi (decode/validate) bị nack riêng từng cái ngay.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, flow: FlowController, acks: AckWatermark) -> None:
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._flow = flow
+        self._acks = acks
+        self._pending: list[AbstractIncomingMessage] = []
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.TimerHandle | None = None
+        self._deadline_task: asyncio.Task | None = None
+
+    async def add(self, message: AbstractIncomingMessage) -> None:
+        self._pending.append(message)
+        if len(self._pending) >= self._batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._flush_interval, self._on_deadline)
+
+    def _on_deadline(self) -> None:
+        self._timer = None
+        self._deadline_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        # Lock FIFO: batch vào hàng đợi ghi đúng thứ tự delivery tag (AckWatermark dựa vào thứ tự này)
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending, []
+            if batch:
+                await self._process(batch)
+
+    async def _process(self, batch: list[AbstractIncomingMessage]) -> None:
+        normalized: list[NormalizedLog] = []
+        accepted: list[AbstractIncomingMessage] = []
+        started = time.perf_counter()
+        for message, norm in zip(batch, normalize_many(m.body for m in batch)):
+            if isinstance(norm, Exception):
+                logger.warning("Skip invalid log: %s", norm, exc_info=False)
+                metrics.LOGS_TOTAL.labels("rabbitmq", "invalid").inc()
+                await message.nack(requeue=False)
+                continue
+            normalized.append(norm)
+            accepted.append(message)
+        metrics.STAGE["normalize"].observe(time.perf_counter() - started)
+        if accepted:
+            await self._flow.put((self._acks.register(), normalized, accepted[-1]))
+
+
+# Trạng thái consumer đang chạy, dùng cho graceful drain (stop_consumer)
+_connection: aio_pika.abc.AbstractRobustConnection | None = None
+_consumer: tuple[aio_pika.abc.AbstractQueue, str] | None = None  # (queue, consumer tag)
+_batcher: MessageBatcher | None = None
+_writes: set[asyncio.Task] = set()
+
+
+async def _write_loop(flow: FlowController, acks: AckWatermark) -> None:
+    """Lấy batch từ hàng đợi và ghi, tối đa flow.concurrency batch cùng lúc."""
+    while True:
+        seq, normalized, last = await flow.queue.get()
+        await flow.acquire()
+        task = asyncio.create_task(_write_batch(flow, acks, seq, normalized, last))
+        _writes.add(task)
+        task.add_done_callback(_writes.discard)
+
+
+async def _write_batch(
+    flow: FlowController, acks: AckWatermark, seq: int, normalized: list[NormalizedLog], last: AbstractIncomingMessage
+) -> None:
+    started = time.perf_counter()
+    ok = True
+    try:
+        await store_logs(normalized, source="rabbitmq")
+        logger.debug("Ingested batch of %d logs", len(normalized))
+    except Exception as e:
+        ok = False
+        logger.warning("Upsert batch failed (%d logs): %s", len(normalized), e)
+    await flow.release(time.perf_counter() - started, ok)
+    try:
+        await acks.complete(seq, last, ok)
+    except Exception as e:
+        logger.warning("Ack/nack batch lỗi: %s", e)
+    finally:
+        flow.queue.task_done()  # Cho stop_consumer: queue.join() xong khi mọi batch đã ghi + ack
+
+
+async def _flow_loop(channel: AbstractChannel, flow: FlowController) -> None:
+    """Điều chỉnh concurrency theo chu kỳ, đổi prefetch của channel khi cần."""
+    while True:
+        await asyncio.sleep(settings.flow_adjust_interval_ms / 1000)
+        if not await flow.adjust():
+            continue
+        logger.info("Flow control: concurrency=%d prefetch=%d", flow.concurrency, flow.prefetch)
+        try:
+            await channel.set_qos(prefetch_count=flow.prefetch, global_=True)
+        except Exception as e:
+            logger.warning("Không đổi được prefetch: %s", e)
+
+
 async def consume_loop() -> None:
-    """Kết nối RabbitMQ, consume queue INCIDENT_TRIAGE_LOGS. Mỗi message = 1 log JSON → xử lý → ghi Qdrant → ack."""
+    """
+    Kết nối RabbitMQ, consume queue INCIDENT_TRIAGE_LOGS: gom message thành batch → chuẩn hóa → hàng đợi
+    → ghi Qdrant song song (flow control AIMD) → ack theo thứ tự.
+    """
     url = (
         f"amqp://{settings.rabbitmq_username}:{settings.rabbitmq_password}"
         f"@{settings.rabbitmq_host}:{settings.rabbitmq_port}/"
     )
+    flow = get_flow()
     connection = await aio_pika.connect_robust(url)
     channel = await connection.channel()
-    await channel.set_qos(prefetch_count=settings.rabbitmq_prefetch_count)
+    # global_: giới hạn theo channel, đổi được lúc đang consume (per-consumer QoS chỉ áp cho consumer tạo sau)
+    await channel.set_qos(prefetch_count=flow.prefetch, global_=True)
 
     queue = await channel.declare_queue(
         settings.rabbitmq_queue_name,
         durable=True,
     )
-    client = get_client()
-    ensure_collection(client)
+    await ensure_collection(get_client())
+
+    if settings.rabbitmq_prefetch_max < settings.ingest_batch_size:
+        logger.warning(
+            "RABBITMQ_PREFETCH_MAX (%s) < INGEST_BATCH_SIZE (%s): batch sẽ chỉ flush theo deadline",
+            settings.rabbitmq_prefetch_max,
+            settings.ingest_batch_size,
+        )
+    acks = AckWatermark()
+    global _connection, _consumer, _batcher
+    _connection = connection
+    _batcher = batcher = MessageBatcher(
+        batch_size=settings.ingest_batch_size,
+        flush_interval=settings.ingest_flush_interval_ms / 1000,
+        flow=flow,
+        acks=acks,
+    )
 
     logger.info(
-        "RabbitMQ consumer started: queue=%s prefetch=%s",
+        "RabbitMQ consumer started: queue=%s prefetch=%s batch_size=%s flush_interval_ms=%s max_concurrency=%s",
         settings.rabbitmq_queue_name,
-        settings.rabbitmq_prefetch_count,
+        flow.prefetch,
+        settings.ingest_batch_size,
+        settings.ingest_flush_interval_ms,
+        settings.ingest_max_concurrency,
     )
 
-    async def on_message(message: AbstractIncomingMessage) -> None:
+    asyncio.create_task(_write_loop(flow, acks))
+    asyncio.create_task(_flow_loop(channel, flow))
+    _consumer = (queue, await queue.consume(batcher.add, no_ack=False))
+    logger.info("Consuming from queue %s (Ctrl+C to stop)", settings.rabbitmq_queue_name)
+    asyncio.create_task(_queue_depth_loop(channel))
+
+
+async def stop_consumer(timeout: float) -> None:
+    """
+    Graceful drain: ngừng nhận message, ghi + ack nốt các batch đã nhận rồi đóng kết nối. Quá `timeout` thì
+    đóng luôn; message chưa ack được broker giao lại cho consumer khác.
+    """
+    global _consumer, _connection
+    if _consumer is not None:
+        queue, tag = _consumer
+        _consumer = None
         try:
-            body = message.body.decode("utf-8")
-            raw_dict = json.loads(body)
-            raw = RawLog.model_validate(raw_dict)
-            norm = normalize_log(raw, payload_json=body)
-            upsert_logs(client, [norm])
-            await message.ack()
-            logger.debug("Ingested log id=%s order_no=%s", norm.id, norm.order_no)
+            await queue.cancel(tag)
         except Exception as e:
-            logger.warning("Skip invalid log: %s", e, exc_info=False)
-            await message.nack(requeue=False)
+            logger.warning("Không hủy được consumer: %s", e)
+    flow = get_flow()
+    deadline = time.monotonic() + timeout
+    try:
+        if _batcher is not None:
+            await asyncio.wait_for(_batcher.flush(), timeout)
+        await asyncio.wait_for(flow.queue.join(), max(0.0, deadline - time.monotonic()))
+        logger.info("RabbitMQ consumer drained")
+    except asyncio.TimeoutError:
+        logger.warning("Drain quá %ss: %d batch chưa ghi xong, broker sẽ giao lại", timeout, flow.queue.qsize() + len(_writes))
+    if _connection is not None:
+        await _connection.close()
+        _connection = None
 
-    await queue.consume(on_message, no_ack=False)
-    logger.info("Consuming from queue %s (Ctrl+C to stop)", settings.rabbitmq_queue_name)
+
+async def _queue_depth_loop(channel: AbstractChannel) -> None:
+    """Cập nhật gauge số message chờ trong queue (declare passive) cho metrics consumer lag."""
+    while True:
+        try:
+            queue = await channel.declare_queue(settings.rabbitmq_queue_name, passive=True)
+            metrics.QUEUE_DEPTH.set(queue.declaration_result.message_count or 0)
+        except Exception as e:
+            logger.debug("Không lấy được độ sâu queue: %s", e)
+        await asyncio.sleep(15)
@@ -0,0 +1,170 @@
+"""
+Retention: xóa log cũ khỏi Qdrant theo batch nhỏ, có nghỉ giữa các batch để không tranh tài nguyên với ingest.
+
+- Mặc định giữ RETENTION_DAYS ngày (0 = tắt).
+- RETENTION_RULES (JSON) cho thời hạn riêng theo field, rule đầu tiên khớp quyết định, vd giữ log lỗi lâu hơn:
+    RETENTION_RULES='[{"field": "resp_code", "values": ["OK", "00"], "negate": true, "days": 90}]'
+- Rollup theo phút (QDRANT_ROLLUP_COLLECTION) giữ ROLLUP_RETENTION_DAYS ngày theo `minute` (0 = giữ mãi).
+- Xóa xong có thể kích hoạt optimize segment (vacuum điểm đã xóa) qua update_collection.
+
+Chạy định kỳ trong consumer (RETENTION_INTERVAL_S) hoặc tay:
+
+    python -m app.retention [--dry-run]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchAny,
+    MatchExcept,
+    OptimizersConfigDiff,
+    PointIdsList,
+    Range,
+)
+
+from .config import RetentionRule, settings
+from .vector_store import close_client, get_client
+
+logger = logging.getLogger(__name__)
+
+_DAY_MS = 86_400_000
+
+
+def _rule_condition(rule: RetentionRule) -> FieldCondition:
+    if rule.negate:
+        return FieldCondition(key=rule.field, match=MatchExcept(**{"except": rule.values}))
+    return FieldCondition(key=rule.field, match=MatchAny(any=rule.values))
+
+
+def retention_filters(now_ms: int | None = None) -> list[tuple[str, int, Filter]]:
+    """
+    (tên, số ngày giữ, filter các log đã quá hạn) cho từng rule + mặc định. Log thuộc rule đầu tiên khớp,
+    nên filter của rule i loại các log khớp rule đứng trước, filter mặc định loại log khớp bất kỳ rule nào.
+    """
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    rules = settings.retention_rules
+    result: list[tuple[str, int, Filter]] = []
+    for i, rule in enumerate(rules):
+        cutoff = FieldCondition(key="timestamp", range=Range(lt=now_ms - rule.days * _DAY_MS))
+        earlier = [_rule_condition(r) for r in rules[:i]]
+        name = f"{rule.field}{'!=' if rule.negate else '='}{'|'.join(rule.values)}"
+        result.append((name, rule.days, Filter(must=[cutoff, _rule_condition(rule)], must_not=earlier or None)))
+    if settings.retention_days > 0:
+        cutoff = FieldCondition(key="timestamp", range=Range(lt=now_ms - settings.retention_days * _DAY_MS))
+        others = [_rule_condition(r) for r in rules]
+        result.append(("default", settings.retention_days, Filter(must=[cutoff], must_not=others or None)))
+    return [r for r in result if r[1] > 0]
+
+
+def rollup_retention_filter(now_ms: int | None = None) -> Filter | None:
+    """Filter các bucket rollup quá ROLLUP_RETENTION_DAYS (None nếu tắt rollup hoặc giữ mãi)."""
+    if not settings.rollup_enabled or settings.rollup_retention_days <= 0:
+        return None
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    cutoff = now_ms - settings.rollup_retention_days * _DAY_MS
+    return Filter(must=[FieldCondition(key="minute", range=Range(lt=cutoff))])
+
+
+async def _delete_expired(client: AsyncQdrantClient, collection: str, flt: Filter, budget: int) -> int:
+    """Xóa tối đa `budget` point khớp filter: scroll id theo batch → delete theo id, nghỉ giữa các batch."""
+    deleted = 0
+    while deleted < budget:
+        points, _ = await client.scroll(
+            collection_name=collection,
+            scroll_filter=flt,
+            limit=min(settings.retention_batch_size, budget - deleted),
+            with_payload=False,
+            with_vectors=False,
+        )
+        if not points:
+            break
+        await client.delete(
+            collection_name=collection,
+            points_selector=PointIdsList(points=[p.id for p in points]),
+            wait=True,
+        )
+        deleted += len(points)
+        await asyncio.sleep(settings.retention_batch_pause_ms / 1000)
+    return deleted
+
+
+async def _optimize(client: AsyncQdrantClient, collection: str) -> None:
+    # Cập nhật optimizer config buộc Qdrant đánh giá lại segment → vacuum các point đã xóa
+    await client.update_collection(
+        collection_name=collection,
+        optimizers_config=OptimizersConfigDiff(deleted_threshold=settings.retention_vacuum_threshold),
+    )
+
+
+async def run_retention(client: AsyncQdrantClient, dry_run: bool = False) -> dict[str, Any]:
+    """1 lượt retention; trả về số point đã xóa (hoặc sẽ xóa nếu dry_run) theo từng policy."""
+    started = time.perf_counter()
+    report: dict[str, Any] = {"policies": {}, "deleted": 0, "optimized": False}
+    budget = settings.retention_max_deletes_per_run
+    for name, days, flt in retention_filters():
+        if dry_run:
+            count = await client.count(collection_name=settings.qdrant_collection, count_filter=flt, exact=True)
+            report["policies"][name] = {"days": days, "expired": count.count}
+            continue
+        deleted = await _delete_expired(client, settings.qdrant_collection, flt, budget - report["deleted"])
+        report["policies"][name] = {"days": days, "deleted": deleted}
+        report["deleted"] += deleted
+        if report["deleted"] >= budget:
+            break  # Phần còn lại để lượt sau
+    logs_deleted = report["deleted"]
+
+    rollup_filter = rollup_retention_filter()
+    collection = settings.qdrant_rollup_collection
+    if rollup_filter is not None and report["deleted"] < budget and await client.collection_exists(collection):
+        days = settings.rollup_retention_days
+        if dry_run:
+            count = await client.count(collection_name=collection, count_filter=rollup_filter, exact=True)
+            report["policies"]["rollups"] = {"days": days, "expired": count.count}
+        else:
+            deleted = await _delete_expired(client, collection, rollup_filter, budget - report["deleted"])
+            report["policies"]["rollups"] = {"days": days, "deleted": deleted}
+            report["deleted"] += deleted
+            if deleted and settings.retention_optimize:
+                await _optimize(client, collection)
+                report["optimized"] = True
+
+    if logs_deleted and settings.retention_optimize:
+        await _optimize(client, settings.qdrant_collection)
+        report["optimized"] = True
+    report["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+async def retention_loop() -> None:
+    """Chạy retention định kỳ trong consumer."""
+    while True:
+        await asyncio.sleep(settings.retention_interval_s)
+        try:
+            report = await run_retention(get_client())
+            if report["deleted"]:
+                logger.info("Retention: %s", report)
+        except Exception as e:
+            logger.warning("Retention lỗi (thử lại lượt sau): %s", e)
+
+
+async def _main(dry_run: bool) -> None:
+    try:
+        print(json.dumps(await run_retention(get_client(), dry_run=dry_run), ensure_ascii=False))
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Xóa log / rollup quá hạn retention khỏi Qdrant.")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm số point quá hạn")
+    asyncio.run(_main(parser.parse_args().dry_run))
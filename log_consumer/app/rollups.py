@@ -0,0 +1,210 @@
+"""
+Rollup theo phút cho từng (merchant_id, module, operation): số log, đếm theo resp_code / status,
+sketch latency (processing_time_ms). Cập nhật O(1) mỗi log khi ghi, giữ trong RAM và flush định kỳ
+sang collection QDRANT_ROLLUP_COLLECTION để Triage BE trả lời "merchant X có đang lỗi nhiều hơn bình thường?"
+bằng O(số bucket) thay vì scroll log.
+
+Mỗi bucket trong RAM có point id riêng (uuid4) và luôn ghi đè trạng thái đầy đủ của nó, nên nhiều
+process/instance (hoặc bucket tạo lại sau khi đã evict) không ghi đè lẫn nhau; BE cộng dồn khi query.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+import uuid
+from typing import Any
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    IntegerIndexParams,
+    KeywordIndexParams,
+    PayloadSchemaType,
+    PointStruct,
+    VectorParams,
+)
+
+from .config import settings
+from .schemas import NormalizedLog
+from .vector_store import get_client
+
+logger = logging.getLogger(__name__)
+
+_MINUTE_MS = 60_000
+ROLLUP_INDEXES: dict[str, Any] = {
+    "minute": IntegerIndexParams(type=PayloadSchemaType.INTEGER, lookup=False, range=True),
+    "merchant_id": KeywordIndexParams(type=PayloadSchemaType.KEYWORD),
+    "module": KeywordIndexParams(type=PayloadSchemaType.KEYWORD),
+    "operation": KeywordIndexParams(type=PayloadSchemaType.KEYWORD),
+}
+
+
+class LatencySketch:
+    """Histogram bucket theo log (kiểu DDSketch): sai số tương đối ~accuracy, kích thước O(log(max/min))."""
+
+    __slots__ = ("accuracy", "_log_gamma", "bins")
+
+    def __init__(self, accuracy: float) -> None:
+        self.accuracy = accuracy
+        self._log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+        self.bins: dict[int, int] = {}
+
+    def add(self, value_ms: float) -> None:
+        # Bin 0 cho giá trị < 1ms, bin i>0 chứa (gamma^(i-2), gamma^(i-1)]
+        idx = 0 if value_ms < 1 else math.ceil(math.log(value_ms) / self._log_gamma) + 1
+        self.bins[idx] = self.bins.get(idx, 0) + 1
+
+    def to_payload(self) -> dict[str, Any]:
+        keys = sorted(self.bins)
+        return {"a": self.accuracy, "i": keys, "n": [self.bins[k] for k in keys]}
+
+
+class RollupBucket:
+    __slots__ = ("minute", "merchant_id", "module", "operation", "point_id", "count", "resp_codes", "statuses",
+                 "latency_count", "sum_ms", "max_ms", "sketch", "dirty")
+
+    def __init__(self, minute: int, merchant_id: str, module: str, operation: str) -> None:
+        self.minute = minute
+        self.merchant_id = merchant_id
+        self.module = module
+        self.operation = operation
+        self.point_id = str(uuid.uuid4())
+        self.count = 0
+        self.resp_codes: dict[str, int] = {}
+        self.statuses: dict[str, int] = {}
+        self.latency_count = 0
+        self.sum_ms = 0
+        self.max_ms = 0
+        self.sketch = LatencySketch(settings.rollup_sketch_accuracy)
+        self.dirty = True
+
+    def add(self, log: NormalizedLog) -> None:
+        self.count += 1
+        self.resp_codes[log.resp_code] = self.resp_codes.get(log.resp_code, 0) + 1
+        self.statuses[log.status] = self.statuses.get(log.status, 0) + 1
+        ms = log.processing_time_ms
+        if ms is not None and ms >= 0:
+            self.latency_count += 1
+            self.sum_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self.sketch.add(ms)
+        self.dirty = True
+
+    def to_point(self) -> PointStruct:
+        return PointStruct(
+            id=self.point_id,
+            vector=[0.0],
+            payload={
+                "minute": self.minute,
+                "merchant_id": self.merchant_id,
+                "module": self.module,
+                "operation": self.operation,
+                "count": self.count,
+                "resp_codes": self.resp_codes,
+                "statuses": self.statuses,
+                "latency_count": self.latency_count,
+                "sum_ms": self.sum_ms,
+                "max_ms": self.max_ms,
+                "sketch": self.sketch.to_payload(),
+            },
+        )
+
+
+class RollupStore:
+    """Các bucket theo (phút, merchant_id, module, operation) còn trong cửa sổ ROLLUP_WINDOW_MINUTES."""
+
+    def __init__(self) -> None:
+        self._buckets: dict[tuple[int, str, str, str], RollupBucket] = {}
+        self.observed = 0
+
+    def observe(self, logs: list[NormalizedLog]) -> None:
+        for log in logs:
+            if log.timestamp <= 0:
+                continue
+            minute = log.timestamp - log.timestamp % _MINUTE_MS
+            key = (minute, log.merchant_id, log.module, log.operation)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = RollupBucket(*key)
+            bucket.add(log)
+        self.observed += len(logs)
+
+    def dirty_points(self) -> tuple[list[RollupBucket], list[PointStruct]]:
+        buckets = [b for b in self._buckets.values() if b.dirty]
+        points = [b.to_point() for b in buckets]
+        for b in buckets:
+            b.dirty = False
+        return buckets, points
+
+    def evict(self, now_ms: int) -> int:
+        """Bỏ khỏi RAM các bucket đã flush và cũ hơn cửa sổ; log trễ tới sau đó tạo bucket (point) mới."""
+        oldest = now_ms - settings.rollup_window_minutes * _MINUTE_MS
+        old = [k for k, b in self._buckets.items() if k[0] < oldest and not b.dirty]
+        for key in old:
+            del self._buckets[key]
+        return len(old)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+_store: RollupStore | None = None
+_collection_ready = False
+
+
+def get_rollups() -> RollupStore | None:
+    """None nếu ROLLUP_ENABLED=false."""
+    global _store
+    if _store is None and settings.rollup_enabled:
+        _store = RollupStore()
+    return _store
+
+
+async def ensure_rollup_collection(client: AsyncQdrantClient) -> None:
+    global _collection_ready
+    if _collection_ready:
+        return
+    if not await client.collection_exists(settings.qdrant_rollup_collection):
+        await client.create_collection(
+            collection_name=settings.qdrant_rollup_collection,
+            vectors_config=VectorParams(size=1, distance=Distance.DOT),
+        )
+    info = await client.get_collection(settings.qdrant_rollup_collection)
+    for field, params in ROLLUP_INDEXES.items():
+        if field not in (info.payload_schema or {}):
+            await client.create_payload_index(
+                collection_name=settings.qdrant_rollup_collection, field_name=field, field_schema=params, wait=True
+            )
+    _collection_ready = True
+
+
+async def flush_rollups(client: AsyncQdrantClient) -> int:
+    """Ghi các bucket thay đổi từ lần flush trước; lỗi thì đánh dấu lại để lần sau ghi tiếp."""
+    global _collection_ready
+    store = get_rollups()
+    if store is None:
+        return 0
+    buckets, points = store.dirty_points()
+    if points:
+        try:
+            await ensure_rollup_collection(client)
+            await client.upsert(collection_name=settings.qdrant_rollup_collection, points=points, wait=True)
+        except Exception:
+            for b in buckets:
+                b.dirty = True
+            _collection_ready = False
+            raise
+    store.evict(int(time.time() * 1000))
+    return len(points)
+
+
+async def rollup_flush_loop() -> None:
+    """Flush định kỳ (ROLLUP_FLUSH_INTERVAL_S)."""
+    while True:
+        await asyncio.sleep(settings.rollup_flush_interval_s)
+        try:
+            await flush_rollups(get_client())
+        except Exception as e:
+            logger.warning("Flush rollup lỗi (thử lại lượt sau): %s", e)
@@ -0,0 +1,304 @@
+"""
+Spool WAL trên disk: nhận log đã chuẩn hóa khi Qdrant lỗi hoặc chậm (quá SPOOL_WRITE_TIMEOUT_S), để message
+RabbitMQ vẫn được ack ngay và /ingest không trả 500; replayer chạy nền ghi lại vào Qdrant theo batch lớn.
+
+- File segment append-only `<seq>.seg` trong SPOOL_DIR, sang segment mới khi vượt SPOOL_SEGMENT_BYTES.
+  Mỗi record: độ dài (u32) + crc32 (u32) + JSON của NormalizedLog.
+- SPOOL_FSYNC: `always` (fsync mỗi lần append, trước khi ack), `interval` (mỗi SPOOL_FSYNC_INTERVAL_MS),
+  `never` (để OS tự flush).
+- Đọc bằng mmap; vị trí đã replay lưu ở file `cursor`, segment đọc xong bị xóa.
+- Tổng dung lượng giới hạn bởi SPOOL_MAX_BYTES: đầy thì append lỗi (SpoolFull) như khi không có spool.
+- Khởi động lại: record ghi dở ở cuối segment cuối (crash giữa chừng) bị cắt bỏ, phần chưa replay được đọc tiếp.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from . import metrics
+from .config import settings
+from .schemas import NormalizedLog
+
+try:
+    import orjson
+except ImportError:  # orjson là optional, fallback json chuẩn (như normalizer)
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<II")  # độ dài payload, crc32 payload
+_SUFFIX = ".seg"
+_CURSOR = "cursor"
+
+
+def _dumps(obj: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(body: bytes) -> dict:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+class SpoolFull(Exception):
+    """Spool đã dùng hết SPOOL_MAX_BYTES."""
+
+
+class Spool:
+    def __init__(self, directory: str, segment_bytes: int, max_bytes: int, fsync: str) -> None:
+        self._dir = Path(directory)
+        self._segment_bytes = segment_bytes
+        self._max_bytes = max_bytes
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        self._sizes: dict[int, int] = {}  # seq -> số byte hợp lệ (đã ghi xong)
+        self._maps: dict[int, mmap.mmap] = {}
+        self._fd: int | None = None  # fd segment đang ghi
+        self._active = 0
+        self._cursor = (0, 0)  # (seq, offset) record kế tiếp cần replay
+        self._dirty = False  # Có dữ liệu chưa fsync (policy interval)
+        self.pending = 0  # Số record chưa replay
+        self.spooled = 0
+        self.replayed = 0
+
+    # --- khởi động / đóng ---
+
+    def open(self) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        seqs = sorted(int(p.stem) for p in self._dir.glob(f"*{_SUFFIX}"))
+        self._cursor = self._load_cursor(seqs)
+        for seq in seqs:
+            path = self._path(seq)
+            if seq < self._cursor[0]:
+                path.unlink()  # Đã replay xong trước khi crash nhưng chưa kịp xóa
+                continue
+            size = path.stat().st_size
+            start = self._cursor[1] if seq == self._cursor[0] else 0
+            valid, count = self._scan(path, start, size)
+            if valid < size:
+                logger.warning("Spool: cắt %d byte hỏng ở cuối %s", size - valid, path.name)
+                os.truncate(path, valid)
+            self._sizes[seq] = valid
+            self.pending += count
+        self._active = max(self._sizes, default=self._cursor[0])
+        if self._cursor[0] not in self._sizes:
+            self._cursor = (self._active, 0)
+        self._open_active()
+        if self.pending:
+            logger.info("Spool: %d log chưa replay trong %s", self.pending, self._dir)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+            for m in self._maps.values():
+                m.close()
+            self._maps.clear()
+
+    def _path(self, seq: int) -> Path:
+        return self._dir / f"{seq:012d}{_SUFFIX}"
+
+    def _load_cursor(self, seqs: list[int]) -> tuple[int, int]:
+        try:
+            data = json.loads((self._dir / _CURSOR).read_text())
+            return int(data["segment"]), int(data["offset"])
+        except FileNotFoundError:
+            return (seqs[0] if seqs else 0), 0
+
+    def _save_cursor(self) -> None:
+        tmp = self._dir / f"{_CURSOR}.tmp"
+        tmp.write_text(json.dumps({"segment": self._cursor[0], "offset": self._cursor[1]}))
+        os.replace(tmp, self._dir / _CURSOR)
+
+    @staticmethod
+    def _scan(path: Path, start: int, size: int) -> tuple[int, int]:
+        """(offset cuối cùng còn hợp lệ, số record hợp lệ) từ `start`."""
+        if size <= start:
+            return start, 0
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            pos, count = start, 0
+            while pos + _HEADER.size <= size:
+                length, crc = _HEADER.unpack_from(m, pos)
+                end = pos + _HEADER.size + length
+                if end > size or zlib.crc32(m[pos + _HEADER.size : end]) != crc:
+                    break
+                pos, count = end, count + 1
+            return pos, count
+
+    def _open_active(self) -> None:
+        self._fd = os.open(self._path(self._active), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._sizes.setdefault(self._active, 0)
+
+    # --- ghi ---
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values()) - self._cursor[1]
+
+    def append(self, logs: list[NormalizedLog]) -> None:
+        """Ghi 1 batch bằng 1 lần write (và fsync nếu SPOOL_FSYNC=always)."""
+        parts = []
+        for log in logs:
+            body = _dumps(log.model_dump())
+            parts.append(_HEADER.pack(len(body), zlib.crc32(body)))
+            parts.append(body)
+        data = b"".join(parts)
+        with self._lock:
+            if self.total_bytes + len(data) > self._max_bytes:
+                raise SpoolFull(f"Spool đầy ({self.total_bytes} bytes, SPOOL_MAX_BYTES={self._max_bytes})")
+            if self._sizes[self._active] and self._sizes[self._active] + len(data) > self._segment_bytes:
+                self._roll()
+            os.write(self._fd, data)
+            if self._fsync == "always":
+                os.fsync(self._fd)
+            else:
+                self._dirty = True
+            self._sizes[self._active] += len(data)
+            self.pending += len(logs)
+            self.spooled += len(logs)
+
+    def _roll(self) -> None:
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._active += 1
+        self._open_active()
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._dirty and self._fd is not None:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    # --- đọc / replay ---
+
+    def _map(self, seq: int) -> mmap.mmap | None:
+        """mmap của segment, map lại nếu segment đang ghi đã dài thêm."""
+        size = self._sizes.get(seq, 0)
+        m = self._maps.get(seq)
+        if m is not None and len(m) >= size:
+            return m
+        if m is not None:
+            m.close()
+        if size == 0:
+            return None
+        with open(self._path(seq), "rb") as f:
+            m = self._maps[seq] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def read(self, max_records: int) -> tuple[list[NormalizedLog], tuple[int, int]]:
+        """Tối đa max_records log từ cursor; trả kèm vị trí sau record cuối (truyền lại cho commit)."""
+        with self._lock:
+            seq, pos = self._cursor
+            logs: list[NormalizedLog] = []
+            while len(logs) < max_records:
+                size = self._sizes.get(seq, 0)
+                if pos + _HEADER.size > size:
+                    if seq >= self._active:
+                        break
+                    seq, pos = seq + 1, 0  # Hết segment đã đóng → segment kế tiếp
+                    continue
+                m = self._map(seq)
+                length, crc = _HEADER.unpack_from(m, pos)
+                body = m[pos + _HEADER.size : pos + _HEADER.size + length]
+                if len(body) != length or zlib.crc32(body) != crc:
+                    logger.error("Spool: record hỏng ở %s offset %d, bỏ phần còn lại của segment", self._path(seq).name, pos)
+                    pos = size
+                    continue
+                logs.append(NormalizedLog.model_construct(**_loads(body)))
+                pos += _HEADER.size + length
+            return logs, (seq, pos)
+
+    def commit(self, position: tuple[int, int], count: int) -> None:
+        """Đánh dấu đã replay tới `position`, xóa các segment đã đọc hết."""
+        with self._lock:
+            self._cursor = position
+            self.pending = max(0, self.pending - count)
+            if position == (self._active, self._sizes[self._active]):
+                self.pending = 0  # Đã đọc hết (kể cả khi có record hỏng bị bỏ qua)
+            self.replayed += count
+            for seq in [s for s in self._sizes if s < position[0]]:
+                m = self._maps.pop(seq, None)
+                if m is not None:
+                    m.close()
+                del self._sizes[seq]
+                self._path(seq).unlink(missing_ok=True)
+            self._save_cursor()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": self.pending,
+            "bytes": self.total_bytes,
+            "segments": len(self._sizes),
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+        }
+
+
+_spool: Spool | None = None
+
+
+def get_spool() -> Spool | None:
+    """None nếu không đặt SPOOL_DIR."""
+    global _spool
+    if _spool is None and settings.spool_dir:
+        spool = Spool(settings.spool_dir, settings.spool_segment_bytes, settings.spool_max_bytes, settings.spool_fsync)
+        spool.open()
+        _spool = spool
+    return _spool
+
+
+def close_spool() -> None:
+    global _spool
+    if _spool is not None:
+        _spool.close()
+        _spool = None
+
+
+async def spool_append(spool: Spool, logs: list[NormalizedLog]) -> None:
+    await asyncio.to_thread(spool.append, logs)
+
+
+async def replay_loop() -> None:
+    """Ghi log trong spool vào Qdrant theo batch SPOOL_REPLAY_BATCH_SIZE; lỗi thì lùi dần (1s → 30s) rồi thử lại."""
+    from .embedder import embed_texts_async
+    from .vector_store import get_client, upsert_logs
+
+    spool = get_spool()
+    backoff = 1.0
+    last_sync = time.monotonic()
+    while spool is not None:
+        if settings.spool_fsync == "interval" and time.monotonic() - last_sync >= settings.spool_fsync_interval_ms / 1000:
+            await asyncio.to_thread(spool.sync)
+            last_sync = time.monotonic()
+        if not spool.pending:
+            await asyncio.sleep(0.2)
+            continue
+        logs, position = await asyncio.to_thread(spool.read, settings.spool_replay_batch_size)
+        if not logs:
+            await asyncio.to_thread(spool.commit, position, 0)  # Chỉ có record hỏng bị bỏ qua
+            continue
+        started = time.perf_counter()
+        try:
+            vectors = await embed_texts_async([n.text for n in logs])
+            await upsert_logs(get_client(), logs, vectors)
+        except Exception as e:
+            metrics.SPOOL_REPLAY_ERRORS.inc()
+            logger.warning("Spool: replay %d log lỗi (thử lại sau %.0fs): %s", len(logs), backoff, e)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+            continue
+        backoff = 1.0
+        await asyncio.to_thread(spool.commit, position, len(logs))
+        metrics.SPOOL_REPLAY_SECONDS.observe(time.perf_counter() - started)
+        metrics.LOGS_TOTAL.labels("spool", "written").inc(len(logs))
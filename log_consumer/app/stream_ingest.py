@@ -0,0 +1,138 @@
+"""
+Ingest NDJSON theo stream (mỗi dòng 1 log JSON): đọc body từng chunk, validate + chuẩn hóa từng dòng,
+ghi Qdrant theo chunk cố định trong khi phần còn lại vẫn đang upload. Bộ nhớ chỉ phụ thuộc
+chunk size × số chunk đang ghi, không phụ thuộc kích thước body.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator
+
+from . import metrics
+from .config import settings
+from .normalizer import normalize_bytes
+from .pipeline import store_logs
+from .schemas import NormalizedLog
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[tuple[int, int, bytes | None]]:
+    """
+    Tách stream bytes thành dòng. Yield (line_no, byte_offset, line); line=None nếu dòng dài quá
+    max_line_bytes (phần thừa bị bỏ qua tới newline kế tiếp, không giữ trong bộ nhớ).
+    """
+    buf = bytearray()
+    buf_offset = 0  # offset (byte) của buf[0] trong body
+    line_no = 0
+    skipping = False
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl == -1:
+                break
+            if skipping:
+                skipping = False
+            else:
+                line_no += 1
+                yield line_no, buf_offset + start, bytes(buf[start:nl]) if nl - start <= max_line_bytes else None
+            start = nl + 1
+        del buf[:start]
+        buf_offset += start
+        if len(buf) > max_line_bytes:
+            if not skipping:
+                line_no += 1
+                yield line_no, buf_offset, None
+                skipping = True
+            buf_offset += len(buf)
+            buf.clear()
+    if buf and not skipping:
+        line_no += 1
+        yield line_no, buf_offset, bytes(buf)
+
+
+async def ingest_ndjson(chunks: AsyncIterator[bytes]) -> dict[str, Any]:
+    """Ingest body NDJSON, trả về số dòng, số log đã ghi, số log lặp đã bỏ, số lỗi kèm line/offset (tối đa INGEST_STREAM_MAX_ERRORS)."""
+    chunk_size = max(1, settings.ingest_stream_chunk_size)
+    max_inflight = max(1, settings.ingest_stream_max_inflight)
+    result: dict[str, Any] = {"lines": 0, "ingested": 0, "duplicates": 0, "invalid": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+    def add_error(line_no: int, offset: int, error: str, **extra: Any) -> None:
+        if len(result["errors"]) < settings.ingest_stream_max_errors:
+            result["errors"].append({"line": line_no, "offset": offset, "error": error[:300], **extra})
+        else:
+            result["errors_truncated"] = True
+
+    # task ghi chunk -> (dòng đầu, offset dòng đầu, dòng cuối, số log)
+    inflight: dict[asyncio.Task, tuple[int, int, int, int]] = {}
+
+    async def write(batch: list[NormalizedLog]) -> int | Exception:
+        try:
+            return await store_logs(batch, source="stream")
+        except Exception as e:
+            logger.warning("Stream ingest chunk failed (%d logs): %s", len(batch), e)
+            return e
+
+    def collect(done: set[asyncio.Task]) -> None:
+        for task in done:
+            first_line, first_offset, last_line, size = inflight.pop(task)
+            written = task.result()
+            if isinstance(written, Exception):
+                result["failed"] += size
+                add_error(first_line, first_offset, f"Ghi Qdrant thất bại: {written}", to_line=last_line)
+            else:
+                result["ingested"] += written
+                result["duplicates"] += size - written
+
+    async def submit(batch: list[NormalizedLog], first_line: int, first_offset: int, last_line: int) -> None:
+        # Giới hạn số chunk đang ghi: đọc body tiếp chỉ khi còn slot → bộ nhớ phẳng, có backpressure
+        while len(inflight) >= max_inflight:
+            done, _ = await asyncio.wait(inflight.keys(), return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+        task = asyncio.create_task(write(batch))
+        inflight[task] = (first_line, first_offset, last_line, len(batch))
+
+    batch: list[NormalizedLog] = []
+    first_line = first_offset = last_line = 0
+    normalize_s = 0.0  # Cộng dồn theo chunk, observe 1 lần mỗi chunk thay vì mỗi dòng
+    async for line_no, offset, line in iter_ndjson_lines(chunks, settings.ingest_stream_max_line_bytes):
+        result["lines"] = line_no
+        if line is None:
+            result["invalid"] += 1
+            add_error(line_no, offset, f"Dòng dài hơn {settings.ingest_stream_max_line_bytes} bytes")
+            continue
+        if not line.strip():
+            continue
+        started = time.perf_counter()
+        try:
+            norm = normalize_bytes(line.strip())
+        except Exception as e:
+            result["invalid"] += 1
+            add_error(line_no, offset, str(e))
+            continue
+        finally:
+            normalize_s += time.perf_counter() - started
+        if not batch:
+            first_line, first_offset = line_no, offset
+        batch.append(norm)
+        last_line = line_no
+        if len(batch) >= chunk_size:
+            metrics.STAGE["normalize"].observe(normalize_s)
+            normalize_s = 0.0
+            await submit(batch, first_line, first_offset, line_no)
+            batch = []
+    if batch:
+        metrics.STAGE["normalize"].observe(normalize_s)
+        await submit(batch, first_line, first_offset, last_line)
+    if result["invalid"]:
+        metrics.LOGS_TOTAL.labels("stream", "invalid").inc(result["invalid"])
+    if inflight:
+        done, _ = await asyncio.wait(inflight.keys())
+        collect(done)
+    return result
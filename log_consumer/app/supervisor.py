@@ -0,0 +1,126 @@
+"""
+Chạy CONSUMER_WORKERS process consumer trên 1 host (main.py khi CONSUMER_WORKERS > 1): chuẩn hóa / validate
+pydantic tốn CPU nên 1 process chỉ dùng được 1 core. Mỗi worker là 1 app uvicorn đầy đủ với channel RabbitMQ
+và Qdrant client riêng, cùng consume INCIDENT_TRIAGE_LOGS (broker chia message theo prefetch).
+
+- HTTP: supervisor bind socket 1 lần; CONSUMER_HTTP=one chỉ worker 0 nhận kết nối, `all` thì mọi worker
+  (kernel chia kết nối). Worker không phục vụ HTTP vẫn chạy startup/shutdown hook (consumer, spool, rollup...).
+- Mỗi worker có spool (SPOOL_DIR/worker-<i>) và snapshot dedup (<path>.worker-<i>) riêng;
+  retention và phát hiện bất thường chỉ chạy ở worker 0 (detector đọc rollup đã cộng dồn của mọi worker).
+- Worker chết thì start lại (chết liên tục ngay sau khi start → đợi lâu dần, tối đa 60s).
+- SIGTERM/SIGINT: chuyển SIGTERM cho các worker, mỗi worker drain (ghi + ack nốt batch đã nhận) rồi thoát;
+  quá CONSUMER_DRAIN_TIMEOUT_S (+ thời gian shutdown) thì kill.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.process import BaseProcess
+
+import uvicorn
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_APP = "app.main:app"
+_HEALTHY_AFTER_S = 30  # Worker sống quá thời gian này thì reset backoff
+_MAX_BACKOFF_S = 60
+
+
+def _worker_main(worker_id: int, sock: socket.socket | None) -> None:
+    """Entry point của process worker (spawn): đặt cấu hình riêng của worker trước khi import app."""
+    settings.consumer_worker_id = worker_id
+    if settings.spool_dir:
+        settings.spool_dir = os.path.join(settings.spool_dir, f"worker-{worker_id}")
+    if settings.dedup_snapshot_path:
+        settings.dedup_snapshot_path = f"{settings.dedup_snapshot_path}.worker-{worker_id}"
+    config = uvicorn.Config(
+        _APP,
+        host="0.0.0.0",
+        port=settings.http_port,
+        timeout_graceful_shutdown=int(settings.consumer_drain_timeout_s),
+    )
+    # sockets=[]: không listen nhưng vẫn chạy lifespan (startup/shutdown hook)
+    uvicorn.Server(config).run(sockets=[sock] if sock is not None else [])
+
+
+class Supervisor:
+    def __init__(self, workers: int, http_all: bool) -> None:
+        self._workers = workers
+        self._http_all = http_all
+        self._ctx = multiprocessing.get_context("spawn")
+        self._sock: socket.socket | None = None
+        self._procs: dict[int, BaseProcess] = {}
+        self._started: dict[int, float] = {}
+        self._backoff: dict[int, float] = {}
+        self._restart_at: dict[int, float] = {}
+        self._stopping = False
+
+    def _start(self, worker_id: int) -> None:
+        sock = self._sock if worker_id == 0 or self._http_all else None
+        proc = self._ctx.Process(target=_worker_main, args=(worker_id, sock), name=f"log-consumer-{worker_id}")
+        proc.start()
+        self._procs[worker_id] = proc
+        self._started[worker_id] = time.monotonic()
+        logger.info("Worker %d started (pid %s, http=%s)", worker_id, proc.pid, sock is not None)
+
+    def _check(self) -> None:
+        """Start lại worker đã thoát; chết ngay sau khi start thì đợi backoff (nhân đôi mỗi lần)."""
+        now = time.monotonic()
+        for worker_id, proc in list(self._procs.items()):
+            if proc.is_alive():
+                if now - self._started[worker_id] > _HEALTHY_AFTER_S:
+                    self._backoff.pop(worker_id, None)
+                continue
+            if worker_id not in self._restart_at:
+                delay = 0.0
+                if now - self._started[worker_id] < _HEALTHY_AFTER_S:
+                    delay = self._backoff.get(worker_id, settings.consumer_restart_backoff_s)
+                    self._backoff[worker_id] = min(delay * 2, _MAX_BACKOFF_S)
+                logger.warning("Worker %d thoát (exit %s), start lại sau %.0fs", worker_id, proc.exitcode, delay)
+                self._restart_at[worker_id] = now + delay
+            if now >= self._restart_at[worker_id]:
+                del self._restart_at[worker_id]
+                proc.close()
+                self._start(worker_id)
+
+    def _on_signal(self, signum: int, frame) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        config = uvicorn.Config(_APP, host="0.0.0.0", port=settings.http_port)
+        self._sock = config.bind_socket()
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        for worker_id in range(self._workers):
+            self._start(worker_id)
+        while not self._stopping:
+            self._check()
+            time.sleep(0.5)
+        self.stop()
+
+    def stop(self) -> None:
+        logger.info("Dừng %d worker (drain tối đa %ss)", len(self._procs), settings.consumer_drain_timeout_s)
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        # Mỗi worker: HTTP graceful shutdown rồi drain consumer, mỗi bước tối đa CONSUMER_DRAIN_TIMEOUT_S
+        deadline = time.monotonic() + 2 * settings.consumer_drain_timeout_s + 10
+        for worker_id, proc in self._procs.items():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.warning("Worker %d chưa thoát sau drain timeout, kill", worker_id)
+                proc.kill()
+                proc.join()
+        if self._sock is not None:
+            self._sock.close()
+
+
+def run_workers() -> None:
+    logging.basicConfig(level=logging.INFO)
+    Supervisor(settings.consumer_workers, settings.consumer_http == "all").run()
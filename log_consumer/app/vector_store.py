@@ -1,31 +1,120 @@
 """Ingest và query cơ bản với Qdrant."""
 from __future__ import annotations
 
+import logging
+import time
 import uuid
 from typing import Any
 
-from qdrant_client import QdrantClient
+import httpx
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http.exceptions import UnexpectedResponse
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client.models import (
+    Distance,
+    IntegerIndexParams,
+    KeywordIndexParams,
+    PayloadSchemaType,
+    PointStruct,
+    TextIndexParams,
+    TokenizerType,
+    VectorParams,
+)
 
+from . import metrics
 from .config import settings
+from .payload_codec import CODEC_NONE, compress_payload
 from .schemas import NormalizedLog
 
-VECTOR_SIZE = 1  # Dummy size khi chưa dùng embedding; filter bằng payload
+logger = logging.getLogger(__name__)
 
+VECTOR_SIZE = 1  # Dummy size khi EMBEDDING_BACKEND=none; filter bằng payload
 
-def get_client() -> QdrantClient:
-    return QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port)
+# Schema payload index (khai báo): field -> params. Thêm field mới ở đây, startup sẽ tự tạo index còn thiếu.
+_KEYWORD_INDEX = KeywordIndexParams(type=PayloadSchemaType.KEYWORD, on_disk=settings.qdrant_payload_index_on_disk)
+PAYLOAD_INDEXES: dict[str, Any] = {
+    "order_no": _KEYWORD_INDEX,
+    "order_id": _KEYWORD_INDEX,
+    "merchant_id": _KEYWORD_INDEX,
+    "request_id": _KEYWORD_INDEX,
+    "trace_id": _KEYWORD_INDEX,
+    "resp_code": _KEYWORD_INDEX,
+    "status": _KEYWORD_INDEX,  # Dùng cho retention rule
+    # timestamp chỉ cần range filter / order_by, không cần lookup theo giá trị
+    "timestamp": IntegerIndexParams(
+        type=PayloadSchemaType.INTEGER,
+        lookup=False,
+        range=True,
+        is_principal=True,
+        on_disk=settings.qdrant_payload_index_on_disk,
+    ),
+    # Full-text cho POST /search, /triage theo log_snippet / error_message của Triage Backend.
+    # Tokenizer word tách `key=value` và responseMessage thành từ (lowercase): respCode=504 → respcode, 504
+    "text": TextIndexParams(
+        type=PayloadSchemaType.TEXT,
+        tokenizer=TokenizerType.WORD,
+        min_token_len=2,
+        max_token_len=40,
+        lowercase=True,
+        on_disk=settings.qdrant_payload_index_on_disk,
+    ),
+}
 
+_client: AsyncQdrantClient | None = None
+# Cache trạng thái "collection đã sẵn sàng": chỉ kiểm tra lại sau khi có lỗi khi gọi Qdrant
+_collection_ready = False
 
-def ensure_collection(client: QdrantClient, vector_size: int = VECTOR_SIZE) -> None:
-    """Tạo collection nếu chưa có. Dùng vector size 1 (dummy) nếu chỉ filter metadata."""
+
+def get_client() -> AsyncQdrantClient:
+    """Client dùng chung cho cả app (tạo 1 lần, giữ connection pool keep-alive)."""
+    global _client
+    if _client is None:
+        _client = AsyncQdrantClient(
+            host=settings.qdrant_host,
+            port=settings.qdrant_port,
+            timeout=settings.qdrant_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.qdrant_max_connections,
+                max_keepalive_connections=settings.qdrant_max_connections,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Đóng client dùng chung (gọi khi shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    mark_collection_stale()
+
+
+def mark_collection_stale() -> None:
+    """Bỏ cache collection ready: lần gọi ensure_collection sau sẽ kiểm tra lại với Qdrant."""
+    global _collection_ready
+    _collection_ready = False
+
+
+async def ensure_collection(client: AsyncQdrantClient, vector_size: int | None = None) -> None:
+    """Tạo collection nếu chưa có, vector size theo embedder (1 nếu EMBEDDING_BACKEND=none)."""
+    global _collection_ready
+    if _collection_ready:
+        return
     from qdrant_client.http import models as rest
+    from .embedder import get_embedder
+    if vector_size is None:
+        vector_size = get_embedder().dim
+    existing_indexes: dict[str, Any] = {}
     try:
-        client.get_collection(settings.qdrant_collection)
+        info = await client.get_collection(settings.qdrant_collection)
+        existing_indexes = dict(info.payload_schema or {})
     except Exception:
+        info = None
+    if info is not None:
+        _check_vector_size(info, vector_size)
+    else:
         try:
-            client.create_collection(
+            await client.create_collection(
                 collection_name=settings.qdrant_collection,
                 vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
                 optimizers_config=rest.OptimizersConfigDiff(default_segment_number=1),
@@ -36,9 +125,53 @@ def ensure_collection(client: QdrantClient, vector_size: int = VECTOR_SIZE) -> N
         except Exception as e:
             if "already exists" not in str(e).lower() and "409" not in str(e):
                 raise
+    await ensure_payload_indexes(client, existing_indexes)
+    _collection_ready = True
+
+
+def _check_vector_size(info: Any, vector_size: int) -> None:
+    """Collection cũ (vd. vector dummy size 1) không dùng được với embedder hiện tại: báo lỗi rõ ràng."""
+    params = info.config.params.vectors
+    current = getattr(params, "size", None)
+    if current is not None and current != vector_size:
+        raise RuntimeError(
+            f"Collection {settings.qdrant_collection} có vector size {current}, embedder cần {vector_size}. "
+            "Đổi QDRANT_COLLECTION sang collection mới (hoặc xóa collection cũ) rồi ingest lại, "
+            "hoặc đặt EMBEDDING_BACKEND=none để giữ vector dummy."
+        )
 
 
-def _to_point_id(record_id: str):
+async def ensure_payload_indexes(client: AsyncQdrantClient, existing: dict[str, Any] | None = None) -> list[str]:
+    """
+    Migration nhỏ: tạo các payload index trong PAYLOAD_INDEXES mà collection còn thiếu (idempotent).
+    Trả về danh sách field vừa được tạo index.
+    """
+    if existing is None:
+        info = await client.get_collection(settings.qdrant_collection)
+        existing = dict(info.payload_schema or {})
+    created = []
+    for field, params in PAYLOAD_INDEXES.items():
+        current = existing.get(field)
+        if current is not None:
+            if current.data_type != params.type:
+                logger.warning(
+                    "Payload index %s có kiểu %s, schema khai báo %s; cần tạo lại thủ công",
+                    field, current.data_type, params.type,
+                )
+            continue
+        await client.create_payload_index(
+            collection_name=settings.qdrant_collection,
+            field_name=field,
+            field_schema=params,
+            wait=True,
+        )
+        created.append(field)
+    if created:
+        logger.info("Created payload indexes on %s: %s", settings.qdrant_collection, ", ".join(created))
+    return created
+
+
+def to_point_id(record_id: str):
     """Qdrant chỉ chấp nhận point id là UUID hoặc unsigned int. Tạo UUID từ record_id (deterministic)."""
     return uuid.uuid5(uuid.NAMESPACE_OID, record_id)
 
@@ -47,7 +180,7 @@ def payload_to_point(norm: NormalizedLog, vector: list[float] | None = None) ->
     """Chuyển NormalizedLog thành PointStruct cho Qdrant."""
     if vector is None:
         vector = [0.0] * VECTOR_SIZE  # dummy vector
-    point_id = _to_point_id(norm.id)
+    point_id = to_point_id(norm.id)
     payload: dict[str, Any] = {
         "request_id": norm.request_id,
         "order_no": norm.order_no,
@@ -63,59 +196,71 @@ def payload_to_point(norm: NormalizedLog, vector: list[float] | None = None) ->
         "timestamp": norm.timestamp,
         "processing_time_ms": norm.processing_time_ms,
         "text": norm.text,
-        "payload": norm.payload,
     }
+    # Payload gốc lưu nén (payload_z + payload_codec), chỉ giải nén khi cần xem chi tiết
+    codec, data = compress_payload(norm.payload)
+    if codec == CODEC_NONE:
+        payload["payload"] = data
+    else:
+        payload["payload_z"] = data
+        payload["payload_codec"] = codec
     if norm.amount is not None:
         payload["amount"] = norm.amount
     return PointStruct(id=str(point_id), vector=vector, payload=payload)
 
 
-def upsert_logs(client: QdrantClient, normalized: list[NormalizedLog]) -> None:
-    """Ghi danh sách NormalizedLog vào Qdrant."""
+async def upsert_logs(
+    client: AsyncQdrantClient,
+    normalized: list[NormalizedLog],
+    vectors: list[list[float]] | None = None,
+) -> None:
+    """Ghi danh sách NormalizedLog (kèm vector embedding nếu có) vào Qdrant."""
     if not normalized:
         return
-    ensure_collection(client)
-    points = [payload_to_point(n) for n in normalized]
-    client.upsert(collection_name=settings.qdrant_collection, points=points)
+    await ensure_collection(client)
+    started = time.perf_counter()
+    if vectors is None:
+        points = [payload_to_point(n) for n in normalized]
+    else:
+        points = [payload_to_point(n, v) for n, v in zip(normalized, vectors)]
+    built = time.perf_counter()
+    metrics.STAGE["build_points"].observe(built - started)
+    try:
+        await client.upsert(collection_name=settings.qdrant_collection, points=points)
+    except Exception:
+        mark_collection_stale()
+        raise
+    finally:
+        metrics.QDRANT_UPSERT.observe(time.perf_counter() - built)
 
 
-def search_by_order_no(client: QdrantClient, order_no: str, limit: int = 50) -> list[dict[str, Any]]:
-    """Tìm logs theo order_no (metadata filter)."""
+async def _scroll_by(client: AsyncQdrantClient, key: str, value: str, limit: int) -> list[dict[str, Any]]:
     from qdrant_client.models import Filter, FieldCondition, MatchValue
-    ensure_collection(client)
-    results = client.scroll(
-        collection_name=settings.qdrant_collection,
-        scroll_filter=Filter(must=[FieldCondition(key="order_no", match=MatchValue(value=order_no))]),
-        limit=limit,
-        with_payload=True,
-        with_vectors=False,
-    )
-    return [dict(payload or {}) for _, payload in results[0]]
-
-
-def search_by_merchant_id(client: QdrantClient, merchant_id: str, limit: int = 50) -> list[dict[str, Any]]:
+    await ensure_collection(client)
+    try:
+        results, _ = await client.scroll(
+            collection_name=settings.qdrant_collection,
+            scroll_filter=Filter(must=[FieldCondition(key=key, match=MatchValue(value=value))]),
+            limit=limit,
+            with_payload=True,
+            with_vectors=False,
+        )
+    except Exception:
+        mark_collection_stale()
+        raise
+    return [dict(p.payload or {}) for p in results]
+
+
+async def search_by_order_no(client: AsyncQdrantClient, order_no: str, limit: int = 50) -> list[dict[str, Any]]:
+    """Tìm logs theo order_no (metadata filter)."""
+    return await _scroll_by(client, "order_no", order_no, limit)
+
+
+async def search_by_merchant_id(client: AsyncQdrantClient, merchant_id: str, limit: int = 50) -> list[dict[str, Any]]:
     """Tìm logs theo merchant_id."""
-    from qdrant_client.models import Filter, FieldCondition, MatchValue
-    ensure_collection(client)
-    results = client.scroll(
-        collection_name=settings.qdrant_collection,
-        scroll_filter=Filter(must=[FieldCondition(key="merchant_id", match=MatchValue(value=merchant_id))]),
-        limit=limit,
-        with_payload=True,
-        with_vectors=False,
-    )
-    return [dict(payload or {}) for _, payload in results[0]]
-
-
-def search_by_request_id(client: QdrantClient, request_id: str, limit: int = 50) -> list[dict[str, Any]]:
+    return await _scroll_by(client, "merchant_id", merchant_id, limit)
+
+
+async def search_by_request_id(client: AsyncQdrantClient, request_id: str, limit: int = 50) -> list[dict[str, Any]]:
     """Tìm logs theo request_id."""
-    from qdrant_client.models import Filter, FieldCondition, MatchValue
-    ensure_collection(client)
-    results = client.scroll(
-        collection_name=settings.qdrant_collection,
-        scroll_filter=Filter(must=[FieldCondition(key="request_id", match=MatchValue(value=request_id))]),
-        limit=limit,
-        with_payload=True,
-        with_vectors=False,
-    )
-    return [dict(payload or {}) for _, payload in results[0]]
+    return await _scroll_by(client, "request_id", request_id, limit)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Backfill log lịch sử trực tiếp vào Qdrant (không qua HTTP/RabbitMQ).
+
+- Đọc file JSONL (mỗi dòng 1 log) hoặc JSON array, kể cả .gz, theo chunk.
+- Chuẩn hóa + embed trong process pool (normalize_many, embed_texts).
+- Upload song song theo chunk (gRPC nếu được, fallback REST).
+- Ghi checkpoint sau mỗi chunk để chạy lại thì resume; cuối cùng in throughput.
+
+    python backfill.py logs/2026-02-*.jsonl.gz --workers 8 --uploaders 4 --checkpoint backfill.ckpt.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Iterator
+
+from qdrant_client import QdrantClient
+
+from app.config import settings
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("backfill")
+
+
+def _open(path: Path) -> IO[bytes]:
+    return gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb")
+
+
+def iter_lines(path: Path, skip: int) -> Iterator[bytes]:
+    """Từng log (bytes JSON) trong file, bỏ qua `skip` log đầu (resume)."""
+    stem = path.name[:-3] if path.suffix == ".gz" else path.name
+    with _open(path) as f:
+        if stem.endswith(".json"):
+            # JSON array phải load cả file; file lớn nên dùng JSONL
+            items = json.load(f)
+            lines: Iterator[bytes] = (json.dumps(item, ensure_ascii=False).encode("utf-8") for item in items)
+        else:
+            lines = (line for line in f if line.strip())
+        for i, line in enumerate(lines):
+            if i >= skip:
+                yield line
+
+
+def iter_chunks(lines: Iterator[bytes], size: int) -> Iterator[list[bytes]]:
+    chunk: list[bytes] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def prepare_chunk(lines: list[bytes]) -> tuple[list, int]:
+    """Chạy trong process worker: chuẩn hóa + embed + tạo PointStruct. Trả về (points, số log lỗi)."""
+    from app.embedder import embed_texts
+    from app.normalizer import normalize_many
+    from app.vector_store import payload_to_point
+
+    normalized = [n for n in normalize_many(lines) if not isinstance(n, Exception)]
+    vectors = embed_texts([n.text for n in normalized])
+    points = [payload_to_point(n, v) for n, v in zip(normalized, vectors)]
+    return points, len(lines) - len(normalized)
+
+
+class Checkpoint:
+    """Số log đã ghi xong (liên tục từ đầu file) cho từng file; ghi atomically ra JSON."""
+
+    def __init__(self, path: Path | None) -> None:
+        self._path = path
+        self.files: dict[str, dict] = {}
+        if path and path.exists():
+            self.files = json.loads(path.read_text(encoding="utf-8")).get("files", {})
+
+    def lines_done(self, file: Path) -> int:
+        return int(self.files.get(str(file), {}).get("lines_done", 0))
+
+    def is_done(self, file: Path) -> bool:
+        return bool(self.files.get(str(file), {}).get("done"))
+
+    def update(self, file: Path, lines_done: int, done: bool = False) -> None:
+        self.files[str(file)] = {"lines_done": lines_done, "done": done}
+        if self._path is None:
+            return
+        tmp = self._path.with_suffix(self._path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"files": self.files}, indent=1), encoding="utf-8")
+        os.replace(tmp, self._path)
+
+
+def make_client(prefer_grpc: bool) -> QdrantClient:
+    """Client đồng bộ cho upload song song (thread-safe). gRPC nếu kết nối được, nếu không dùng REST."""
+    if prefer_grpc:
+        client = QdrantClient(
+            host=settings.qdrant_host,
+            port=settings.qdrant_port,
+            grpc_port=settings.qdrant_grpc_port,
+            prefer_grpc=True,
+            timeout=settings.qdrant_timeout,
+        )
+        try:
+            client.get_collections()
+            logger.info("Upload qua gRPC %s:%s", settings.qdrant_host, settings.qdrant_grpc_port)
+            return client
+        except Exception as e:
+            logger.warning("gRPC không dùng được (%s), chuyển sang REST", e)
+            client.close()
+    return QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port, timeout=settings.qdrant_timeout)
+
+
+async def _ensure_collection() -> None:
+    from app.vector_store import close_client, ensure_collection, get_client
+    try:
+        await ensure_collection(get_client())
+    finally:
+        await close_client()
+
+
+def backfill_file(
+    path: Path,
+    client: QdrantClient,
+    workers: ProcessPoolExecutor,
+    uploaders: ThreadPoolExecutor,
+    checkpoint: Checkpoint,
+    chunk_size: int,
+    window: int,
+) -> tuple[int, int]:
+    """Backfill 1 file; trả về (số log đã ghi, số log lỗi)."""
+    start_line = checkpoint.lines_done(path)
+    if start_line:
+        logger.info("%s: resume từ log thứ %d", path, start_line)
+    ingested = invalid = 0
+    lines_done = start_line
+    # Mỗi chunk: future chuẩn hóa (process) → future upload (thread). Giữ tối đa `window` chunk
+    # đang xử lý và commit checkpoint theo đúng thứ tự chunk.
+    pending: deque[tuple[int, Future, Future | None]] = deque()
+
+    def drain(block_until: int) -> None:
+        nonlocal ingested, invalid, lines_done
+        while len(pending) > block_until:
+            size, prep, upload = pending.popleft()
+            points, bad = prep.result()
+            if upload is not None:
+                upload.result()
+            ingested += len(points)
+            invalid += bad
+            lines_done += size
+            checkpoint.update(path, lines_done)
+
+    def submit_upload(prep: Future) -> Future | None:
+        points, _ = prep.result()
+        if not points:
+            return None
+        return uploaders.submit(client.upsert, collection_name=settings.qdrant_collection, points=points, wait=True)
+
+    prepared: deque[tuple[int, Future]] = deque()
+    for chunk in iter_chunks(iter_lines(path, start_line), chunk_size):
+        prepared.append((len(chunk), workers.submit(prepare_chunk, chunk)))
+        # Chunk đã chuẩn hóa xong ở đầu hàng → đẩy sang upload
+        while prepared and (prepared[0][1].done() or len(prepared) > window):
+            size, prep = prepared.popleft()
+            pending.append((size, prep, submit_upload(prep)))
+        drain(block_until=window)
+    while prepared:
+        size, prep = prepared.popleft()
+        pending.append((size, prep, submit_upload(prep)))
+    drain(block_until=0)
+    checkpoint.update(path, lines_done, done=True)
+    return ingested, invalid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill log (JSONL/JSON, .gz) trực tiếp vào Qdrant.")
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Số process chuẩn hóa + embed")
+    parser.add_argument("--uploaders", type=int, default=4, help="Số upload song song tới Qdrant")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Số log mỗi chunk (mỗi lần upsert)")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="File checkpoint để resume")
+    parser.add_argument("--no-grpc", action="store_true", help="Chỉ dùng REST")
+    args = parser.parse_args()
+
+    asyncio.run(_ensure_collection())
+    client = make_client(prefer_grpc=not args.no_grpc)
+    checkpoint = Checkpoint(args.checkpoint)
+    window = max(2, args.workers + args.uploaders)
+
+    started = time.perf_counter()
+    total_ingested = total_invalid = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as workers, ThreadPoolExecutor(max_workers=args.uploaders) as uploaders:
+        for path in args.files:
+            if checkpoint.is_done(path):
+                logger.info("%s: đã backfill xong (checkpoint), bỏ qua", path)
+                continue
+            file_started = time.perf_counter()
+            ingested, invalid = backfill_file(path, client, workers, uploaders, checkpoint, args.chunk_size, window)
+            elapsed = time.perf_counter() - file_started
+            logger.info("%s: %d log, %d lỗi, %.1fs (%.0f log/s)", path, ingested, invalid, elapsed, ingested / max(elapsed, 1e-9))
+            total_ingested += ingested
+            total_invalid += invalid
+    client.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        json.dumps(
+            {
+                "files": len(args.files),
+                "ingested": total_ingested,
+                "invalid": total_invalid,
+                "elapsed_s": round(elapsed, 2),
+                "logs_per_s": round(total_ingested / max(elapsed, 1e-9), 1),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
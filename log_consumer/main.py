@@ -2,4 +2,8 @@ import uvicorn
 from app.config import settings
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=settings.http_port)
+    if settings.consumer_workers > 1:
+        from app.supervisor import run_workers
+        run_workers()
+    else:
+        uvicorn.run("app.main:app", host="0.0.0.0", port=settings.http_port)
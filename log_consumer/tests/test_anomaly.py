@@ -0,0 +1,42 @@
+from app.anomaly import AnomalyDetector
+
+_MINUTE_MS = 60_000
+_KEY = ("M1", "/pay", "")
+
+
+def _warm(detector: AnomalyDetector, minutes: int, count: int = 100) -> None:
+    for m in range(minutes):
+        assert detector.observe_window(_KEY, m * _MINUTE_MS, count, 1 + m % 2, count, count * 100) is None
+
+
+def test_aggregated_window_fires_on_error_spike():
+    detector = AnomalyDetector(from_rollups=True)
+    _warm(detector, 12)
+    incident = detector.observe_window(_KEY, 12 * _MINUTE_MS, 100, 40, 100, 100 * 100)
+    assert incident is not None
+    assert incident["count"] == 100 and incident["errors"] == 40
+    assert [s["kind"] for s in incident["signals"]] == ["error_rate"]
+    assert incident["triage_request"]["from_ts"] == 12 * _MINUTE_MS
+    assert list(detector.incidents) == [incident]
+
+
+def test_thresholds_apply_to_aggregated_counts():
+    detector = AnomalyDetector(from_rollups=True)
+    _warm(detector, 12, count=30)
+    # Dưới ANOMALY_MIN_COUNT log trong phút: không đánh giá dù tỉ lệ lỗi cao
+    assert detector.observe_window(_KEY, 12 * _MINUTE_MS, 10, 8, 10, 1_000) is None
+    assert detector.observe_window(_KEY, 13 * _MINUTE_MS, 30, 20, 30, 3_000) is not None
+
+
+def test_latency_spike_and_cooldown():
+    detector = AnomalyDetector(from_rollups=True)
+    _warm(detector, 12)
+    first = detector.observe_window(_KEY, 12 * _MINUTE_MS, 100, 1, 100, 100 * 900)
+    assert first is not None and [s["kind"] for s in first["signals"]] == ["latency"]
+    # Cùng key trong ANOMALY_COOLDOWN_MINUTES: không báo lại
+    assert detector.observe_window(_KEY, 13 * _MINUTE_MS, 100, 1, 100, 100 * 900) is None
+
+
+def test_count_errors_matches_success_codes():
+    detector = AnomalyDetector()
+    assert detector.count_errors({"00": 5, "ok": 2, "E51": 3, "": 4, "99": 1}) == 4
@@ -0,0 +1,48 @@
+from app.dedup import RecentIds
+
+
+def test_claim_commit_marks_seen():
+    recent = RecentIds(capacity=10)
+    keys, is_new = recent.claim(["a", "b"])
+    assert is_new == [True, True]
+    recent.commit(keys)
+    _, is_new = recent.claim(["a", "c"])
+    assert is_new == [False, True]
+    assert recent.stats()["hits"] == 1 and recent.stats()["misses"] == 3
+
+
+def test_pending_claim_blocks_parallel_batch():
+    recent = RecentIds(capacity=10)
+    keys, _ = recent.claim(["a"])
+    _, is_new = recent.claim(["a"])  # Batch song song cùng id trong lúc batch đầu đang ghi
+    assert is_new == [False]
+    recent.commit(keys)
+    assert recent.stats()["pending"] == 0 and recent.stats()["size"] == 1
+
+
+def test_release_allows_retry():
+    recent = RecentIds(capacity=10)
+    keys, _ = recent.claim(["a", "b"])
+    recent.release(keys)
+    _, is_new = recent.claim(["a", "b"])
+    assert is_new == [True, True]
+
+
+def test_lru_evicts_oldest():
+    recent = RecentIds(capacity=2)
+    for log_id in ("a", "b"):
+        recent.commit(recent.claim([log_id])[0])
+    recent.claim(["a"])  # Hit → "a" mới dùng gần nhất, "b" bị đẩy ra trước
+    recent.commit(recent.claim(["c"])[0])
+    _, is_new = recent.claim(["a", "b", "c"])
+    assert is_new == [False, True, False]
+
+
+def test_snapshot_round_trip(tmp_path):
+    recent = RecentIds(capacity=10)
+    recent.commit(recent.claim(["a", "b"])[0])
+    path = tmp_path / "dedup.snapshot"
+    recent.save(path)
+    restored = RecentIds(capacity=10)
+    assert restored.load(path) == 2
+    assert restored.claim(["a", "b", "c"])[1] == [False, False, True]
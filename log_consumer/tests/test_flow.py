@@ -0,0 +1,125 @@
+import asyncio
+
+from app.flow import FlowController
+from app.rabbitmq_consumer import AckWatermark
+
+
+class _Message:
+    def __init__(self, tag: int, calls: list) -> None:
+        self.tag = tag
+        self._calls = calls
+
+    async def ack(self, multiple: bool = False) -> None:
+        self._calls.append(("ack", self.tag, multiple))
+
+    async def nack(self, multiple: bool = False, requeue: bool = True) -> None:
+        self._calls.append(("nack", self.tag, multiple))
+
+
+def test_ack_watermark_holds_out_of_order_batches():
+    async def run():
+        calls: list = []
+        acks = AckWatermark()
+        seqs = [acks.register() for _ in range(4)]
+        await acks.complete(seqs[2], _Message(30, calls), True)
+        await acks.complete(seqs[1], _Message(20, calls), True)
+        assert calls == []  # Batch 0 chưa xong: ack multiple lúc này sẽ phủ cả batch 0
+        await acks.complete(seqs[0], _Message(10, calls), True)
+        assert calls == [("ack", 30, True)]  # 3 batch liền nhau → 1 lần ack
+        await acks.complete(seqs[3], _Message(40, calls), True)
+        assert calls[-1] == ("ack", 40, True)
+
+    asyncio.run(run())
+
+
+def test_ack_watermark_failed_batch_is_nacked_in_order():
+    async def run():
+        calls: list = []
+        acks = AckWatermark()
+        seqs = [acks.register() for _ in range(3)]
+        await acks.complete(seqs[2], _Message(30, calls), True)
+        await acks.complete(seqs[1], _Message(20, calls), False)
+        await acks.complete(seqs[0], _Message(10, calls), True)
+        assert calls == [("ack", 10, True), ("nack", 20, True), ("ack", 30, True)]
+
+    asyncio.run(run())
+
+
+def _flow(**overrides) -> FlowController:
+    params = dict(
+        batch_size=100,
+        queue_batches=2,
+        max_concurrency=4,
+        min_prefetch=50,
+        max_prefetch=10_000,
+        target_latency_s=1.0,
+        max_error_rate=0.1,
+    )
+    params.update(overrides)
+    return FlowController(**params)
+
+
+async def _cycle(flow: FlowController, batches: int, latency_s: float, ok: bool = True, saturate: bool = True) -> bool:
+    """1 chu kỳ: `batches` lượt ghi đủ `concurrency` batch; saturate=True thì mỗi lượt có thêm 1 batch phải đợi slot."""
+    for _ in range(batches):
+        slots = flow.concurrency
+        for _ in range(slots):
+            await flow.acquire()
+        waiter = asyncio.ensure_future(flow.acquire()) if saturate else None
+        await asyncio.sleep(0)
+        for _ in range(slots):
+            await flow.release(latency_s, ok)
+        if waiter is not None:
+            await waiter
+            await flow.release(latency_s, ok)
+    return await flow.adjust()
+
+
+def test_flow_additive_increase_when_saturated():
+    async def run():
+        flow = _flow()
+        assert flow.concurrency == 1 and flow.prefetch == 300
+        assert await _cycle(flow, 2, 0.1)
+        assert flow.concurrency == 2 and flow.prefetch == 400
+        for _ in range(5):
+            await _cycle(flow, 2, 0.1)
+        assert flow.concurrency == 4  # Kẹp ở max_concurrency
+        assert flow.increases == 3
+
+    asyncio.run(run())
+
+
+def test_flow_no_increase_without_saturation_or_completions():
+    async def run():
+        flow = _flow()
+        await _cycle(flow, 3, 0.1, saturate=False)
+        assert flow.concurrency == 1
+        flow._saturated = True  # Hàng đợi đầy nhưng không batch nào ghi xong (Qdrant treo)
+        assert not await flow.adjust()
+        assert flow.concurrency == 1
+
+    asyncio.run(run())
+
+
+def test_flow_multiplicative_decrease_on_latency_or_errors():
+    async def run():
+        flow = _flow()
+        for _ in range(3):
+            await _cycle(flow, 2, 0.1)
+        assert flow.concurrency == 4
+        await _cycle(flow, 2, 2.0)  # Latency quá target
+        assert flow.concurrency == 2
+        await _cycle(flow, 2, 0.1, ok=False)  # Lỗi quá max_error_rate
+        assert flow.concurrency == 1 and flow.decreases == 2
+        await _cycle(flow, 2, 2.0)
+        assert flow.concurrency == 1  # Không giảm dưới 1
+        assert flow.stats()["error_rate"] == 0.0 and flow.stats()["latency_ms"] == 2000.0
+
+    asyncio.run(run())
+
+
+def test_prefetch_clamped():
+    flow = _flow(min_prefetch=500, max_prefetch=600)
+    assert flow.prefetch == 500
+    flow = _flow(max_prefetch=350)
+    assert flow._prefetch_for(4) == 350
@@ -0,0 +1,42 @@
+import asyncio
+
+from app.stream_ingest import iter_ndjson_lines
+
+
+def _lines(chunks: list[bytes], max_line_bytes: int) -> list[tuple[int, int, bytes | None]]:
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [item async for item in iter_ndjson_lines(source(), max_line_bytes)]
+
+    return asyncio.run(collect())
+
+
+def test_split_across_chunks_keeps_line_no_and_offset():
+    body = b'{"a":1}\n{"b":2}\n\n{"c":3}'
+    chunks = [body[i : i + 3] for i in range(0, len(body), 3)]
+    assert _lines(chunks, 100) == [
+        (1, 0, b'{"a":1}'),
+        (2, 8, b'{"b":2}'),
+        (3, 16, b""),
+        (4, 17, b'{"c":3}'),
+    ]
+
+
+def test_line_over_limit_in_single_chunk():
+    assert _lines([b"ok\n" + b"x" * 20 + b"\nok2\n"], 10) == [(1, 0, b"ok"), (2, 3, None), (3, 24, b"ok2")]
+
+
+def test_line_over_limit_across_chunks_is_skipped_without_buffering():
+    chunks = [b"first\nxxxxxxxx", b"xxxxxxxx", b"xxxx\nlast"]
+    assert _lines(chunks, 10) == [(1, 0, b"first"), (2, 6, None), (3, 27, b"last")]
+
+
+def test_line_at_limit_is_kept():
+    assert _lines([b"x" * 10 + b"\n", b"y" * 10], 10) == [(1, 0, b"x" * 10), (2, 11, b"y" * 10)]
+
+
+def test_unterminated_long_tail_is_reported_once():
+    assert _lines([b"a\n", b"z" * 15, b"z" * 15], 10) == [(1, 0, b"a"), (2, 2, None)]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra hashing embedder của Log Consumer (app/embedder.py, NumPy) và vector query của Triage Backend
+(app/text_query.py, Python thuần) cho ra cùng vector trên cùng text: 2 bản cài đặt riêng (mỗi service 1 image),
+lệch nhau thì tìm theo log_snippet và incident memory xếp hạng sai mà không báo lỗi.
+
+Text kiểm tra: `text` của log đã chuẩn hóa (file log, mặc định sample_logs_y20ki9r6.json, + 2000 log giả lập)
+và các query kiểu user gõ. Mỗi service chạy trong process riêng (cùng tên package `app`).
+
+    python scripts/check_embedding_parity.py [FILE] [--dim 384]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ROOT = SCRIPT_DIR.parent
+SAMPLE = SCRIPT_DIR / "sample_logs_y20ki9r6.json"
+
+_QUERIES = [
+    "callback timeout 504",
+    "Partner timeout after 30000ms",
+    "respCode=E51 status=FAILED",
+    "Lỗi kết nối tới đối tác, giao dịch thất bại",
+    "module=sb.MerchantProcessorInquiry   operation=/inquiry  key=  =value",
+    "ORDER_NO: Y20KI9R6; amount=12.5 — double charge?",
+    "",
+]
+
+
+def _consumer_texts(path: Path) -> list[str]:
+    sys.path.insert(0, str(ROOT / "log_consumer"))
+    sys.path.insert(0, str(ROOT / "benchmarks"))
+    from app.normalizer import normalize_many
+    from synth import synth_logs
+
+    text = path.read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    items += list(synth_logs(2000, error_rate=0.2))
+    return [n.text for n in normalize_many(items) if not isinstance(n, Exception)]
+
+
+def _side(name: str) -> None:
+    """Chạy trong process con: đọc list text (JSON) từ stdin, in list vector (None nếu vector 0)."""
+    texts = json.load(sys.stdin)
+    if name == "consumer":
+        sys.path.insert(0, str(ROOT / "log_consumer"))
+        from app.embedder import HashingEmbedder
+        from app.config import settings
+
+        matrix = HashingEmbedder(settings.embedding_dim).embed_batch(texts)
+        out = [row.tolist() if row.any() else None for row in matrix]
+    else:
+        sys.path.insert(0, str(ROOT / "triage_app" / "backend"))
+        from app.text_query import embed_query
+
+        out = [embed_query(t) for t in texts]
+    json.dump(out, sys.stdout)
+
+
+def _run(name: str, texts: list[str], dim: int) -> list:
+    env = {**os.environ, "EMBEDDING_BACKEND": "hashing", "EMBEDDING_DIM": str(dim)}
+    proc = subprocess.run(
+        [sys.executable, __file__, "--side", name],
+        input=json.dumps(texts), capture_output=True, text=True, env=env, check=True,
+    )
+    return json.loads(proc.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", default=str(SAMPLE))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--side", choices=["consumer", "backend"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.side:
+        _side(args.side)
+        return
+
+    texts = _consumer_texts(Path(args.file)) + _QUERIES
+    consumer = _run("consumer", texts, args.dim)
+    backend = _run("backend", texts, args.dim)
+    mismatches = 0
+    for text, a, b in zip(texts, consumer, backend):
+        # Consumer tính float32, backend float64
+        if (a is None) != (b is None) or (a is not None and max(abs(x - y) for x, y in zip(a, b)) > 1e-5):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Khác vector: {text[:120]!r}")
+    print(f"{len(texts)} text, dim={args.dim}, {mismatches} khác biệt")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra normalizer hiện tại (normalize_log, fast path normalize_bytes / normalize_many) cho ra đúng NormalizedLog
+như bản normalize_log đóng băng ở commit baseline (scripts/normalizer_baseline.py), trên một file log (JSON array
+hoặc JSONL) và các case biên dựng sẵn. Mặc định dùng sample_logs_y20ki9r6.json; log giả lập nhiều hơn:
+
+    python benchmarks/synth.py --logs 20000 --error-rate 0.2 -o /tmp/synth.jsonl
+    python scripts/check_normalizer_parity.py [FILE]
+"""
+import json
+import re
+import sys
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent / "log_consumer"))
+
+from app.normalizer import normalize_bytes, normalize_log, normalize_many  # noqa: E402
+from app.schemas import NormalizedLog, RawLog  # noqa: E402
+from normalizer_baseline import _get, normalize_log as baseline_normalize_log  # noqa: E402
+
+SAMPLE = SCRIPT_DIR / "sample_logs_y20ki9r6.json"
+
+# Case biên: thiếu data, alias key, errorCode fallback, số dạng string, khoảng trắng, id có ký tự lạ, unicode
+_EDGE_CASES = [
+    {"startTime": 1, "module": "m", "operation": "op"},
+    {"startTime": 2, "module": "m", "operation": "op", "data": None},
+    {"startTime": 3, "module": "m", "operation": "op", "requestId": "a/b c#1", "data": {"order_no": " X1 "}},
+    {"startTime": 4, "module": "m", "operation": "op", "data": {"responseCode": "05", "errorCode": "E9"}},
+    {"startTime": 5, "module": "m", "operation": "op", "data": {"errorCode": "E9", "respCode": "  "}},
+    {"startTime": 6, "module": "m", "operation": "op", "respCode": "99", "data": {"respCode": "00"}},
+    {"startTime": 7, "module": "m", "operation": "op", "data": {"amount": "12.5", "paidAmount": 3}},
+    {"startTime": 8, "module": "m", "operation": "op", "data": {"amount": "abc", "paidAmount": "7"}},
+    {"startTime": 9, "module": "m", "operation": "op", "data": {"responseMessage": "a\n\tb   c" + "x" * 600}},
+    {"startTime": 10, "module": "m", "operation": "op", "data": {"errorMessage": "Partner timeout"}},
+    {"startTime": 11, "module": "m", "operation": "op", "data": {"merchantId": 123, "status": "Thất bại"}},
+    {"startTime": 12, "module": "m", "operation": "op", "data": {"requestId": "from-data", "branch_code": "B1"}},
+]
+
+
+def _expected(line: str) -> NormalizedLog:
+    """Kết quả baseline + các thay đổi hành vi có chủ đích sau baseline (_EXPECTED_CHANGES)."""
+    data = json.loads(line)
+    expected = baseline_normalize_log(RawLog.model_validate(data), payload_json=line)
+    for change in _EXPECTED_CHANGES:
+        expected = change(data.get("data") if isinstance(data.get("data"), dict) else {}, expected)
+    return expected
+
+
+def _error_message_fallback(data: dict, log: NormalizedLog) -> NormalizedLog:
+    # [user-024] Không có responseMessage thì `response=` trong text lấy từ errorMessage
+    msg = _get(data, "errorMessage")
+    if msg and not _get(data, "responseMessage"):
+        response = re.sub(r"\s+", " ", msg)[:500]
+        return log.model_copy(update={"text": f"{log.text} response={response}"})
+    return log
+
+
+_EXPECTED_CHANGES = [_error_message_fallback]
+
+
+def _load_lines(path: Path) -> list[str]:
+    text = path.read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        return [json.dumps(item, ensure_ascii=False) for item in json.loads(text)]
+    return [line for line in text.splitlines() if line.strip()]
+
+
+def main():
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else SAMPLE
+    lines = _load_lines(path) + [json.dumps(item, ensure_ascii=False) for item in _EDGE_CASES]
+    batch = normalize_many([line.encode("utf-8") for line in lines])
+    mismatches = 0
+    for i, (line, fast_many) in enumerate(zip(lines, batch), 1):
+        try:
+            expected = _expected(line)
+        except Exception:
+            if not isinstance(fast_many, Exception):
+                mismatches += 1
+                print(f"Dòng {i}: baseline lỗi nhưng normalizer hiện tại không lỗi")
+            continue
+        current = normalize_log(RawLog.model_validate(json.loads(line)), payload_json=line)
+        if current != expected or normalize_bytes(line.encode("utf-8")) != expected or fast_many != expected:
+            mismatches += 1
+            print(f"Dòng {i}: khác kết quả\n  expected={expected}\n  current={current}\n  fast={fast_many}")
+    print(f"{len(lines)} log, {mismatches} khác biệt")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
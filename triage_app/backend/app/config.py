@@ -6,9 +6,38 @@ class Settings(BaseSettings):
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
     qdrant_collection: str = "payment_logs"
+    qdrant_rollup_collection: str = "payment_rollups"  # Rollup theo phút do Log Consumer ghi
+    qdrant_timeout: int = 10
+    qdrant_max_connections: int = 32  # Kích thước connection pool của client dùng chung
     triage_port: int = 8000
+    trace_expand_max_hops: int = 3  # Số vòng batch query tối đa khi mở rộng theo trace/request id
+    trace_expand_max_ids: int = 200  # Số id liên quan tối đa đưa vào 1 vòng query
+    trace_expand_limit: int = 1000  # Số log tối đa mỗi field mỗi vòng
+    # Tìm theo log_snippet / error_message: lọc full-text index `text`, xếp hạng cosine
+    embedding_backend: str = "hashing"  # Phải giống Log Consumer; khác hashing thì không xếp hạng (mới nhất trước)
+    embedding_dim: int = 256  # Phải giống EMBEDDING_DIM của Log Consumer
+    text_search_window_h: int = 24  # Không có from_ts/to_ts thì chỉ tìm trong N giờ gần nhất
+    text_search_min_match: float = 0.5  # Tỉ lệ token của query tối thiểu phải có trong log
+    text_search_max_tokens: int = 16
+    payload_zstd_dict_path: str | None = None  # Phải giống PAYLOAD_ZSTD_DICT_PATH của Log Consumer
     openai_api_key: str | None = None
     openai_model: str = "gpt-4o-mini"
+    openai_base_url: str | None = None  # Server tương thích OpenAI (vd fake LLM: http://localhost:8010/v1)
+    triage_max_logs: int = 200  # Số log tối đa lấy từ Vector DB cho 1 lần triage (trước khi gom nhóm)
+    llm_context_max_tokens: int = 3000  # Giới hạn token của phần context log gửi LLM
+    llm_slow_ms: int = 3000  # processing_time_ms từ mức này coi là chậm (ưu tiên đưa vào context)
+    success_resp_codes: str = "OK,00,0,SUCCESS"  # resp_code coi là thành công (phân tách bằng dấu phẩy)
+    # Incident memory: lưu kết quả triage kèm embedding signature log, sự cố giống thì dùng lại thay vì gọi LLM
+    incident_memory_enabled: bool = True
+    qdrant_memory_collection: str = "triage_memory"
+    incident_memory_threshold: float = 0.92  # Cosine tối thiểu để dùng lại
+    incident_memory_max_age_h: int = 168  # Chỉ dùng lại chẩn đoán trong N giờ gần nhất
+    triage_cache_ttl_s: float = 300  # Thời gian giữ kết quả triage (giây); 0 = tắt cache
+    triage_cache_max_entries: int = 1000
+
+    @property
+    def success_codes(self) -> set[str]:
+        return {c.strip().upper() for c in self.success_resp_codes.split(",") if c.strip()}
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,134 @@
+"""
+Fake LLM tương thích OpenAI (POST /v1/chat/completions, có stream=true) để test /triage, /triage/stream
+và đo time-to-first-byte khi không có mạng/API key. Output xác định: cùng prompt → cùng JSON, cùng nhịp token.
+
+    python -m app.fake_llm --port 8010 --first-token-ms 300 --token-ms 20
+    # .env của Triage Backend: OPENAI_API_KEY=fake, OPENAI_BASE_URL=http://localhost:8010/v1
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Fake LLM", version="0.1.0")
+app.state.first_token_ms = 300
+app.state.token_ms = 20
+
+_TOKEN_RE = re.compile(r"\s*\S{1,8}")
+_RULES = [
+    ("timeout", "Payment Timeout", "Đối tác xử lý quá thời gian chờ"),
+    ("callback", "Callback Failure", "Callback tới merchant thất bại"),
+    ("504", "Gateway Timeout", "Gateway trả 504 khi gọi đối tác"),
+    ("error", "Processing Error", "Module trả lỗi trong quá trình xử lý"),
+]
+
+
+def fake_answer(prompt: str) -> str:
+    """JSON triage xác định theo nội dung prompt (từ khóa đầu tiên khớp quyết định issue_type)."""
+    lower = prompt.lower()
+    issue_type, root_cause = "Unknown", "Không phát hiện lỗi rõ ràng trong log"
+    for keyword, kind, cause in _RULES:
+        if keyword in lower:
+            issue_type, root_cause = kind, cause
+            break
+    digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:4], 16)
+    modules = sorted(set(re.findall(r"module=(\S+)", prompt)))[:3]
+    return json.dumps(
+        {
+            "issue_type": issue_type,
+            "confidence": round(0.5 + (digest % 50) / 100, 2),
+            "root_cause": root_cause,
+            "evidence": [f"Log từ module {m}" for m in modules] or ["Không có log"],
+            "suggested_actions": ["Kiểm tra log chi tiết của đơn", "Đối soát với đối tác"],
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+
+
+def _prompt_of(body: dict[str, Any]) -> str:
+    return "\n".join(str(m.get("content") or "") for m in body.get("messages") or [])
+
+
+def _usage(prompt: str, answer: str) -> dict[str, int]:
+    prompt_tokens = len(_TOKEN_RE.findall(prompt))
+    completion_tokens = len(_TOKEN_RE.findall(answer))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+async def _stream(model: str, answer: str, usage: dict[str, int] | None = None) -> AsyncIterator[bytes]:
+    chunk_id = "chatcmpl-fake-" + hashlib.sha256(answer.encode("utf-8")).hexdigest()[:12]
+    created = int(time.time())
+
+    def event(delta: dict[str, Any], finish_reason: str | None = None) -> bytes:
+        chunk = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    await asyncio.sleep(app.state.first_token_ms / 1000)
+    yield event({"role": "assistant", "content": ""})
+    for i, token in enumerate(_TOKEN_RE.findall(answer)):
+        if i:
+            await asyncio.sleep(app.state.token_ms / 1000)
+        yield event({"content": token})
+    yield event({}, "stop")
+    if usage is not None:
+        # stream_options.include_usage: chunk cuối không có choices, chỉ có usage (như OpenAI)
+        chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [], "usage": usage}
+        yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+    yield b"data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model") or "fake"
+    prompt = _prompt_of(body)
+    answer = fake_answer(prompt)
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        usage = _usage(prompt, answer) if include_usage else None
+        return StreamingResponse(_stream(model, answer, usage), media_type="text/event-stream")
+    # Không stream: đợi tương đương thời gian sinh hết token
+    n_tokens = len(_TOKEN_RE.findall(answer))
+    await asyncio.sleep((app.state.first_token_ms + app.state.token_ms * max(0, n_tokens - 1)) / 1000)
+    return {
+        "id": "chatcmpl-fake-" + hashlib.sha256(answer.encode("utf-8")).hexdigest()[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, answer),
+    }
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake LLM server tương thích OpenAI (stream + non-stream).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--first-token-ms", type=int, default=300, help="Độ trễ trước token đầu tiên")
+    parser.add_argument("--token-ms", type=int, default=20, help="Độ trễ giữa các token")
+    args = parser.parse_args()
+    app.state.first_token_ms = args.first_token_ms
+    app.state.token_ms = args.token_ms
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Incident memory: lưu kết quả triage của LLM kèm embedding "signature" của log (collection
+QDRANT_MEMORY_COLLECTION). Trước khi gọi LLM, tìm chẩn đoán gần nhất; cosine ≥ INCIDENT_MEMORY_THRESHOLD
+(và chưa quá INCIDENT_MEMORY_MAX_AGE_H) thì dùng lại, kèm `reused_from` trỏ về chẩn đoán gốc.
+
+Signature không chứa id / số tiền / timestamp: chuỗi bước (module, operation, resp_code, status) theo thời gian
+(bỏ bước lặp liền nhau) + text lỗi (responseMessage trong log) + log_snippet / error_message của user, nên cùng
+1 kiểu lỗi ở đơn khác cho signature gần như giống hệt, còn cùng log nhưng user mô tả khác thì khác. Embedding dùng hashing vectorizer như text search (app/text_query.py).
+"""
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from typing import Any
+
+from qdrant_client.models import Distance, FieldCondition, Filter, PointStruct, Range, VectorParams
+
+from . import metrics
+from .config import settings
+from .schemas import MemoryRef, TriageResult
+from .text_query import embed_query
+from .vector_client import get_client
+
+logger = logging.getLogger(__name__)
+
+_MAX_STEPS = 50
+_MAX_ERRORS = 10
+_collection_ready = False
+
+
+def incident_signature(logs: list[dict[str, Any]], log_snippet: str | None, error_message: str | None) -> str:
+    """Chuỗi bước + text lỗi + snippet/error của user, dạng `key=value` (mỗi bước 1 dòng) cho hashing embedder."""
+    steps: list[str] = []
+    errors: dict[str, None] = {}
+    for log in sorted(logs, key=lambda h: h.get("timestamp") or 0):
+        step = " ".join(
+            f"{f}={log.get(f) or ''}" for f in ("module", "operation", "resp_code", "status")
+        )
+        if not steps or steps[-1] != step:
+            steps.append(step)
+        response = (log.get("text") or "").partition(" response=")[2].strip()
+        if response:
+            errors[response[:300]] = None
+    parts = steps[:_MAX_STEPS] + list(errors)[:_MAX_ERRORS]
+    if log_snippet:
+        parts.append(log_snippet[:1000])
+    if error_message:
+        parts.append(error_message[:500])
+    return "\n".join(parts)
+
+
+async def _ensure_collection() -> None:
+    global _collection_ready
+    if _collection_ready:
+        return
+    client = get_client()
+    if not await client.collection_exists(settings.qdrant_memory_collection):
+        await client.create_collection(
+            collection_name=settings.qdrant_memory_collection,
+            vectors_config=VectorParams(size=settings.embedding_dim, distance=Distance.COSINE),
+        )
+    _collection_ready = True
+
+
+def _enabled() -> bool:
+    return settings.incident_memory_enabled and settings.embedding_backend.lower() == "hashing"
+
+
+async def recall(signature: str) -> TriageResult | None:
+    """Chẩn đoán cũ giống nhất vượt ngưỡng (kèm reused_from), None nếu không có / memory lỗi."""
+    global _collection_ready
+    vector = embed_query(signature) if _enabled() and signature else None
+    if vector is None:
+        return None
+    since = int(time.time() * 1000) - settings.incident_memory_max_age_h * 3_600_000
+    try:
+        await _ensure_collection()
+        with metrics.qdrant_timer("memory_query"):
+            response = await get_client().query_points(
+                collection_name=settings.qdrant_memory_collection,
+                query=vector,
+                query_filter=Filter(must=[FieldCondition(key="created_at", range=Range(gte=since))]),
+                score_threshold=settings.incident_memory_threshold,
+                limit=1,
+                with_payload=["result", "created_at", "order_nos"],
+            )
+    except Exception as e:
+        _collection_ready = False
+        metrics.MEMORY_LOOKUPS.labels("error").inc()
+        logger.warning("Incident memory: lookup lỗi, gọi LLM: %s", e)
+        return None
+    if not response.points:
+        metrics.MEMORY_LOOKUPS.labels("miss").inc()
+        return None
+    point = response.points[0]
+    data = point.payload or {}
+    metrics.MEMORY_LOOKUPS.labels("hit").inc()
+    result = TriageResult(**data["result"])
+    result.reused_from = MemoryRef(
+        id=str(point.id),
+        score=round(point.score, 4),
+        created_at=int(data.get("created_at") or 0),
+        order_nos=data.get("order_nos") or [],
+        link=f"/incidents/memory/{point.id}",
+    )
+    return result
+
+
+async def remember(signature: str, logs: list[dict[str, Any]], result: TriageResult, raw_llm: str) -> str | None:
+    """Lưu chẩn đoán mới của LLM; trả về id (None nếu memory tắt / lỗi)."""
+    global _collection_ready
+    vector = embed_query(signature) if _enabled() and signature else None
+    if vector is None:
+        return None
+    point_id = str(uuid.uuid4())
+    payload = {
+        "result": result.model_dump(exclude={"reused_from"}),
+        "raw_llm": raw_llm,
+        "signature": signature,
+        "created_at": int(time.time() * 1000),
+        "model": settings.openai_model,
+        "order_nos": list(dict.fromkeys(h["order_no"] for h in logs if h.get("order_no")))[:5],
+        "log_ids": [str(h["id"]) for h in logs[:20] if h.get("id")],
+    }
+    try:
+        await _ensure_collection()
+        with metrics.qdrant_timer("memory_upsert"):
+            await get_client().upsert(
+                collection_name=settings.qdrant_memory_collection,
+                points=[PointStruct(id=point_id, vector=vector, payload=payload)],
+            )
+    except Exception as e:
+        _collection_ready = False
+        logger.warning("Incident memory: lưu lỗi: %s", e)
+        return None
+    metrics.MEMORY_STORED.inc()
+    return point_id
+
+
+async def get_memory(memory_id: str) -> dict[str, Any] | None:
+    """Chẩn đoán gốc theo id (provenance của reused_from.link). ValueError nếu id không phải UUID."""
+    memory_id = str(uuid.UUID(memory_id))
+    await _ensure_collection()
+    with metrics.qdrant_timer("retrieve"):
+        points = await get_client().retrieve(
+            collection_name=settings.qdrant_memory_collection, ids=[memory_id], with_payload=True, with_vectors=False
+        )
+    if not points:
+        return None
+    return {"id": str(points[0].id), **(points[0].payload or {})}
+
+
+async def forget(memory_id: str) -> None:
+    """Xóa 1 chẩn đoán (vd chẩn đoán sai) để không bị dùng lại nữa. ValueError nếu id không phải UUID."""
+    memory_id = str(uuid.UUID(memory_id))
+    await _ensure_collection()
+    await get_client().delete(collection_name=settings.qdrant_memory_collection, points_selector=[memory_id])
@@ -2,30 +2,184 @@
 from __future__ import annotations
 
 import json
+import logging
 import re
-from typing import Any
+import time
+from typing import Any, AsyncIterator
 
+from . import incident_memory, metrics
 from .config import settings
 from .schemas import TriageResult
 
+try:
+    import tiktoken
+except ImportError:  # tiktoken là optional, không có thì ước lượng token
+    tiktoken = None
 
-def _build_context(logs: list[dict[str, Any]], log_snippet: str | None, error_message: str | None) -> str:
-    parts = ["## Logs liên quan (từ Vector DB)\n"]
-    for i, log in enumerate(logs[:20], 1):
-        text = log.get("text") or ""
-        module = log.get("module") or ""
-        operation = log.get("operation") or ""
-        resp_code = log.get("resp_code") or ""
-        status = log.get("status") or ""
-        order_no = log.get("order_no") or ""
-        parts.append(f"[{i}] order_no={order_no} module={module} operation={operation} resp_code={resp_code} status={status}")
-        parts.append(text[:800])
-        parts.append("")
+logger = logging.getLogger(__name__)
+
+LLM_ERROR_PREFIX = "Lỗi gọi LLM"
+
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """Encoding tiktoken của model; None nếu không có tiktoken hoặc không tải được file BPE (offline) — chỉ thử 1 lần."""
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.openai_model)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning("Không tải được encoding tiktoken, ước lượng token theo số từ: %s", e)
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """Số token của text: dùng tiktoken nếu có cài, nếu không ước lượng theo số từ/ký hiệu."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Từ dài (id, hash) thường bị tách thành nhiều token
+    return sum(1 + len(w) // 6 for w in _TOKEN_RE.findall(text))
+
+
+def _is_error(log: dict[str, Any], success_codes: set[str]) -> bool:
+    resp_code = str(log.get("resp_code") or "").upper()
+    status = str(log.get("status") or "").upper()
+    return (bool(resp_code) and resp_code not in success_codes) or any(
+        s in status for s in ("FAIL", "ERROR", "TIMEOUT", "REJECT", "CANCEL")
+    )
+
+
+class _LogGroup:
+    """Nhóm log gần giống nhau (cùng module, operation, resp_code, status)."""
+
+    __slots__ = ("key", "count", "first_ts", "last_ts", "max_ms", "is_error", "sample")
+
+    def __init__(self, key: tuple[str, str, str, str], log: dict[str, Any], is_error: bool) -> None:
+        self.key = key
+        self.count = 0
+        self.first_ts: int | None = None
+        self.last_ts: int | None = None
+        self.max_ms = -1
+        self.is_error = is_error
+        self.sample = log
+
+    def add(self, log: dict[str, Any]) -> None:
+        self.count += 1
+        ts = log.get("timestamp")
+        if isinstance(ts, int):
+            self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+            self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+        ms = log.get("processing_time_ms")
+        if isinstance(ms, (int, float)) and ms > self.max_ms:
+            # Log chậm nhất làm đại diện cho nhóm
+            self.max_ms = int(ms)
+            self.sample = log
+
+    def rank(self, slow_ms: int) -> tuple[int, int]:
+        """Lỗi trước, rồi tới chậm, trong cùng mức thì chậm hơn trước."""
+        level = 0 if self.is_error else 1 if self.max_ms >= slow_ms else 2
+        return level, -self.max_ms
+
+    def header(self) -> str:
+        module, operation, resp_code, status = self.key
+        ts = f"{self.first_ts}" if self.first_ts == self.last_ts else f"{self.first_ts}..{self.last_ts}"
+        line = f"x{self.count} ts={ts} module={module} operation={operation} resp_code={resp_code} status={status}"
+        if self.max_ms >= 0:
+            line += f" max_processing_ms={self.max_ms}"
+        if self.sample.get("order_no"):
+            line += f" order_no={self.sample['order_no']}"
+        return line + (" [ERROR]" if self.is_error else "")
+
+
+def build_context(
+    logs: list[dict[str, Any]],
+    log_snippet: str | None,
+    error_message: str | None,
+    max_tokens: int | None = None,
+) -> tuple[str, int]:
+    """
+    Context cho LLM trong giới hạn token: gom log trùng lặp theo (module, operation, resp_code, status)
+    kèm số lượng, ưu tiên nhóm lỗi/chậm khi cắt, hiển thị theo thứ tự timestamp.
+    Trả về (context, số token).
+    """
+    budget = max_tokens if max_tokens is not None else settings.llm_context_max_tokens
+    success_codes = settings.success_codes
+    groups: dict[tuple[str, str, str, str], _LogGroup] = {}
+    for log in logs:
+        key = tuple(str(log.get(f) or "") for f in ("module", "operation", "resp_code", "status"))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _LogGroup(key, log, _is_error(log, success_codes))
+        group.add(log)
+
+    # Snippet / error của user luôn giữ, trừ vào budget trước
+    tail: list[str] = []
     if log_snippet:
-        parts.append("## Log snippet / mô tả từ user\n" + log_snippet)
+        tail.append("## Log snippet / mô tả từ user\n" + log_snippet[:4000])
     if error_message:
-        parts.append("## Error message\n" + error_message)
-    return "\n".join(parts)
+        tail.append("## Error message\n" + error_message[:2000])
+    head = f"## Logs liên quan (từ Vector DB): {len(logs)} log, {len(groups)} nhóm\n"
+    used = estimate_tokens(head) + sum(estimate_tokens(t) for t in tail)
+
+    # Chừa chỗ cho dòng "(+N nhóm ... lược bỏ)"
+    used += 20
+    # Lượt 1: dòng tóm tắt của các nhóm theo độ ưu tiên (nhóm lỗi kèm luôn text mẫu);
+    # lượt 2: thêm text mẫu cho các nhóm còn lại nếu còn budget
+    ranked = sorted(groups.values(), key=lambda g: g.rank(settings.llm_slow_ms))
+    blocks: dict[int, str] = {}
+
+    def add_text(idx: int) -> None:
+        nonlocal used
+        text = (ranked[idx].sample.get("text") or "")[:800]
+        cost = estimate_tokens(text) if text else 0
+        if text and used + cost <= budget:
+            blocks[idx] += "\n" + text
+            used += cost
+
+    for idx, group in enumerate(ranked):
+        header = group.header()
+        cost = estimate_tokens(header) + 4
+        if used + cost > budget:
+            break
+        blocks[idx] = header
+        used += cost
+        if group.is_error:
+            add_text(idx)
+    for idx, group in enumerate(ranked):
+        if idx in blocks and not group.is_error:
+            add_text(idx)
+    selected = [(ranked[idx], block) for idx, block in blocks.items()]
+
+    parts = [head]
+    selected.sort(key=lambda item: (item[0].first_ts is None, item[0].first_ts or 0))
+    for i, (_, block) in enumerate(selected, 1):
+        parts.append(f"[{i}] {block}")
+        parts.append("")
+    omitted = len(groups) - len(selected)
+    if omitted:
+        parts.append(f"(+{omitted} nhóm log khác bị lược bỏ do giới hạn token)\n")
+    parts.extend(tail)
+    context = "\n".join(parts)
+    return context, estimate_tokens(context)
+
+
+def _build_context_timed(
+    logs: list[dict[str, Any]], log_snippet: str | None, error_message: str | None
+) -> tuple[str, int]:
+    started = time.perf_counter()
+    context, tokens = build_context(logs, log_snippet, error_message)
+    metrics.STAGE["context"].observe(time.perf_counter() - started)
+    metrics.CONTEXT_TOKENS.observe(tokens)
+    return context, tokens
 
 
 def _parse_llm_output(raw: str) -> TriageResult:
@@ -47,34 +201,7 @@ def _parse_llm_output(raw: str) -> TriageResult:
     return TriageResult(root_cause=raw[:500] if raw else "Không phân tích được.")
 
 
-async def triage_with_llm(
-    logs: list[dict[str, Any]],
-    log_snippet: str | None = None,
-    error_message: str | None = None,
-) -> tuple[TriageResult, str]:
-    """
-    Gửi context (logs + snippet + error) cho LLM, trả về TriageResult và raw response.
-    Nếu không cấu hình OpenAI thì trả về kết quả mặc định.
-    """
-    context = _build_context(logs, log_snippet, error_message)
-    if not context.strip():
-        return TriageResult(root_cause="Không có log nào để phân tích."), ""
-
-    if not settings.openai_api_key:
-        # Fallback: không gọi API, trả về tóm tắt đơn giản
-        summary = _summarize_logs(logs)
-        return TriageResult(
-            issue_type="Unknown",
-            confidence=0.0,
-            root_cause=summary,
-            evidence=[f"Tìm thấy {len(logs)} log(s)."],
-            suggested_actions=["Cấu hình OPENAI_API_KEY để dùng AI triage."],
-        ), ""
-
-    try:
-        from openai import AsyncOpenAI
-        client = AsyncOpenAI(api_key=settings.openai_api_key)
-        prompt = f"""Bạn là chuyên gia triage incident hệ thống thanh toán. Dựa trên các log và thông tin dưới đây, đưa ra đánh giá ngắn gọn theo đúng JSON sau (chỉ trả về JSON, không giải thích thêm):
+_PROMPT_TEMPLATE = """Bạn là chuyên gia triage incident hệ thống thanh toán. Dựa trên các log và thông tin dưới đây, đưa ra đánh giá ngắn gọn theo đúng JSON sau (chỉ trả về JSON, không giải thích thêm):
 
 {{
   "issue_type": "Loại lỗi (vd: Callback Failure, Payment Timeout, ...)",
@@ -87,19 +214,141 @@ async def triage_with_llm(
 Dữ liệu:
 {context}
 """
-        resp = await client.chat.completions.create(
+
+_llm_client = None
+
+
+def _get_llm_client():
+    """AsyncOpenAI dùng chung (OPENAI_BASE_URL để trỏ tới server tương thích OpenAI, vd app.fake_llm)."""
+    global _llm_client
+    if _llm_client is None:
+        from openai import AsyncOpenAI
+        _llm_client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
+    return _llm_client
+
+
+def _fallback_result(logs: list[dict[str, Any]]) -> TriageResult:
+    # Không gọi API, trả về tóm tắt đơn giản
+    return TriageResult(
+        issue_type="Unknown",
+        confidence=0.0,
+        root_cause=_summarize_logs(logs),
+        evidence=[f"Tìm thấy {len(logs)} log(s)."],
+        suggested_actions=["Cấu hình OPENAI_API_KEY để dùng AI triage."],
+    )
+
+
+def _error_result(e: Exception) -> TriageResult:
+    return TriageResult(
+        root_cause=f"{LLM_ERROR_PREFIX}: {e}",
+        evidence=[],
+        suggested_actions=["Kiểm tra OPENAI_API_KEY và kết nối mạng."],
+    )
+
+
+async def _remember(signature: str | None, logs: list[dict[str, Any]], result: TriageResult, raw: str) -> None:
+    # Chỉ lưu output parse được thành JSON (issue_type có giá trị)
+    if signature is not None and result.issue_type:
+        await incident_memory.remember(signature, logs, result, raw)
+
+
+async def triage_with_llm(
+    logs: list[dict[str, Any]],
+    log_snippet: str | None = None,
+    error_message: str | None = None,
+    use_memory: bool = True,
+) -> tuple[TriageResult, str, int]:
+    """
+    Gửi context (logs + snippet + error) cho LLM, trả về TriageResult, raw response và số token của context.
+    Incident memory có chẩn đoán cũ đủ giống (use_memory) thì trả về luôn, không gọi LLM.
+    Nếu không cấu hình OpenAI thì trả về kết quả mặc định.
+    """
+    if not logs and not log_snippet and not error_message:
+        return TriageResult(root_cause="Không có log nào để phân tích."), "", 0
+    signature = incident_memory.incident_signature(logs, log_snippet, error_message) if use_memory else None
+    if signature is not None:
+        reused = await incident_memory.recall(signature)
+        if reused is not None:
+            return reused, "", 0
+    context, context_tokens = _build_context_timed(logs, log_snippet, error_message)
+
+    if not settings.openai_api_key:
+        return _fallback_result(logs), "", context_tokens
+
+    started = time.perf_counter()
+    try:
+        resp = await _get_llm_client().chat.completions.create(
             model=settings.openai_model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=[{"role": "user", "content": _PROMPT_TEMPLATE.format(context=context)}],
             temperature=0.2,
         )
         raw = (resp.choices[0].message.content or "").strip()
-        return _parse_llm_output(raw), raw
     except Exception as e:
-        return TriageResult(
-            root_cause=f"Lỗi gọi LLM: {e}",
-            evidence=[],
-            suggested_actions=["Kiểm tra OPENAI_API_KEY và kết nối mạng."],
-        ), str(e)
+        metrics.LLM_SECONDS.labels("blocking", "error").observe(time.perf_counter() - started)
+        return _error_result(e), str(e), context_tokens
+    metrics.LLM_SECONDS.labels("blocking", "ok").observe(time.perf_counter() - started)
+    metrics.observe_usage(resp.usage)
+    result = _parse_llm_output(raw)
+    await _remember(signature, logs, result, raw)
+    return result, raw, context_tokens
+
+
+async def stream_triage_with_llm(
+    logs: list[dict[str, Any]],
+    log_snippet: str | None = None,
+    error_message: str | None = None,
+    use_memory: bool = True,
+) -> AsyncIterator[tuple[str, Any]]:
+    """
+    Như triage_with_llm nhưng stream: yield ("context", số token) ngay khi build xong context,
+    ("token", đoạn text) theo từng chunk LLM trả về, cuối cùng ("result", (TriageResult, raw, số token)).
+    Dùng lại chẩn đoán từ incident memory thì chỉ có ("context", 0) và ("result", ...).
+    """
+    if not logs and not log_snippet and not error_message:
+        yield "context", 0
+        yield "result", (TriageResult(root_cause="Không có log nào để phân tích."), "", 0)
+        return
+    signature = incident_memory.incident_signature(logs, log_snippet, error_message) if use_memory else None
+    if signature is not None:
+        reused = await incident_memory.recall(signature)
+        if reused is not None:
+            yield "context", 0
+            yield "result", (reused, "", 0)
+            return
+    context, context_tokens = _build_context_timed(logs, log_snippet, error_message)
+    yield "context", context_tokens
+
+    if not settings.openai_api_key:
+        yield "result", (_fallback_result(logs), "", context_tokens)
+        return
+
+    parts: list[str] = []
+    started = time.perf_counter()
+    try:
+        stream = await _get_llm_client().chat.completions.create(
+            model=settings.openai_model,
+            messages=[{"role": "user", "content": _PROMPT_TEMPLATE.format(context=context)}],
+            temperature=0.2,
+            stream=True,
+            stream_options={"include_usage": True},  # Chunk cuối (choices rỗng) mang usage
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not parts:
+                    metrics.LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                parts.append(delta)
+                yield "token", delta
+            metrics.observe_usage(chunk.usage)
+    except Exception as e:
+        metrics.LLM_SECONDS.labels("stream", "error").observe(time.perf_counter() - started)
+        yield "result", (_error_result(e), str(e), context_tokens)
+        return
+    metrics.LLM_SECONDS.labels("stream", "ok").observe(time.perf_counter() - started)
+    raw = "".join(parts).strip()
+    result = _parse_llm_output(raw)
+    await _remember(signature, logs, result, raw)
+    yield "result", (result, raw, context_tokens)
 
 
 def _summarize_logs(logs: list[dict[str, Any]]) -> str:
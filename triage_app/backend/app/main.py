@@ -1,20 +1,55 @@
 """
 Triage Backend:
-- POST /search — query Vector DB theo order_no, merchant_id, request_id; trả danh sách logs.
-- POST /triage — query Vector DB + gọi LLM → trả kết quả triage (issue_type, root_cause, evidence, suggested_actions).
+- POST /search — query Vector DB theo order_no, merchant_id, request_id hoặc đoạn log / mô tả lỗi; trả danh sách logs.
+- POST /triage — query Vector DB + gọi LLM → trả kết quả triage (issue_type, root_cause, evidence, suggested_actions);
+  incident tương tự đã có chẩn đoán (incident memory) thì dùng lại, không gọi LLM.
+- POST /triage/stream — như /triage nhưng stream (SSE): logs trước, token LLM, kết quả cuối.
+- POST /timeline — mọi log liên quan của 1 giao dịch (qua order/trace/request id) theo thời gian, kèm latency từng bước.
+- GET /stats — số log, tỉ lệ lỗi, quantile latency theo phút (rollup), không scroll log.
+- GET /logs/{id}/payload — payload gốc (JSON) của 1 log, giải nén khi được yêu cầu.
+- GET/DELETE /incidents/memory/{id} — chẩn đoán gốc được dùng lại (reused_from.link) / xóa khỏi incident memory.
+- GET /metrics — metrics Prometheus.
 """
 from __future__ import annotations
 
+import asyncio
+import json
+import time
 from pathlib import Path
+from typing import AsyncIterator
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from .schemas import TriageRequest, SearchResponse, TriageResponse, LogHit
-from .vector_client import search_logs
-from .llm import triage_with_llm
+from . import incident_memory, metrics
+from .config import settings
+from .payload_codec import PayloadDecodeError
+from .schemas import (
+    LogHit,
+    SearchResponse,
+    StatsResponse,
+    TimelineEntry,
+    TimelineResponse,
+    TriageRequest,
+    TriageResponse,
+    TriageResult,
+)
+from .stats import query_stats
+from .timeline import build_timeline
+from .triage_cache import TriageCache, triage_fingerprint
+from .vector_client import (
+    TRACE_ID_FIELDS,
+    close_client,
+    expand_related_logs,
+    get_client,
+    get_log_payload,
+    search_logs,
+    search_logs_page,
+    search_text,
+)
+from .llm import LLM_ERROR_PREFIX, stream_triage_with_llm, triage_with_llm
 
 app = FastAPI(title="Triage API", version="0.1.0")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
@@ -29,8 +64,39 @@ elif (_frontend / "index.html").exists():
     app.mount("/app", StaticFiles(directory=str(_frontend), html=True), name="static")
 
 
+_triage_cache: TriageCache[tuple[TriageResult, str, int]] = TriageCache(
+    max_entries=settings.triage_cache_max_entries,
+    ttl_s=settings.triage_cache_ttl_s,
+)
+metrics.watch_triage_cache(_triage_cache)
+
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Latency theo route template (không theo path thật để giữ số series cố định); với SSE tính tới lúc gửi header."""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.labels(
+        getattr(route, "path", "unmatched"), request.method, str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+@app.on_event("startup")
+async def init_vector_client():
+    """Tạo Qdrant client dùng chung cho cả app."""
+    get_client()
+
+
+@app.on_event("shutdown")
+async def close_vector_client():
+    await close_client()
+
+
 def _to_log_hit(p: dict) -> LogHit:
     return LogHit(
+        id=p.get("id"),
         order_no=p.get("order_no"),
         merchant_id=p.get("merchant_id"),
         module=p.get("module"),
@@ -39,10 +105,38 @@ def _to_log_hit(p: dict) -> LogHit:
         status=p.get("status"),
         timestamp=p.get("timestamp"),
         text=(p.get("text") or "")[:500],
-        payload=(p.get("payload") or "")[:2000],
+        score=p.get("score"),
     )
 
 
+def _trace_seeds(req: TriageRequest) -> dict[str, str]:
+    return {field: getattr(req, field) for field in TRACE_ID_FIELDS if getattr(req, field)}
+
+
+def _check_query(req: TriageRequest) -> None:
+    if req.expand:
+        if not _trace_seeds(req):
+            raise HTTPException(status_code=400, detail="expand cần ít nhất một trong: order_no, order_id, trace_id, request_id")
+    elif not any([req.order_no, req.merchant_id, req.request_id, req.log_snippet, req.error_message]):
+        raise HTTPException(
+            status_code=400, detail="Cần ít nhất một trong: order_no, merchant_id, request_id, log_snippet, error_message"
+        )
+
+
+def _use_text(req: TriageRequest) -> bool:
+    """Không có order_no/request_id (và không phải trang sau của search theo id) → tìm theo log_snippet / error_message."""
+    return not (req.expand or req.order_no or req.request_id or req.cursor) and bool(req.log_snippet or req.error_message)
+
+
+async def _text_hits(req: TriageRequest, limit: int) -> list[dict]:
+    text = " ".join(t for t in (req.log_snippet, req.error_message) if t)
+    return await search_text(text, merchant_id=req.merchant_id, from_ts=req.from_ts, to_ts=req.to_ts, limit=limit)
+
+
+async def _expanded_logs(req: TriageRequest) -> tuple[list[dict], dict[str, list[str]], int, str | None]:
+    return await expand_related_logs(_trace_seeds(req), merchant_id=req.merchant_id, from_ts=req.from_ts, to_ts=req.to_ts)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -61,33 +155,277 @@ def root():
 
 
 @app.post("/search", response_model=SearchResponse)
-def search(req: TriageRequest):
-    """Tìm logs từ Vector DB theo order_no, merchant_id, request_id."""
-    if not any([req.order_no, req.merchant_id, req.request_id]):
-        raise HTTPException(status_code=400, detail="Cần ít nhất một trong: order_no, merchant_id, request_id")
-    hits = search_logs(order_no=req.order_no, merchant_id=req.merchant_id, request_id=req.request_id)
+async def search(req: TriageRequest):
+    """
+    Tìm logs từ Vector DB theo order_no, merchant_id, request_id, lọc theo from_ts/to_ts,
+    sắp xếp theo timestamp, phân trang bằng cursor (next_cursor).
+    expand=true: trả mọi log liên quan qua order/trace/request id (không phân trang).
+    Không có order_no/request_id mà có log_snippet/error_message: tìm full-text, xếp theo độ giống (`score`),
+    1 trang page_size log; có merchant_id mà không log nào khớp text thì trả log của merchant như cũ.
+    """
+    _check_query(req)
+    if _use_text(req):
+        hits = await _text_hits(req, req.page_size)
+        if hits or not req.merchant_id:
+            return SearchResponse(query=req.model_dump(exclude_none=True), hits=[_to_log_hit(p) for p in hits], total=len(hits))
+    if req.expand:
+        hits, _, _, truncated = await _expanded_logs(req)
+        if req.order == "desc":
+            hits.reverse()
+        return SearchResponse(
+            query=req.model_dump(exclude_none=True),
+            hits=[_to_log_hit(p) for p in hits],
+            total=len(hits),
+            truncated=truncated,
+        )
+    try:
+        hits, next_cursor = await search_logs_page(
+            order_no=req.order_no,
+            merchant_id=req.merchant_id,
+            request_id=req.request_id,
+            from_ts=req.from_ts,
+            to_ts=req.to_ts,
+            page_size=req.page_size,
+            cursor=req.cursor,
+            order=req.order,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return SearchResponse(
         query=req.model_dump(exclude_none=True),
         hits=[_to_log_hit(p) for p in hits],
         total=len(hits),
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/stats", response_model=StatsResponse)
+async def stats(
+    merchant_id: str | None = None,
+    module: str | None = None,
+    operation: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+    baseline_minutes: int = Query(0, ge=0, le=7 * 24 * 60),
+):
+    """
+    Số log, tỉ lệ lỗi, p50/p95/p99 latency theo phút từ rollup của Log Consumer (mặc định 60 phút gần nhất),
+    kèm baseline `baseline_minutes` phút trước đó để so sánh.
+    """
+    if from_ts is not None and to_ts is not None and from_ts > to_ts:
+        raise HTTPException(status_code=400, detail="from_ts phải <= to_ts")
+    result = await query_stats(merchant_id, module, operation, from_ts, to_ts, baseline_minutes)
+    query = {"merchant_id": merchant_id, "module": module, "operation": operation, "baseline_minutes": baseline_minutes}
+    return StatsResponse(query={k: v for k, v in query.items() if v is not None}, **result)
+
+
+@app.get("/logs/{log_id}/payload")
+async def log_payload(log_id: str):
+    """Payload gốc (JSON) của 1 log theo id trong kết quả search; giải nén khi được yêu cầu."""
+    try:
+        payload = await get_log_payload(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="log id không hợp lệ")
+    except PayloadDecodeError as e:
+        raise HTTPException(status_code=500, detail=f"Không giải nén được payload đã lưu: {e}")
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy log")
+    return Response(content=payload, media_type="application/json")
+
+
+@app.get("/incidents/memory/{memory_id}")
+async def get_incident_memory(memory_id: str):
+    """Chẩn đoán gốc trong incident memory (result, raw LLM, signature, log/order gốc, thời điểm)."""
+    try:
+        entry = await incident_memory.get_memory(memory_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="memory id không hợp lệ")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chẩn đoán")
+    return entry
+
+
+@app.delete("/incidents/memory/{memory_id}")
+async def delete_incident_memory(memory_id: str):
+    """Xóa chẩn đoán (vd bị đánh giá sai) để triage sau gọi LLM lại."""
+    try:
+        await incident_memory.forget(memory_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="memory id không hợp lệ")
+    return {"deleted": memory_id}
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Metrics Prometheus: latency endpoint, từng bước triage, Qdrant, LLM (TTFT, token), triage cache."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+def _triage_query_key(req: TriageRequest) -> str:
+    return json.dumps(
+        [
+            req.order_no,
+            req.merchant_id,
+            req.request_id,
+            req.order_id,
+            req.trace_id,
+            req.expand,
+            req.from_ts,
+            req.to_ts,
+            req.log_snippet,
+            req.error_message,
+            req.use_memory,
+        ],
+        separators=(",", ":"),
+    )
+
+
+def _cacheable(out: tuple[TriageResult, str, int]) -> bool:
+    return not out[0].root_cause.startswith(LLM_ERROR_PREFIX)
+
+
+async def _triage_hits(req: TriageRequest) -> list[dict]:
+    started = time.perf_counter()
+    hits: list[dict] = []
+    if req.expand:
+        hits, _, _, _ = await _expanded_logs(req)
+        hits = hits[::-1][: settings.triage_max_logs]
+    elif _use_text(req):
+        hits = await _text_hits(req, settings.triage_max_logs)
+    # Theo id; tìm theo text không ra log mà có merchant_id thì lấy log của merchant như trước
+    if not hits and not req.expand and (req.order_no or req.merchant_id or req.request_id):
+        hits = await search_logs(
+            order_no=req.order_no,
+            merchant_id=req.merchant_id,
+            request_id=req.request_id,
+            from_ts=req.from_ts,
+            to_ts=req.to_ts,
+            limit=settings.triage_max_logs,
+        )
+    metrics.STAGE["retrieve"].observe(time.perf_counter() - started)
+    return hits
+
+
+@app.post("/timeline", response_model=TimelineResponse)
+async def timeline(req: TriageRequest):
+    """
+    Timeline của 1 giao dịch: từ order_no/order_id/trace_id/request_id gom mọi log liên quan (batch query
+    theo các id tìm được), sắp theo timestamp, kèm latency từng bước (processing_time_ms) và gap giữa các bước.
+    """
+    req.expand = True
+    _check_query(req)
+    logs, related_ids, round_trips, truncated = await _expanded_logs(req)
+    result = build_timeline(logs)
+    return TimelineResponse(
+        query=req.model_dump(exclude_none=True),
+        related_ids=related_ids,
+        round_trips=round_trips,
+        truncated=truncated,
+        total=len(logs),
+        span_ms=result["span_ms"],
+        total_processing_ms=result["total_processing_ms"],
+        slowest_id=result["slowest_id"],
+        entries=[TimelineEntry(**{**e, "text": (e.get("text") or "")[:500]}) for e in result["entries"]],
     )
 
 
 @app.post("/triage", response_model=TriageResponse)
 async def triage(req: TriageRequest):
     """Query Vector DB lấy logs → gọi LLM triage → trả kết quả."""
-    if not any([req.order_no, req.merchant_id, req.request_id]):
-        raise HTTPException(status_code=400, detail="Cần ít nhất một trong: order_no, merchant_id, request_id")
-    hits = search_logs(order_no=req.order_no, merchant_id=req.merchant_id, request_id=req.request_id)
-    triage_result, raw_llm = await triage_with_llm(
-        hits,
-        log_snippet=req.log_snippet,
-        error_message=req.error_message,
-    )
+    _check_query(req)
+    hits = await _triage_hits(req)
+    cached = False
+    if settings.triage_cache_ttl_s > 0:
+        # Cùng bộ log + snippet/error → dùng lại kết quả, request trùng đang chạy thì đợi chung 1 lần gọi LLM.
+        # Có log mới cho cùng query → fingerprint đổi, entry cũ của query bị xóa.
+        (triage_result, raw_llm, context_tokens), cached = await _triage_cache.get_or_compute(
+            _triage_query_key(req),
+            triage_fingerprint(hits, req.log_snippet, req.error_message, req.use_memory),
+            lambda: triage_with_llm(
+                hits, log_snippet=req.log_snippet, error_message=req.error_message, use_memory=req.use_memory
+            ),
+            cacheable=_cacheable,
+        )
+    else:
+        triage_result, raw_llm, context_tokens = await triage_with_llm(
+            hits,
+            log_snippet=req.log_snippet,
+            error_message=req.error_message,
+            use_memory=req.use_memory,
+        )
     return TriageResponse(
         query=req.model_dump(exclude_none=True),
         logs_found=len(hits),
         logs_preview=[_to_log_hit(p) for p in hits[:10]],
         triage=triage_result,
         raw_llm=raw_llm or None,
+        context_tokens=context_tokens,
+        cached=cached,
+    )
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _triage_events(req: TriageRequest) -> AsyncIterator[bytes]:
+    hits = await _triage_hits(req)
+    query = req.model_dump(exclude_none=True)
+    logs_preview = [_to_log_hit(p).model_dump() for p in hits[:10]]
+    use_cache = settings.triage_cache_ttl_s > 0
+    query_key = _triage_query_key(req)
+    fingerprint = triage_fingerprint(hits, req.log_snippet, req.error_message, req.use_memory)
+    out = _triage_cache.lookup(query_key, fingerprint) if use_cache else None
+    # Request giống đang gọi LLM (/triage hoặc stream khác): đợi chung kết quả, không có event token
+    inflight = _triage_cache.join(fingerprint) if use_cache and out is None else None
+    cached = out is not None or inflight is not None
+    yield _sse("logs", {"query": query, "logs_found": len(hits), "logs_preview": logs_preview, "cached": cached})
+
+    if inflight is not None:
+        await asyncio.wait([inflight])
+        if not inflight.cancelled() and inflight.exception() is None:
+            out = inflight.result()
+    if out is None:
+        # Lần gọi chung bị hủy / lỗi thì tự gọi LLM
+        cached = False
+        future = _triage_cache.lead(fingerprint) if use_cache else None
+        try:
+            async for kind, value in stream_triage_with_llm(
+                hits, log_snippet=req.log_snippet, error_message=req.error_message, use_memory=req.use_memory
+            ):
+                if kind == "token":
+                    yield _sse("token", {"text": value})
+                elif kind == "result":
+                    out = value
+        except BaseException:
+            # Client ngắt kết nối (GeneratorExit) hoặc lỗi: request đang đợi tự gọi lại
+            if future is not None:
+                _triage_cache.abandon(fingerprint, future)
+            raise
+        if future is not None:
+            _triage_cache.settle(fingerprint, future, out, cacheable=_cacheable)
+    triage_result, raw_llm, context_tokens = out
+    response = TriageResponse(
+        query=query,
+        logs_found=len(hits),
+        logs_preview=logs_preview,
+        triage=triage_result,
+        raw_llm=raw_llm or None,
+        context_tokens=context_tokens,
+        cached=cached,
+    )
+    yield _sse("result", response.model_dump())
+
+
+@app.post("/triage/stream")
+async def triage_stream(req: TriageRequest):
+    """
+    Như /triage nhưng trả Server-Sent Events: `logs` (logs_found, logs_preview) ngay khi query Vector DB xong,
+    `token` theo từng đoạn LLM sinh ra, cuối cùng `result` (cùng dạng response của /triage).
+    """
+    _check_query(req)
+    return StreamingResponse(
+        _triage_events(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
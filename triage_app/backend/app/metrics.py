@@ -0,0 +1,111 @@
+"""
+Metrics Prometheus cho Triage Backend (GET /metrics): latency theo endpoint, thời gian từng bước triage
+(lấy log, build context, LLM), latency gọi Qdrant, LLM (thời gian request, time-to-first-token, token
+prompt/completion), hit/miss của triage cache và incident memory.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+__all__ = ["CONTENT_TYPE_LATEST", "render", "watch_triage_cache"]
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+HTTP_SECONDS = Histogram(
+    "triage_http_request_seconds",
+    "Latency theo endpoint (route template), method và status",
+    ["route", "method", "status"],
+    buckets=_SECONDS_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "triage_stage_seconds",
+    "Thời gian từng bước triage: retrieve (query log), context (build context); bước LLM xem triage_llm_request_seconds",
+    ["stage"],
+    buckets=_SECONDS_BUCKETS,
+)
+QDRANT_SECONDS = Histogram(
+    "triage_qdrant_request_seconds",
+    "Latency gọi Qdrant",
+    ["op"],
+    buckets=_SECONDS_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "triage_llm_request_seconds",
+    "Thời gian 1 lần gọi LLM (tới token cuối với stream)",
+    ["mode", "outcome"],
+    buckets=_SECONDS_BUCKETS,
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "triage_llm_first_token_seconds",
+    "Thời gian từ lúc gọi LLM (stream) tới token đầu tiên",
+    buckets=_SECONDS_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "triage_llm_tokens",
+    "Số token LLM theo usage của API (prompt, completion)",
+    ["kind"],
+)
+CONTEXT_TOKENS = Histogram(
+    "triage_context_tokens",
+    "Số token (ước lượng) của context gửi LLM",
+    buckets=(100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000),
+)
+MEMORY_LOOKUPS = Counter(
+    "triage_memory_lookups",
+    "Số lần tìm chẩn đoán cũ trong incident memory trước khi gọi LLM (hit: dùng lại, không gọi LLM)",
+    ["result"],
+)
+MEMORY_STORED = Counter(
+    "triage_memory_stored",
+    "Số chẩn đoán LLM được lưu vào incident memory",
+)
+
+STAGE = {s: STAGE_SECONDS.labels(s) for s in ("retrieve", "context")}
+
+
+def qdrant_timer(op: str):
+    """Context manager đo 1 lần gọi Qdrant (observe cả khi lỗi)."""
+    return QDRANT_SECONDS.labels(op).time()
+
+
+def observe_usage(usage: Any) -> None:
+    """Cộng token từ `usage` của response OpenAI (bỏ qua nếu server không trả usage)."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+
+class _TriageCacheCollector:
+    """Đọc counter của TriageCache lúc scrape."""
+
+    def __init__(self, cache: Any) -> None:
+        self._cache = cache
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        stats = self._cache.stats()
+        for name, help_text in (
+            ("hits", "Số lần dùng lại kết quả triage trong cache"),
+            ("misses", "Số lần phải gọi LLM"),
+            ("coalesced", "Số request trùng đợi chung 1 lần gọi LLM đang chạy"),
+        ):
+            family = CounterMetricFamily(f"triage_cache_{name}", help_text)
+            family.add_metric([], stats[name])
+            yield family
+        entries = GaugeMetricFamily("triage_cache_entries", "Số kết quả triage đang cache")
+        entries.add_metric([], stats["entries"])
+        yield entries
+
+
+def watch_triage_cache(cache: Any) -> None:
+    REGISTRY.register(_TriageCacheCollector(cache))
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
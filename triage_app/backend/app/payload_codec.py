@@ -0,0 +1,54 @@
+"""Giải nén payload log gốc do Log Consumer lưu (payload_z + payload_codec)."""
+from __future__ import annotations
+
+import base64
+import zlib
+from pathlib import Path
+
+from .config import settings
+
+try:
+    import zstandard
+except ImportError:  # chỉ cần khi consumer lưu bằng zstd
+    zstandard = None
+
+_decompressor = None
+_dict_id: int | None = None
+
+
+class PayloadDecodeError(Exception):
+    """Payload đã lưu không giải nén được (codec lạ, thiếu zstandard, sai dictionary, dữ liệu hỏng)."""
+
+
+def _zstd_decompressor(dict_id: int | None):
+    global _decompressor, _dict_id
+    if zstandard is None:
+        raise RuntimeError("Payload nén bằng zstd: cần cài zstandard")
+    if _decompressor is None:
+        if settings.payload_zstd_dict_path:
+            dict_data = zstandard.ZstdCompressionDict(Path(settings.payload_zstd_dict_path).read_bytes())
+            _dict_id = dict_data.dict_id()
+            _decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        else:
+            _decompressor = zstandard.ZstdDecompressor()
+    if dict_id is not None and dict_id != _dict_id:
+        raise RuntimeError(f"Payload nén bằng zstd dictionary {dict_id}, PAYLOAD_ZSTD_DICT_PATH không khớp")
+    return _decompressor
+
+
+def _decompress(codec: str, data: str) -> str:
+    packed = base64.b64decode(data)
+    if codec == "zlib":
+        return zlib.decompress(packed).decode("utf-8")
+    name, _, dict_id = codec.partition(":")
+    if name == "zstd":
+        return _zstd_decompressor(int(dict_id) if dict_id else None).decompress(packed).decode("utf-8")
+    raise ValueError(f"Codec payload không hỗ trợ: {codec}")
+
+
+def decompress_payload(codec: str, data: str) -> str:
+    """codec: zlib | zstd | zstd:<dict_id> (xem log_consumer/app/payload_codec.py). Lỗi → PayloadDecodeError."""
+    try:
+        return _decompress(codec, data)
+    except Exception as e:
+        raise PayloadDecodeError(str(e)) from e
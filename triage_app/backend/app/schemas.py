@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -6,8 +8,29 @@ class TriageRequest(BaseModel):
     order_id: str | None = None
     merchant_id: str | None = Field(None, description="Mã merchant")
     request_id: str | None = None
-    log_snippet: str | None = Field(None, description="Đoạn log hoặc mô tả lỗi")
+    trace_id: str | None = None
+    expand: bool = Field(
+        False, description="Mở rộng theo order_no/order_id/trace_id/request_id để lấy mọi log liên quan của giao dịch"
+    )
+    log_snippet: str | None = Field(
+        None, description="Đoạn log hoặc mô tả lỗi; không có order_no/request_id thì dùng để tìm log (full-text)"
+    )
     error_message: str | None = None
+    from_ts: int | None = Field(None, description="Từ thời điểm (epoch ms, tính cả)")
+    to_ts: int | None = Field(None, description="Đến thời điểm (epoch ms, tính cả)")
+    page_size: int = Field(50, ge=1, le=500, description="Số log mỗi trang")
+    cursor: str | None = Field(None, description="next_cursor của trang trước")
+    order: Literal["asc", "desc"] = Field("desc", description="Thứ tự theo timestamp")
+    use_memory: bool = Field(True, description="Cho phép dùng lại chẩn đoán cũ của sự cố giống (incident memory)")
+
+
+class MemoryRef(BaseModel):
+    """Chẩn đoán cũ trong incident memory đã được dùng lại."""
+    id: str
+    score: float  # Độ giống (cosine) giữa signature log hiện tại và của chẩn đoán cũ
+    created_at: int  # Epoch ms lúc chẩn đoán gốc
+    order_nos: list[str] = []  # Một vài order_no của sự cố gốc
+    link: str  # GET để xem chẩn đoán gốc (signature, log id, raw LLM)
 
 
 class TriageResult(BaseModel):
@@ -16,9 +39,11 @@ class TriageResult(BaseModel):
     root_cause: str = ""
     evidence: list[str] = []
     suggested_actions: list[str] = []
+    reused_from: MemoryRef | None = None  # Lấy từ incident memory, không gọi LLM
 
 
 class LogHit(BaseModel):
+    id: str | None = None  # Point id, dùng cho GET /logs/{id}/payload
     order_no: str | None = None
     merchant_id: str | None = None
     module: str | None = None
@@ -27,13 +52,36 @@ class LogHit(BaseModel):
     status: str | None = None
     timestamp: int | None = None
     text: str | None = None
-    payload: str | None = None
+    score: float | None = None  # Độ giống (cosine) với log_snippet / error_message khi tìm theo text
+    payload: str | None = None  # Không còn trả trong search; lấy qua GET /logs/{id}/payload
+
+
+class TimelineEntry(LogHit):
+    order_id: str | None = None
+    trace_id: str | None = None
+    request_id: str | None = None
+    processing_time_ms: int | None = None  # Latency của bước
+    gap_ms: int | None = None  # Từ lúc bước trước kết thúc tới lúc bước này bắt đầu
+
+
+class TimelineResponse(BaseModel):
+    query: dict
+    related_ids: dict[str, list[str]] = {}  # Các id liên quan tìm được, theo field
+    round_trips: int = 0  # Số lần batch query Qdrant
+    truncated: str | None = None  # Lý do chưa gom đủ log liên quan (max_hops, limit, qdrant_error: ...); None = đủ
+    total: int = 0
+    span_ms: int = 0  # Từ log đầu tiên tới khi bước cuối kết thúc
+    total_processing_ms: int = 0
+    slowest_id: str | None = None
+    entries: list[TimelineEntry] = []
 
 
 class SearchResponse(BaseModel):
     query: dict
     hits: list[LogHit] = []
-    total: int = 0
+    total: int = 0  # Số log trong trang hiện tại
+    next_cursor: str | None = None  # Truyền vào `cursor` để lấy trang tiếp; None khi hết
+    truncated: str | None = None  # expand=true: lý do chưa gom đủ log liên quan; None = đủ
 
 
 class TriageResponse(BaseModel):
@@ -42,3 +90,29 @@ class TriageResponse(BaseModel):
     logs_preview: list[LogHit] = []
     triage: TriageResult | None = None
     raw_llm: str | None = None
+    context_tokens: int = 0  # Số token của context log đã gửi LLM
+    cached: bool = False  # True nếu dùng lại kết quả cache / request giống hệt đang chạy
+
+
+class StatsPoint(BaseModel):
+    minute: int | None = None  # Epoch ms đầu phút (chỉ có trong series)
+    count: int = 0
+    error_count: int = 0  # resp_code không thuộc SUCCESS_RESP_CODES
+    error_rate: float = 0.0
+    resp_codes: dict[str, int] = {}
+    statuses: dict[str, int] = {}
+    avg_ms: float | None = None
+    p50_ms: float | None = None
+    p95_ms: float | None = None
+    p99_ms: float | None = None
+    max_ms: int | None = None
+
+
+class StatsResponse(BaseModel):
+    query: dict
+    from_ts: int
+    to_ts: int
+    buckets: int = 0  # Số rollup bucket đã đọc
+    total: StatsPoint
+    baseline: StatsPoint | None = None  # baseline_minutes phút ngay trước from_ts
+    series: list[StatsPoint] = []
@@ -0,0 +1,145 @@
+"""
+Thống kê theo phút từ rollup do Log Consumer ghi (QDRANT_ROLLUP_COLLECTION): số log, tỉ lệ lỗi,
+quantile latency theo merchant/module/operation. Chi phí O(số bucket), không scroll log.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from qdrant_client.models import FieldCondition, Filter, MatchValue, Range
+
+from . import metrics
+from .config import settings
+from .vector_client import get_client
+
+_MINUTE_MS = 60_000
+
+
+class LatencySketch:
+    """Giải mã + cộng dồn sketch latency của rollup (cùng định dạng với app.rollups của Log Consumer)."""
+
+    def __init__(self, accuracy: float) -> None:
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.bins: dict[int, int] = {}
+
+    def merge_payload(self, data: dict[str, Any]) -> None:
+        for idx, n in zip(data.get("i") or [], data.get("n") or []):
+            self.bins[idx] = self.bins.get(idx, 0) + n
+
+    def quantile(self, q: float) -> float | None:
+        total = sum(self.bins.values())
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for idx in sorted(self.bins):
+            seen += self.bins[idx]
+            if seen > rank:
+                # Giá trị đại diện của bin (gamma^(idx-2), gamma^(idx-1)]
+                return 0.0 if idx == 0 else round(2 * self.gamma ** (idx - 1) / (self.gamma + 1), 1)
+        return None
+
+
+class _Agg:
+    def __init__(self) -> None:
+        self.count = 0
+        self.resp_codes: dict[str, int] = {}
+        self.statuses: dict[str, int] = {}
+        self.latency_count = 0
+        self.sum_ms = 0
+        self.max_ms = 0
+        self.sketch: LatencySketch | None = None
+
+    def add(self, p: dict[str, Any]) -> None:
+        self.count += p.get("count", 0)
+        for field, target in (("resp_codes", self.resp_codes), ("statuses", self.statuses)):
+            for key, n in (p.get(field) or {}).items():
+                target[key] = target.get(key, 0) + n
+        self.latency_count += p.get("latency_count", 0)
+        self.sum_ms += p.get("sum_ms", 0)
+        self.max_ms = max(self.max_ms, p.get("max_ms", 0))
+        sketch = p.get("sketch") or {}
+        if self.sketch is None:
+            self.sketch = LatencySketch(sketch.get("a", 0.02))
+        self.sketch.merge_payload(sketch)
+
+    def to_dict(self, success_codes: set[str]) -> dict[str, Any]:
+        errors = sum(n for code, n in self.resp_codes.items() if code and code.upper() not in success_codes)
+        sketch = self.sketch
+        return {
+            "count": self.count,
+            "error_count": errors,
+            "error_rate": round(errors / self.count, 4) if self.count else 0.0,
+            "resp_codes": self.resp_codes,
+            "statuses": self.statuses,
+            "avg_ms": round(self.sum_ms / self.latency_count, 1) if self.latency_count else None,
+            "p50_ms": sketch.quantile(0.5) if sketch else None,
+            "p95_ms": sketch.quantile(0.95) if sketch else None,
+            "p99_ms": sketch.quantile(0.99) if sketch else None,
+            "max_ms": self.max_ms if self.latency_count else None,
+        }
+
+
+async def _scroll_rollups(must: list) -> list[dict[str, Any]]:
+    client = get_client()
+    results: list[dict[str, Any]] = []
+    offset = None
+    while True:
+        try:
+            with metrics.qdrant_timer("scroll_rollups"):
+                points, offset = await client.scroll(
+                    collection_name=settings.qdrant_rollup_collection,
+                    scroll_filter=Filter(must=must),
+                    limit=1000,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False,
+                )
+        except Exception:
+            return results  # Chưa có collection rollup (consumer chưa flush lần nào)
+        results.extend(p.payload or {} for p in points)
+        if offset is None:
+            return results
+
+
+async def query_stats(
+    merchant_id: str | None = None,
+    module: str | None = None,
+    operation: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+    baseline_minutes: int = 0,
+) -> dict[str, Any]:
+    """
+    Series theo phút + tổng trong [from_ts, to_ts] (mặc định 60 phút gần nhất), và baseline là
+    `baseline_minutes` phút ngay trước from_ts để so sánh "có đang lỗi nhiều hơn bình thường?".
+    """
+    to_ts = to_ts if to_ts is not None else int(time.time() * 1000)
+    from_ts = from_ts if from_ts is not None else to_ts - 60 * _MINUTE_MS
+    base_from = from_ts - baseline_minutes * _MINUTE_MS
+    must: list = [FieldCondition(key="minute", range=Range(gte=base_from - base_from % _MINUTE_MS, lte=to_ts))]
+    for field, value in (("merchant_id", merchant_id), ("module", module), ("operation", operation)):
+        if value:
+            must.append(FieldCondition(key=field, match=MatchValue(value=value)))
+    rollups = await _scroll_rollups(must)
+
+    window_start = from_ts - from_ts % _MINUTE_MS
+    per_minute: dict[int, _Agg] = {}
+    total, baseline = _Agg(), _Agg()
+    for p in rollups:
+        minute = p.get("minute", 0)
+        if minute >= window_start:
+            per_minute.setdefault(minute, _Agg()).add(p)
+            total.add(p)
+        else:
+            baseline.add(p)
+    success_codes = settings.success_codes
+    return {
+        "from_ts": from_ts,
+        "to_ts": to_ts,
+        "buckets": len(rollups),
+        "total": total.to_dict(success_codes),
+        "baseline": baseline.to_dict(success_codes) if baseline_minutes > 0 else None,
+        "series": [{"minute": m, **per_minute[m].to_dict(success_codes)} for m in sorted(per_minute)],
+    }
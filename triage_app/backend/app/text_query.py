@@ -0,0 +1,61 @@
+"""
+Chuẩn bị query full-text từ log_snippet / error_message: token để lọc (full-text index `text` của Log Consumer,
+tokenizer word) và vector để xếp hạng theo cosine với embedding log đã lưu.
+
+Vector dùng cùng hashing vectorizer với Log Consumer (app/embedder.py bên consumer: feature, crc32, bucket,
+dấu, chuẩn hóa L2) nên EMBEDDING_BACKEND / EMBEDDING_DIM phải giống bên consumer. Query chỉ có vài chục feature
+nên tính bằng Python thuần, không cần NumPy. Sửa 1 bên thì sửa cả bên kia và chạy
+scripts/check_embedding_parity.py (so vector của 2 bên trên log thật + query mẫu).
+"""
+from __future__ import annotations
+
+import math
+import re
+import zlib
+from typing import Iterator
+
+from .config import settings
+
+_WORD_RE = re.compile(r"\w+")
+
+# Tên key trong text của log (`module=... respCode=...`): có ở mọi log nên không dùng để lọc
+_KEY_TOKENS = {
+    "module", "operation", "orderno", "orderid", "traceid", "requestid", "merchantid", "branchcode",
+    "channel", "status", "respcode", "amount", "response",
+}
+
+
+def query_tokens(text: str) -> list[str]:
+    """Token (lowercase, bỏ trùng, giữ thứ tự) như tokenizer word của Qdrant, bỏ tên key và token quá ngắn/dài."""
+    tokens = dict.fromkeys(
+        t for t in _WORD_RE.findall(text.lower()) if 2 <= len(t) <= 40 and t not in _KEY_TOKENS
+    )
+    return list(tokens)[: settings.text_search_max_tokens]
+
+
+def _features(text: str) -> Iterator[str]:
+    """Giống _features của Log Consumer: từng từ (lowercase) + nguyên cặp key=value."""
+    for part in text.split():
+        key, sep, value = part.partition("=")
+        if sep:
+            if not value:
+                continue
+            yield f"{key.lower()}={value.lower()}"
+            yield from _WORD_RE.findall(value.lower())
+        else:
+            yield from _WORD_RE.findall(part.lower())
+
+
+def embed_query(text: str) -> list[float] | None:
+    """Vector hashing của query; None nếu EMBEDDING_BACKEND không phải hashing (không xếp hạng được)."""
+    if settings.embedding_backend.lower() != "hashing":
+        return None
+    dim = settings.embedding_dim
+    out = [0.0] * dim
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        out[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in out))
+    if norm == 0:
+        return None
+    return [v / norm for v in out]
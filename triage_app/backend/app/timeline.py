@@ -0,0 +1,31 @@
+"""Dựng timeline của 1 giao dịch (các log liên quan qua order/trace/request id) theo timestamp."""
+from __future__ import annotations
+
+from typing import Any
+
+
+def build_timeline(logs: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Log đã sắp theo timestamp → các bước kèm latency (processing_time_ms) và gap_ms (từ lúc bước trước
+    kết thúc tới lúc bước này bắt đầu; âm nếu 2 bước chạy chồng nhau), cùng tổng thời gian và bước chậm nhất.
+    """
+    entries: list[dict[str, Any]] = []
+    prev_end: int | None = None
+    slowest: dict[str, Any] | None = None
+    for log in logs:
+        ts = log.get("timestamp")
+        latency = log.get("processing_time_ms")
+        entry = {**log, "gap_ms": ts - prev_end if isinstance(ts, int) and prev_end is not None else None}
+        entries.append(entry)
+        if isinstance(ts, int):
+            end = ts + (int(latency) if isinstance(latency, (int, float)) else 0)
+            prev_end = end if prev_end is None else max(prev_end, end)
+        if isinstance(latency, (int, float)) and (slowest is None or latency > slowest["processing_time_ms"]):
+            slowest = entry
+    timestamps = [log["timestamp"] for log in logs if isinstance(log.get("timestamp"), int)]
+    return {
+        "entries": entries,
+        "span_ms": (prev_end - min(timestamps)) if timestamps and prev_end is not None else 0,
+        "total_processing_ms": sum(int(e.get("processing_time_ms") or 0) for e in entries),
+        "slowest_id": slowest["id"] if slowest else None,
+    }
@@ -0,0 +1,173 @@
+"""
+Cache kết quả triage + single-flight: nhiều request /triage giống nhau (cùng log, cùng snippet/error)
+trong lúc sự cố chỉ gọi LLM một lần.
+
+- Key (fingerprint) = hash của danh sách id log tìm được + log_snippet + error_message + use_memory
+  (request tắt incident memory không dùng chung kết quả với request bật), nên khi có log mới
+  cho cùng order/merchant thì fingerprint đổi và kết quả cũ bị bỏ (invalidate theo query).
+- TTL + LRU giới hạn số entry.
+- Request trùng fingerprint đang chạy thì đợi chung 1 future thay vì gọi LLM lần nữa (get_or_compute cho /triage;
+  /triage/stream dùng join / lead / settle vì request đầu stream token trong lúc tính).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def triage_fingerprint(
+    logs: list[dict[str, Any]], log_snippet: str | None, error_message: str | None, use_memory: bool = True
+) -> str:
+    h = hashlib.sha256()
+    for log_id in sorted(str(log.get("id") or "") for log in logs):
+        h.update(log_id.encode("utf-8"))
+        h.update(b"\0")
+    h.update(b"\1" + (log_snippet or "").encode("utf-8"))
+    h.update(b"\1" + (error_message or "").encode("utf-8"))
+    h.update(b"\1m" if use_memory else b"\1-")
+    return h.hexdigest()
+
+
+class TTLCache(Generic[T]):
+    """LRU cache có TTL (dùng trong 1 event loop, không cần lock)."""
+
+    def __init__(self, max_entries: int, ttl_s: float) -> None:
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._data: OrderedDict[str, tuple[float, T]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> T | None:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: str, value: T) -> None:
+        self._data[key] = (time.monotonic() + self._ttl_s, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TriageCache(Generic[T]):
+    """TTLCache + single-flight + invalidate theo query key (order_no/merchant_id/...)."""
+
+    def __init__(self, max_entries: int, ttl_s: float) -> None:
+        self._cache: TTLCache[T] = TTLCache(max_entries, ttl_s)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._latest: OrderedDict[str, str] = OrderedDict()  # query key -> fingerprint gần nhất
+        self._max_queries = max_entries
+        self.coalesced = 0
+
+    def _invalidate_stale(self, query_key: str, fingerprint: str) -> None:
+        previous = self._latest.get(query_key)
+        if previous is not None and previous != fingerprint:
+            self._cache.delete(previous)
+        self._latest[query_key] = fingerprint
+        self._latest.move_to_end(query_key)
+        while len(self._latest) > self._max_queries:
+            self._latest.popitem(last=False)
+
+    def lookup(self, query_key: str, fingerprint: str) -> T | None:
+        """Kết quả đã cache (None nếu chưa có/hết hạn); đồng thời bỏ entry cũ nếu log của query đã đổi."""
+        self._invalidate_stale(query_key, fingerprint)
+        return self._cache.get(fingerprint)
+
+    def store(self, fingerprint: str, value: T) -> None:
+        self._cache.set(fingerprint, value)
+
+    def join(self, fingerprint: str) -> asyncio.Future | None:
+        """Future của lần tính đang chạy cho fingerprint (None nếu không có) để request trùng đợi chung."""
+        inflight = self._inflight.get(fingerprint)
+        if inflight is not None:
+            self.coalesced += 1
+        return inflight
+
+    def lead(self, fingerprint: str) -> asyncio.Future:
+        """Đăng ký lần tính cho fingerprint; người gọi phải settle() future này (kể cả khi lỗi / bị hủy)."""
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[fingerprint] = future
+        return future
+
+    def settle(
+        self,
+        fingerprint: str,
+        future: asyncio.Future,
+        result: T | None = None,
+        error: BaseException | None = None,
+        cacheable: Callable[[T], bool] = lambda _: True,
+    ) -> None:
+        """Trả kết quả (hoặc lỗi) cho các request đang đợi, cache nếu cacheable, bỏ khỏi danh sách đang chạy."""
+        if self._inflight.get(fingerprint) is future:
+            del self._inflight[fingerprint]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            future.exception()  # đánh dấu đã xử lý nếu không có ai đợi
+            return
+        future.set_result(result)
+        if cacheable(result):
+            self.store(fingerprint, result)
+
+    def abandon(self, fingerprint: str, future: asyncio.Future) -> None:
+        """Lần tính bị hủy giữa chừng (vd client ngắt stream): request đang đợi sẽ tự tính lại."""
+        if self._inflight.get(fingerprint) is future:
+            del self._inflight[fingerprint]
+        future.cancel()
+
+    async def get_or_compute(
+        self,
+        query_key: str,
+        fingerprint: str,
+        compute: Callable[[], Awaitable[T]],
+        cacheable: Callable[[T], bool] = lambda _: True,
+    ) -> tuple[T, bool]:
+        """Trả về (kết quả, True nếu lấy từ cache hoặc dùng chung với request đang chạy)."""
+        cached = self.lookup(query_key, fingerprint)
+        if cached is not None:
+            return cached, True
+        inflight = self.join(fingerprint)
+        if inflight is not None:
+            await asyncio.wait([inflight])  # Không hủy future chung khi request này bị hủy
+            if not inflight.cancelled():
+                return inflight.result(), True
+
+        future = self.lead(fingerprint)
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            self.abandon(fingerprint, future)
+            raise
+        except BaseException as e:
+            self.settle(fingerprint, future, error=e)
+            raise
+        self.settle(fingerprint, future, result, cacheable=cacheable)
+        return result, False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._cache),
+            "hits": self._cache.hits,
+            "misses": self._cache.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
@@ -1,40 +1,106 @@
 """Query Vector DB (Qdrant) từ Triage BE."""
 from __future__ import annotations
 
+import base64
+import json
+import logging
+import math
+import time
+import uuid
 from typing import Any
 
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+import httpx
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Direction,
+    FieldCondition,
+    Filter,
+    HasIdCondition,
+    MatchAny,
+    MatchText,
+    MatchValue,
+    MinShould,
+    OrderBy,
+    OrderByQuery,
+    QueryRequest,
+    Range,
+)
 
+from . import metrics
 from .config import settings
+from .payload_codec import decompress_payload
+from .text_query import embed_query, query_tokens
 
+logger = logging.getLogger(__name__)
 
-def get_client() -> QdrantClient:
-    return QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port)
+# Field trả về cho search (không kèm payload gốc: lấy riêng qua get_log_payload khi cần)
+HIT_FIELDS = [
+    "order_no",
+    "order_id",
+    "trace_id",
+    "request_id",
+    "merchant_id",
+    "channel",
+    "module",
+    "operation",
+    "resp_code",
+    "status",
+    "timestamp",
+    "processing_time_ms",
+    "text",
+]
 
 
-def _scroll_filter(client: QdrantClient, must: list) -> list[dict[str, Any]]:
-    try:
-        results, _ = client.scroll(
-            collection_name=settings.qdrant_collection,
-            scroll_filter=Filter(must=must) if must else None,
-            limit=100,
-            with_payload=True,
-            with_vectors=False,
+_client: AsyncQdrantClient | None = None
+
+
+def get_client() -> AsyncQdrantClient:
+    """Client dùng chung cho cả app (tạo 1 lần, giữ connection pool keep-alive)."""
+    global _client
+    if _client is None:
+        _client = AsyncQdrantClient(
+            host=settings.qdrant_host,
+            port=settings.qdrant_port,
+            timeout=settings.qdrant_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.qdrant_max_connections,
+                max_keepalive_connections=settings.qdrant_max_connections,
+            ),
         )
-        return [dict(p.payload or {}) for p in results]
-    except Exception:
-        return []
+    return _client
 
 
-def search_logs(
-    order_no: str | None = None,
-    merchant_id: str | None = None,
-    request_id: str | None = None,
-    limit: int = 50,
-) -> list[dict[str, Any]]:
-    """Tìm logs theo order_no, merchant_id hoặc request_id."""
-    client = get_client()
+async def close_client() -> None:
+    """Đóng client dùng chung (gọi khi shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _to_hit(point: Any) -> dict[str, Any]:
+    return {"id": str(point.id), **(point.payload or {})}
+
+
+def _encode_cursor(timestamp: int, seen_ids: list[str]) -> str:
+    raw = json.dumps({"ts": timestamp, "ids": seen_ids}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[int, list[str]]:
+    """Cursor không hợp lệ → ValueError."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(data["ts"]), [str(i) for i in data["ids"]]
+    except Exception as e:
+        raise ValueError("cursor không hợp lệ") from e
+
+
+def _conditions(
+    order_no: str | None,
+    merchant_id: str | None,
+    request_id: str | None,
+) -> list:
     conditions = []
     if order_no:
         conditions.append(FieldCondition(key="order_no", match=MatchValue(value=order_no)))
@@ -42,6 +108,235 @@ def search_logs(
         conditions.append(FieldCondition(key="merchant_id", match=MatchValue(value=merchant_id)))
     if request_id:
         conditions.append(FieldCondition(key="request_id", match=MatchValue(value=request_id)))
+    return conditions
+
+
+def _time_range(from_ts: int | None, to_ts: int | None) -> list:
+    if from_ts is None and to_ts is None:
+        return []
+    return [FieldCondition(key="timestamp", range=Range(gte=from_ts, lte=to_ts))]
+
+
+async def _scroll_page(
+    client: AsyncQdrantClient,
+    must: list,
+    page_size: int,
+    cursor: str | None,
+    order: str,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """
+    Scroll 1 trang, sắp xếp theo timestamp phía Qdrant (cần range index trên timestamp).
+    Qdrant không trả next_page_offset khi dùng order_by, nên cursor = timestamp cuối + id đã trả ở timestamp đó
+    (trang sau: start_from=timestamp đó, loại các id đã thấy).
+    """
+    start_from = None
+    seen: list[str] = []
+    if cursor:
+        start_from, seen = _decode_cursor(cursor)
+    try:
+        with metrics.qdrant_timer("scroll"):
+            results, _ = await client.scroll(
+                collection_name=settings.qdrant_collection,
+                scroll_filter=Filter(must=must, must_not=[HasIdCondition(has_id=seen)] if seen else None),
+                limit=page_size + 1,
+                order_by=OrderBy(
+                    key="timestamp",
+                    direction=Direction.ASC if order == "asc" else Direction.DESC,
+                    start_from=start_from,
+                ),
+                with_payload=HIT_FIELDS,
+                with_vectors=False,
+            )
+    except Exception:
+        return [], None
+    has_more = len(results) > page_size
+    results = results[:page_size]
+    hits = [_to_hit(p) for p in results]
+    if not has_more or not results:
+        return hits, None
+    last_ts = int(results[-1].payload.get("timestamp") or 0)
+    last_ids = [str(p.id) for p in results if (p.payload or {}).get("timestamp") == last_ts]
+    if start_from == last_ts:
+        last_ids = seen + last_ids  # cả trang cùng 1 timestamp: giữ các id đã thấy từ trang trước
+    return hits, _encode_cursor(last_ts, last_ids)
+
+
+async def search_logs_page(
+    order_no: str | None = None,
+    merchant_id: str | None = None,
+    request_id: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+    page_size: int = 50,
+    cursor: str | None = None,
+    order: str = "desc",
+) -> tuple[list[dict[str, Any]], str | None]:
+    """
+    Tìm logs theo order_no, merchant_id hoặc request_id trong khoảng [from_ts, to_ts] (ms),
+    sắp xếp theo timestamp. Trả về (logs, next_cursor); next_cursor=None khi hết.
+    """
+    conditions = _conditions(order_no, merchant_id, request_id)
     if not conditions:
+        return [], None
+    return await _scroll_page(get_client(), conditions + _time_range(from_ts, to_ts), page_size, cursor, order)
+
+
+async def search_logs(
+    order_no: str | None = None,
+    merchant_id: str | None = None,
+    request_id: str | None = None,
+    limit: int = 50,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+) -> list[dict[str, Any]]:
+    """Tìm logs theo order_no, merchant_id hoặc request_id (trang đầu, mới nhất trước)."""
+    hits, _ = await search_logs_page(
+        order_no=order_no,
+        merchant_id=merchant_id,
+        request_id=request_id,
+        from_ts=from_ts,
+        to_ts=to_ts,
+        page_size=limit,
+    )
+    return hits
+
+
+async def search_text(
+    text: str,
+    merchant_id: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+    limit: int = 50,
+) -> list[dict[str, Any]]:
+    """
+    Tìm log theo đoạn text (log_snippet / error_message): lọc full-text index `text` — log phải chứa ít nhất
+    TEXT_SEARCH_MIN_MATCH token của query — trong khoảng thời gian (mặc định TEXT_SEARCH_WINDOW_H giờ gần nhất),
+    xếp hạng theo cosine giữa embedding query và log (`score`), giống nhất trước.
+    """
+    tokens = query_tokens(text)
+    if not tokens:
+        return []
+    if from_ts is None and to_ts is None:
+        to_ts = int(time.time() * 1000)
+        from_ts = to_ts - settings.text_search_window_h * 3_600_000
+    must = _conditions(None, merchant_id, None) + _time_range(from_ts, to_ts)
+    matches = [FieldCondition(key="text", match=MatchText(text=t)) for t in tokens]
+    need = max(1, math.ceil(len(tokens) * settings.text_search_min_match))
+    if need >= len(matches):
+        query_filter = Filter(must=must + matches)
+    else:
+        query_filter = Filter(must=must, min_should=MinShould(conditions=matches, min_count=need))
+    vector = embed_query(text)
+    try:
+        with metrics.qdrant_timer("query_text"):
+            response = await get_client().query_points(
+                collection_name=settings.qdrant_collection,
+                query=vector if vector is not None else OrderByQuery(order_by=OrderBy(key="timestamp", direction=Direction.DESC)),
+                query_filter=query_filter,
+                limit=limit,
+                with_payload=HIT_FIELDS,
+                with_vectors=False,
+            )
+    except Exception:
         return []
-    return _scroll_filter(client, conditions)[:limit]
+    hits = []
+    for point in response.points:
+        hit = _to_hit(point)
+        if vector is not None:
+            hit["score"] = round(point.score, 4)
+        hits.append(hit)
+    return hits
+
+
+# Field id dùng để nối các log của cùng 1 giao dịch giữa các module
+TRACE_ID_FIELDS = ("order_no", "order_id", "trace_id", "request_id")
+
+
+async def expand_related_logs(
+    seeds: dict[str, str],
+    merchant_id: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+) -> tuple[list[dict[str, Any]], dict[str, list[str]], int, str | None]:
+    """
+    Từ 1 hoặc vài id (order_no/order_id/trace_id/request_id) gom tất cả log liên quan: mỗi vòng gửi 1 batch
+    query (mỗi field 1 request MatchAny trên toàn bộ id đã biết, vì traceId của module này có thể là
+    requestId của module khác), lấy thêm id mới từ kết quả, lặp tới khi không có id mới hoặc hết
+    TRACE_EXPAND_MAX_HOPS. Trả về (logs theo timestamp tăng dần, id liên quan theo field, số round trip,
+    lý do kết quả chưa đủ hoặc None): "max_hops" (còn id chưa query), "limit" (1 query trả đủ TRACE_EXPAND_LIMIT log),
+    "qdrant_error: ..." (vòng sau lỗi; lỗi ngay vòng đầu thì raise).
+    """
+    known: set[str] = {v for v in seeds.values() if v}
+    if not known:
+        return [], {}, 0, None
+    related: dict[str, set[str]] = {f: set() for f in TRACE_ID_FIELDS}
+    for field, value in seeds.items():
+        if value and field in related:
+            related[field].add(value)
+    extra = _conditions(None, merchant_id, None) + _time_range(from_ts, to_ts)
+    client = get_client()
+    points: dict[str, dict[str, Any]] = {}
+    queried: set[str] = set()
+    round_trips = 0
+    truncated: str | None = None
+    while known - queried:
+        if round_trips >= settings.trace_expand_max_hops:
+            truncated = "max_hops"
+            break
+        # Chỉ query id mới: log của id đã query ở vòng trước đã có trong `points`
+        values = sorted(known - queried)[: settings.trace_expand_max_ids]
+        requests = [
+            QueryRequest(
+                filter=Filter(must=[FieldCondition(key=field, match=MatchAny(any=values)), *extra]),
+                query=OrderByQuery(order_by=OrderBy(key="timestamp", direction=Direction.ASC)),
+                limit=settings.trace_expand_limit,
+                with_payload=HIT_FIELDS,
+                with_vector=False,
+            )
+            for field in TRACE_ID_FIELDS
+        ]
+        try:
+            with metrics.qdrant_timer("query_batch"):
+                responses = await client.query_batch_points(collection_name=settings.qdrant_collection, requests=requests)
+        except Exception as e:
+            if not round_trips:
+                raise
+            logger.warning("Expand dừng sau %d vòng do lỗi Qdrant, kết quả chưa đủ: %s", round_trips, e)
+            truncated = f"qdrant_error: {e}"
+            break
+        round_trips += 1
+        queried.update(values)
+        for response in responses:
+            if len(response.points) >= settings.trace_expand_limit and truncated is None:
+                truncated = "limit"
+            for point in response.points:
+                hit = points.setdefault(str(point.id), _to_hit(point))
+                for field in TRACE_ID_FIELDS:
+                    value = hit.get(field)
+                    if value:
+                        related[field].add(str(value))
+                        known.add(str(value))
+    logs = sorted(points.values(), key=lambda h: (h.get("timestamp") or 0, h["id"]))
+    return logs, {f: sorted(v) for f, v in related.items() if v}, round_trips, truncated
+
+
+async def get_log_payload(log_id: str) -> str | None:
+    """
+    Lấy payload gốc (JSON string) của 1 log theo point id, giải nén nếu cần. None nếu không có.
+    ValueError nếu id không phải UUID (point id của log luôn là UUID; Qdrant server trả lỗi 400 thay vì rỗng),
+    PayloadDecodeError nếu payload đã lưu không giải nén được.
+    """
+    log_id = str(uuid.UUID(log_id))
+    with metrics.qdrant_timer("retrieve"):
+        points = await get_client().retrieve(
+            collection_name=settings.qdrant_collection,
+            ids=[log_id],
+            with_payload=["payload", "payload_z", "payload_codec"],
+            with_vectors=False,
+        )
+    if not points:
+        return None
+    data = points[0].payload or {}
+    if data.get("payload_z"):
+        return decompress_payload(data.get("payload_codec") or "zlib", data["payload_z"])
+    return data.get("payload")
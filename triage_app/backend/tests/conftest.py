@@ -0,0 +1,14 @@
+"""
+Test chạy được từ thư mục service hoặc từ root repo: Log Consumer cũng có package `app`, nên bỏ `app` đã import
+(nếu có) và đặt thư mục service lên đầu sys.path trước khi collect test của thư mục này.
+"""
+import sys
+from pathlib import Path
+
+SERVICE_DIR = str(Path(__file__).resolve().parent.parent)
+
+for name in [m for m in sys.modules if m == "app" or m.startswith("app.")]:
+    del sys.modules[name]
+if SERVICE_DIR in sys.path:
+    sys.path.remove(SERVICE_DIR)
+sys.path.insert(0, SERVICE_DIR)
@@ -0,0 +1,21 @@
+import pytest
+
+from app.vector_client import _decode_cursor, _encode_cursor
+
+
+def test_cursor_round_trip():
+    ids = ["3f2504e0-4f89-11d3-9a0c-0305e82c3301", "7c9e6679-7425-40de-944b-e07fc1f90ae7"]
+    cursor = _encode_cursor(1_700_000_000_123, ids)
+    assert _decode_cursor(cursor) == (1_700_000_000_123, ids)
+    assert _decode_cursor(_encode_cursor(0, [])) == (0, [])
+
+
+def test_cursor_is_url_safe():
+    cursor = _encode_cursor(2**40, ["?&/+=" * 10])
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "e30=", "eyJ0cyI6ICJ4In0="])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        _decode_cursor(cursor)
@@ -0,0 +1,50 @@
+from app.llm import build_context
+
+
+def _log(i: int, operation: str, resp_code: str = "00", ms: int = 100, text: str = "") -> dict:
+    return {
+        "id": f"id-{i}",
+        "module": "gateway",
+        "operation": operation,
+        "resp_code": resp_code,
+        "status": "SUCCESS" if resp_code == "00" else "FAILED",
+        "timestamp": 1_000 + i,
+        "processing_time_ms": ms,
+        "order_no": f"O{i}",
+        "text": text or f"operation={operation} respCode={resp_code}",
+    }
+
+
+def test_duplicates_grouped_with_count_in_timestamp_order():
+    logs = [_log(2, "/b"), _log(0, "/a"), _log(1, "/a"), _log(3, "/a")]
+    context, tokens = build_context(logs, None, None, max_tokens=2000)
+    assert "4 log, 2 nhóm" in context
+    assert "x3 ts=1000..1003 module=gateway operation=/a" in context
+    assert context.index("operation=/a") < context.index("operation=/b")  # Nhóm /a có log sớm nhất
+    assert tokens > 0 and "lược bỏ" not in context
+
+
+def test_budget_keeps_errors_first_and_reports_omitted():
+    logs = [_log(i, f"/ok{i}", text="ok " * 30) for i in range(40)]
+    logs.append(_log(100, "/pay", resp_code="E51", text="Partner timeout after 30000ms"))
+    logs.append(_log(101, "/slow", ms=9_000))
+    context, tokens = build_context(logs, None, None, max_tokens=250)
+    assert tokens <= 250
+    assert "operation=/pay resp_code=E51" in context and "[ERROR]" in context
+    assert "Partner timeout after 30000ms" in context  # Nhóm lỗi kèm text mẫu
+    assert "operation=/slow" in context  # Nhóm chậm ưu tiên hơn nhóm bình thường
+    assert "nhóm log khác bị lược bỏ" in context
+
+
+def test_snippet_and_error_message_always_included():
+    logs = [_log(i, f"/op{i}") for i in range(50)]
+    context, _ = build_context(logs, "callback 504 from partner", "Giao dịch thất bại", max_tokens=60)
+    assert "## Log snippet / mô tả từ user\ncallback 504 from partner" in context
+    assert context.endswith("## Error message\nGiao dịch thất bại")
+
+
+def test_slowest_log_is_group_sample():
+    logs = [_log(0, "/a", ms=10, text="fast"), _log(1, "/a", ms=5_000, text="slowest"), _log(2, "/a", ms=20, text="mid")]
+    context, _ = build_context(logs, None, None, max_tokens=2000)
+    assert "max_processing_ms=5000 order_no=O1" in context
+    assert "slowest" in context and "fast" not in context
@@ -0,0 +1,41 @@
+from app.timeline import build_timeline
+
+
+def test_gap_span_and_slowest():
+    logs = [
+        {"id": "a", "timestamp": 1_000, "processing_time_ms": 200},
+        {"id": "b", "timestamp": 1_250, "processing_time_ms": 500},
+        {"id": "c", "timestamp": 1_700, "processing_time_ms": 100},  # Bắt đầu trước khi b kết thúc (chồng nhau)
+    ]
+    result = build_timeline(logs)
+    assert [e["gap_ms"] for e in result["entries"]] == [None, 50, -50]
+    assert result["span_ms"] == 800
+    assert result["total_processing_ms"] == 800
+    assert result["slowest_id"] == "b"
+
+
+def test_overlapping_step_does_not_move_end_backwards():
+    logs = [
+        {"id": "a", "timestamp": 0, "processing_time_ms": 1_000},
+        {"id": "b", "timestamp": 100, "processing_time_ms": 50},
+        {"id": "c", "timestamp": 1_200, "processing_time_ms": 10},
+    ]
+    result = build_timeline(logs)
+    assert [e["gap_ms"] for e in result["entries"]] == [None, -900, 200]
+    assert result["span_ms"] == 1_210
+
+
+def test_missing_timestamp_and_latency():
+    logs = [
+        {"id": "a", "timestamp": 1_000},
+        {"id": "b", "processing_time_ms": None},
+        {"id": "c", "timestamp": 1_500, "processing_time_ms": 20},
+    ]
+    result = build_timeline(logs)
+    assert [e["gap_ms"] for e in result["entries"]] == [None, None, 500]
+    assert result["span_ms"] == 520
+    assert result["slowest_id"] == "c"
+
+
+def test_empty():
+    assert build_timeline([]) == {"entries": [], "span_ms": 0, "total_processing_ms": 0, "slowest_id": None}
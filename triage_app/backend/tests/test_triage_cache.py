@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from app.triage_cache import TriageCache, TTLCache, triage_fingerprint
+
+
+def test_ttl_cache_expiry_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.triage_cache.time.monotonic", lambda: now[0])
+    cache: TTLCache[int] = TTLCache(max_entries=2, ttl_s=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" mới dùng → "b" bị đẩy ra khi thêm "c"
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("c") == 3
+    now[0] += 11
+    assert cache.get("a") is None and len(cache) == 1
+
+
+def test_fingerprint_ignores_log_order():
+    logs = [{"id": "1"}, {"id": "2"}]
+    assert triage_fingerprint(logs, "s", None) == triage_fingerprint(logs[::-1], "s", None)
+    assert triage_fingerprint(logs, "s", None) != triage_fingerprint(logs, "s2", None)
+    assert triage_fingerprint(logs, "s", None) != triage_fingerprint(logs + [{"id": "3"}], "s", None)
+
+
+def test_fingerprint_keyed_on_use_memory():
+    logs = [{"id": "1"}]
+    assert triage_fingerprint(logs, None, "e", use_memory=True) != triage_fingerprint(logs, None, "e", use_memory=False)
+
+
+def test_single_flight_calls_compute_once():
+    async def run():
+        cache: TriageCache[str] = TriageCache(max_entries=10, ttl_s=60)
+        calls = 0
+
+        async def compute() -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(cache.get_or_compute("order:1", "fp", compute) for _ in range(5)))
+        assert calls == 1
+        assert [r for r, _ in results] == ["result"] * 5
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+        assert await cache.get_or_compute("order:1", "fp", compute) == ("result", True)
+        assert calls == 1 and cache.stats()["coalesced"] == 4
+
+    asyncio.run(run())
+
+
+def test_error_is_shared_and_not_cached():
+    async def run():
+        cache: TriageCache[str] = TriageCache(max_entries=10, ttl_s=60)
+        calls = 0
+
+        async def compute() -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("LLM down")
+
+        results = await asyncio.gather(
+            *(cache.get_or_compute("order:1", "fp", compute) for _ in range(3)), return_exceptions=True
+        )
+        assert calls == 1 and all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("order:1", "fp", compute)
+        assert calls == 2
+
+    asyncio.run(run())
+
+
+def test_uncacheable_result_is_recomputed():
+    async def run():
+        cache: TriageCache[str] = TriageCache(max_entries=10, ttl_s=60)
+        calls = 0
+
+        async def compute() -> str:
+            nonlocal calls
+            calls += 1
+            return "Lỗi gọi LLM"
+
+        for _ in range(2):
+            assert await cache.get_or_compute("q", "fp", compute, cacheable=lambda r: not r.startswith("Lỗi")) == (
+                "Lỗi gọi LLM",
+                False,
+            )
+        assert calls == 2
+
+    asyncio.run(run())
+
+
+def test_new_logs_invalidate_previous_entry():
+    async def run():
+        cache: TriageCache[str] = TriageCache(max_entries=10, ttl_s=60)
+
+        async def compute() -> str:
+            return "result"
+
+        await cache.get_or_compute("order:1", "fp-old", compute)
+        await cache.get_or_compute("order:1", "fp-new", compute)  # Có log mới → fingerprint đổi
+        assert cache.stats()["entries"] == 1
+        assert await cache.get_or_compute("order:1", "fp-old", compute) == ("result", False)
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_lets_follower_recompute():
+    async def run():
+        cache: TriageCache[str] = TriageCache(max_entries=10, ttl_s=60)
+        started = asyncio.Event()
+
+        async def slow() -> str:
+            started.set()
+            await asyncio.sleep(10)
+            return "never"
+
+        async def fast() -> str:
+            return "follower"
+
+        leader = asyncio.create_task(cache.get_or_compute("q", "fp", slow))
+        await started.wait()
+        follower = asyncio.create_task(cache.get_or_compute("q", "fp", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("follower", False)
+        assert leader.cancelled()
+
+    asyncio.run(run())
@@ -1,18 +1,37 @@
 "use client";
 
 import { useState } from "react";
-import { searchLogs, triageIncident } from "@/lib/api";
+import { fetchLogPayload, searchLogs, triageIncidentStream } from "@/lib/api";
 import type { SearchResponse, TriageResponse, LogHit, TriageResult } from "@/lib/api";
 
 function LogItem({ h }: { h: LogHit }) {
   const meta = [h.module, h.operation, h.resp_code, h.status].filter(Boolean).join(" · ");
+  const [payload, setPayload] = useState<string | null>(h.payload ?? null);
+  const [payloadError, setPayloadError] = useState<string | null>(null);
+
+  async function loadPayload() {
+    if (!h.id) return;
+    try {
+      setPayload(await fetchLogPayload(h.id));
+    } catch (e) {
+      setPayloadError(e instanceof Error ? e.message : String(e));
+    }
+  }
+
   return (
     <div className="rounded-lg border border-border bg-bg p-3 text-sm mb-2">
       <div className="text-accent mb-1">{meta}</div>
       <div className="text-muted break-all">{(h.text ?? "").slice(0, 300)}</div>
-      {h.payload && (
-        <pre className="mt-2 overflow-x-auto text-xs">{h.payload.slice(0, 500)}</pre>
+      {payload ? (
+        <pre className="mt-2 overflow-x-auto text-xs">{payload}</pre>
+      ) : (
+        h.id && (
+          <button type="button" onClick={loadPayload} className="mt-2 text-xs text-accent underline">
+            Xem payload
+          </button>
+        )
       )}
+      {payloadError && <div className="mt-1 text-xs text-warning">{payloadError}</div>}
     </div>
   );
 }
@@ -65,6 +84,7 @@ export default function Home() {
   const [searchResult, setSearchResult] = useState<SearchResponse | null>(null);
   const [triageResult, setTriageResult] = useState<TriageResponse | null>(null);
   const [resultMode, setResultMode] = useState<"search" | "triage" | null>(null);
+  const [llmStream, setLlmStream] = useState("");
 
   const body = () => {
     const b: Record<string, string> = {};
@@ -107,8 +127,17 @@ export default function Home() {
     setError(null);
     setLoading("triage");
     setSearchResult(null);
+    setTriageResult(null);
+    setLlmStream("");
     try {
-      const data = await triageIncident(body());
+      const data = await triageIncidentStream(body(), {
+        // Hiển thị logs ngay khi query Vector DB xong, rồi nội dung LLM đang sinh
+        onLogs: (logs) => {
+          setTriageResult({ ...logs, triage: null });
+          setResultMode("triage");
+        },
+        onToken: (text) => setLlmStream((prev) => prev + text),
+      });
       setTriageResult(data);
       setResultMode("triage");
     } catch (e) {
@@ -216,7 +245,13 @@ export default function Home() {
           <p className="mb-4">
             Đã tìm thấy <strong>{triageResult.logs_found}</strong> log(s).
           </p>
-          {triageResult.triage && <TriageBox t={triageResult.triage} />}
+          {triageResult.triage ? (
+            <TriageBox t={triageResult.triage} />
+          ) : (
+            llmStream && (
+              <pre className="text-sm whitespace-pre-wrap text-muted">{llmStream}</pre>
+            )
+          )}
           {triageResult.logs_preview?.length > 0 && (
             <>
               <h3 className="text-muted text-sm mt-6 mb-2">Logs preview</h3>
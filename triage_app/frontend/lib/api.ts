@@ -5,11 +5,19 @@ export type TriageRequest = {
   order_id?: string;
   merchant_id?: string;
   request_id?: string;
+  trace_id?: string;
+  expand?: boolean;
   log_snippet?: string;
   error_message?: string;
+  from_ts?: number;
+  to_ts?: number;
+  page_size?: number;
+  cursor?: string;
+  order?: "asc" | "desc";
 };
 
 export type LogHit = {
+  id?: string;
   order_no?: string;
   merchant_id?: string;
   module?: string;
@@ -33,6 +41,7 @@ export type SearchResponse = {
   query: Record<string, unknown>;
   hits: LogHit[];
   total: number;
+  next_cursor?: string | null;
 };
 
 export type TriageResponse = {
@@ -41,6 +50,32 @@ export type TriageResponse = {
   logs_preview: LogHit[];
   triage: TriageResult | null;
   raw_llm?: string;
+  context_tokens?: number;
+  cached?: boolean;
+};
+
+export type TimelineEntry = LogHit & {
+  order_id?: string;
+  trace_id?: string;
+  request_id?: string;
+  processing_time_ms?: number;
+  gap_ms?: number | null;
+};
+
+export type TimelineResponse = {
+  query: Record<string, unknown>;
+  related_ids: Record<string, string[]>;
+  round_trips: number;
+  total: number;
+  span_ms: number;
+  total_processing_ms: number;
+  slowest_id?: string | null;
+  entries: TimelineEntry[];
+};
+
+export type TriageStreamHandlers = {
+  onLogs?: (data: Pick<TriageResponse, "query" | "logs_found" | "logs_preview">) => void;
+  onToken?: (text: string) => void;
 };
 
 export async function searchLogs(body: TriageRequest): Promise<SearchResponse> {
@@ -64,3 +99,60 @@ export async function triageIncident(body: TriageRequest): Promise<TriageRespons
   if (!res.ok) throw new Error(data.detail ?? res.statusText);
   return data;
 }
+
+export async function fetchTimeline(body: TriageRequest): Promise<TimelineResponse> {
+  const res = await fetch(`${API_URL}/timeline`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  const data = await res.json();
+  if (!res.ok) throw new Error(data.detail ?? res.statusText);
+  return data;
+}
+
+/** POST /triage/stream (SSE): logs trước, token LLM, cuối cùng trả về kết quả như /triage. */
+export async function triageIncidentStream(
+  body: TriageRequest,
+  handlers: TriageStreamHandlers = {},
+): Promise<TriageResponse> {
+  const res = await fetch(`${API_URL}/triage/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok || !res.body) {
+    const data = await res.json().catch(() => ({}));
+    throw new Error(data.detail ?? res.statusText);
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  let result: TriageResponse | null = null;
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep: number;
+    while ((sep = buf.indexOf("\n\n")) !== -1) {
+      const block = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      const event = block.match(/^event: (.*)$/m)?.[1];
+      const data = block.match(/^data: (.*)$/m)?.[1];
+      if (!event || data === undefined) continue;
+      const parsed = JSON.parse(data);
+      if (event === "logs") handlers.onLogs?.(parsed);
+      else if (event === "token") handlers.onToken?.(parsed.text);
+      else if (event === "result") result = parsed;
+    }
+  }
+  if (!result) throw new Error("Stream triage kết thúc mà không có kết quả");
+  return result;
+}
+
+export async function fetchLogPayload(id: string): Promise<string> {
+  const res = await fetch(`${API_URL}/logs/${encodeURIComponent(id)}/payload`);
+  const text = await res.text();
+  if (!res.ok) throw new Error(text || res.statusText);
+  return text;
+}